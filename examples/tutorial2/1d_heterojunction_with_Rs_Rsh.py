@@ -3,6 +3,10 @@ import numpy as np
 from scipy.interpolate import interp1d
 from scipy.optimize import minimize
 
+# The resistances can also be applied during the simulation, which gives the
+# exact external current at each voltage:
+#     j = sesame.IVcurve(sys, voltages, '1dhetero_V', Rs=Rs, Rsh=Rsh)
+
 # define contact and shunt resistance-area values (note units)
 Rs = 3  # Ohm-cm^2
 Rsh = 500  # Ohm-cm^2
@@ -16,7 +16,8 @@ for module in __all__:
     exec('from . import {0}'.format(module))
 
 available = [('builder', ['Scaling', 'Builder']),
-             ('solvers', ['solve', 'IVcurve']),
+             ('solvers', ['solve', 'IVcurve', 'solve_batch', 'generation_ramp',
+                          'figures_of_merit']),
              ('analyzer', ['Analyzer'])]
 for module, names in available:
     exec('from .{0} import {1}'.format(module, ', '.join(names)))
@@ -189,6 +189,23 @@ class Builder():
 
         self.defects_list = []
 
+    def __getstate__(self):
+        # the stencil plan only depends on the mesh, the coefficients and the
+        # compiled defects on the material parameters and the defects, they
+        # are rebuilt on demand and not saved with the system
+        state = self.__dict__.copy()
+        state.pop('_plan', None)
+        state.pop('_coefficients', None)
+        state.pop('_defects_quadrature', None)
+        state.pop('_defects_table', None)
+        return state
+
+    def _clear_cache(self):
+        # discard the coefficients and compiled defects computed by the
+        # kernels, after a modification of the system
+        self.__dict__.pop('_coefficients', None)
+        self.__dict__.pop('_defects_table', None)
+
     def add_material(self, mat, location=lambda pos: True):
         """
         Add a material to the system.
@@ -265,6 +282,8 @@ class Builder():
 
         self.ni = np.sqrt(self.Nc * self.Nv) * np.exp(-self.Eg/2)
 
+        self._clear_cache()
+
     def add_defects(self, location, N, sigma_e, sigma_h=None, E=None,
                     transition=(1,-1)):
         """
@@ -280,7 +299,9 @@ class Builder():
             Defect density of states [cm\ :sup:`-2` ]. Provide a float when the
             defect density of states is a delta function, or a function
             returning a float for a continuum. This function should take a
-            single energy argument in [eV].
+            single energy argument in [eV]. It is called with an array of
+            energies when it supports it, to compute the integrals over the gap
+            at once.
         sigma_e: float
             Electron capture cross section [cm\ :sup:`2`].
         sigma_h: float (optional)
@@ -324,10 +345,12 @@ class Builder():
 
         params = defect(s, location, f, E, sigma_e, sigma_h, transition, dl)
         self.defects_list.append(params)
+        self._clear_cache()
 
     def doping_profile(self, density, location):
         s, _ = get_sites(self, location)
         self.rho[s] = self.rho[s] + density / self.scaling.density
+        self._clear_cache()
 
     def add_donor(self, density, location=lambda pos: True):
         """
@@ -425,6 +448,7 @@ class Builder():
                     Scn_right / self.scaling.velocity]
         self.Scp = [Scp_left / self.scaling.velocity, 
                     Scp_right / self.scaling.velocity]
+        self._clear_cache()
 
     def contact_type(self, left_contact, right_contact, left_wf=None, right_wf=None):
         """
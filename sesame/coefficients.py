@@ -0,0 +1,124 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import numpy as np
+
+from .stencil import get_plan
+
+
+class Coefficients():
+    """
+    Coefficients of the discretized equations that only depend on the material
+    parameters and the mesh of a system. They are computed once per system and
+    read by the kernels at every Newton step, see :func:`get_coefficients`.
+
+    The carrier densities read n = exp(v + efn + vn) and p = exp(-v - efp - vp).
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    plan: StencilPlan
+        Stencil plan of the system.
+
+    Attributes
+    ----------
+    vn: numpy array of floats
+        bl + log(Nc) on all sites.
+    vp: numpy array of floats
+        bl + Eg - log(Nv) on all sites.
+    ni2: numpy array of floats
+        Squared intrinsic density on all sites.
+    eps_m1x, eps_p1x, eps_m1y, eps_p1y: numpy arrays of floats
+        Permittivity between the inner sites and their neighbors at s-1, s+1,
+        s-Nx and s+Nx.
+    """
+
+    def __init__(self, sys, plan):
+        self.plan = plan
+        self.vn = sys.bl + np.log(sys.Nc)
+        self.vp = sys.bl + sys.Eg - np.log(sys.Nv)
+        self.ni2 = sys.ni**2
+
+        eps, sites = sys.epsilon, plan.sites
+        self.eps_m1x = .5 * (eps[plan.sm1] + eps[sites])
+        self.eps_p1x = .5 * (eps[plan.sp1] + eps[sites])
+        self.eps_m1y = .5 * (eps[plan.smN] + eps[sites])
+        self.eps_p1y = .5 * (eps[plan.spN] + eps[sites])
+
+        self._veq = None
+
+    def densities(self, v, efn, efp, workspace=None):
+        """
+        Return the carrier densities n = exp(efn + v + vn) and
+        p = exp(-efp - v - vp).
+
+        Parameters
+        ----------
+        v, efn, efp: numpy arrays of floats
+            Electrostatic potential and quasi-Fermi levels.
+        workspace: Workspace
+            Buffers receiving the densities. New arrays are returned by
+            default.
+
+        Returns
+        -------
+        n, p: numpy arrays of floats
+        """
+        shape = np.broadcast(efn, v, self.vn).shape
+        n = None if workspace is None else workspace.empty('n', shape)
+        p = None if workspace is None else workspace.empty('p', shape)
+        n = np.add(efn, v, out=n)
+        n += self.vn
+        np.exp(n, out=n)
+        p = np.add(efp, v, out=p)
+        p += self.vp
+        np.negative(p, out=p)
+        np.exp(p, out=p)
+        return n, p
+
+    def equilibrium(self, veq):
+        """
+        Return the carrier densities at thermal equilibrium, computed once per
+        equilibrium potential.
+
+        Parameters
+        ----------
+        veq: numpy array of floats
+            Electrostatic potential at thermal equilibrium.
+
+        Returns
+        -------
+        n_eq, p_eq: numpy arrays of floats
+        """
+        if self._veq is None or not np.array_equal(self._veq, veq):
+            self._veq = np.copy(veq)
+            self.n_eq = np.exp(self.vn + veq)
+            self.p_eq = np.exp(-self.vp - veq)
+        return self.n_eq, self.p_eq
+
+
+def get_coefficients(sys):
+    """
+    Return the coefficients of the equations of a system, computing them if
+    the system has none yet or if its mesh has changed. The Builder discards
+    them when its material parameters are modified.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+
+    Returns
+    -------
+    coefficients: Coefficients
+    """
+    plan = get_plan(sys)
+    coefficients = getattr(sys, '_coefficients', None)
+    if coefficients is None or coefficients.plan is not plan:
+        coefficients = Coefficients(sys, plan)
+        sys._coefficients = coefficients
+    return coefficients
+
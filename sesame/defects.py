@@ -9,14 +9,226 @@ from scipy.integrate import quad
 from scipy.constants import m_e, epsilon_0
 from math import exp
 
+# Integrals over the gap of the continuum defects (energy E=None) are computed
+# with a composite Gauss-Legendre rule on [-Eg/2, Eg/2]: the gap is split into
+# an even number of panels, so that a kink of the density of states at midgap
+# falls on a panel edge. The nodes and the density of states at the nodes are
+# computed once per defect and cached on the system.
+quadrature_panels = 16
+quadrature_order = 8
+
+
+def _quadrature_rule():
+    # nodes and weights of the composite rule on [-1, 1]
+    t, w = np.polynomial.legendre.leggauss(quadrature_order)
+    edges = np.linspace(-1, 1, quadrature_panels + 1)
+    half = (edges[1] - edges[0]) / 2
+    nodes = ((edges[:-1] + edges[1:]) / 2)[:, None] + half * t[None, :]
+    weights = np.tile(half * w, quadrature_panels)
+    return nodes.ravel(), weights
+
+
+def _quadrature(sys, defect):
+    # Energies and weights (including the density of states divided by the
+    # lattice distance perpendicular to the defect) of the quadrature at the
+    # sites of a continuum defect, arrays of shape (number of sites, number of
+    # nodes).
+    cache = sys.__dict__.setdefault('_defects_quadrature', {})
+    Eg = sys.Eg[defect.sites]
+    key = id(defect)
+    if key in cache and cache[key][0] is defect and np.array_equal(cache[key][1], Eg):
+        return cache[key][2:]
+
+    nodes, weights = _quadrature_rule()
+    E = Eg[:, None] / 2. * nodes[None, :]
+    W = Eg[:, None] / 2. * weights[None, :] / np.reshape(defect.perp_dl, (-1, 1))
+    N = defect.dos
+    if callable(N):
+        try:
+            dos = np.broadcast_to(N(E), E.shape)
+        except Exception:
+            # the density of states only accepts floats
+            dos = np.vectorize(N, otypes=[float])(E)
+        W = W * dos
+    else:
+        W = W * N
+
+    cache[key] = (defect, Eg, E, W)
+    return E, W
+
+
+def _thermal_velocity(sys):
+    # thermal velocities are ct * sqrt(3 / mass)
+    if sys.input_length=='m':
+        return np.sqrt(epsilon_0/sys.scaling.density)/sys.scaling.mobility
+    else:
+        return 100*np.sqrt(epsilon_0*1e-2 / sys.scaling.density) / sys.scaling.mobility
+
+
+class DefectsTable():
+    """
+    Defects of a system compiled into flat arrays (struct of arrays), with one
+    entry per defect level at a site: a discrete level is a single entry, a
+    continuum of states gives one entry per node of the quadrature over the
+    gap. The factors which do not depend on the carrier densities are computed
+    once, so that the charge and recombination of all the defects are computed
+    in a single vectorized pass and summed per site.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    defects_list: list of named tuples
+        Defects of the system.
+
+    Attributes
+    ----------
+    sites: numpy array of integers
+        Sites with at least one defect.
+    index: numpy array of integers
+        Index in sites of the site of each entry.
+    weight: numpy array of floats
+        Density of states of each entry divided by the lattice distance
+        perpendicular to the defect (times the quadrature weight for a
+        continuum).
+    n1, p1: numpy arrays of floats
+        Carrier densities of each entry when the Fermi level is at the energy
+        of the level.
+    ve, vh: numpy arrays of floats
+        Capture cross sections times thermal velocities of each entry.
+    a, b: numpy arrays of floats
+        Charges of the level when empty (a) and occupied (b) by an electron.
+    """
 
-def defectsF(sys, defects_list, n, p, rho, r=None):
+    def __init__(self, sys, defects_list):
+        ct = _thermal_velocity(sys)
+        columns = {name: [] for name in ('site', 'weight', 'E', 've', 'vh', 'a', 'b')}
+        for defect in defects_list:
+            sites = np.asarray(defect.sites, dtype=int).ravel()
+            if defect.energy is not None:
+                E = np.full((len(sites), 1), defect.energy)
+                W = np.reshape(defect.dos / np.asarray(defect.perp_dl, dtype=float), (-1, 1))
+                W = np.broadcast_to(W, E.shape)
+            else:
+                E, W = _quadrature(sys, defect)
+            shape = E.shape
+            ve = ct * np.sqrt(3/(sys.mass_e[sites]*m_e))
+            vh = ct * np.sqrt(3/(sys.mass_h[sites]*m_e))
+            columns['site'].append(np.broadcast_to(sites[:, None], shape).ravel())
+            columns['weight'].append(np.ravel(W))
+            columns['E'].append(np.ravel(E))
+            columns['ve'].append(np.broadcast_to(defect.sigma_e*ve[:, None], shape).ravel())
+            columns['vh'].append(np.broadcast_to(defect.sigma_h*vh[:, None], shape).ravel())
+            columns['a'].append(np.full(E.size, max(defect.transition), dtype=float))
+            columns['b'].append(np.full(E.size, min(defect.transition), dtype=float))
+
+        site = np.concatenate(columns['site']) if defects_list else np.zeros((0,), dtype=int)
+        self.sites, self.index = np.unique(site, return_inverse=True)
+        self.index = self.index.ravel()
+        for name in ('weight', 've', 'vh', 'a', 'b'):
+            setattr(self, name, np.concatenate(columns[name]) if defects_list else np.zeros((0,)))
+        E = np.concatenate(columns['E']) if defects_list else np.zeros((0,))
+
+        self.n1 = np.sqrt(sys.Nc[site]*sys.Nv[site]) * np.exp(-sys.Eg[site]/2 + E)
+        self.p1 = np.sqrt(sys.Nc[site]*sys.Nv[site]) * np.exp(-sys.Eg[site]/2 - E)
+        self.ni2 = sys.ni[self.sites]**2
+
+    def _sum(self, values):
+        # sum of the values of the entries at each site
+        return np.bincount(self.index, weights=values, minlength=len(self.sites))
+
+    def _densities(self, n, p):
+        # carrier densities at the site of each entry
+        _n = n[self.sites][self.index]
+        _p = p[self.sites][self.index]
+        ni2 = self.ni2[self.index]
+        return _n, _p, _n * _p, ni2
+
+    def charge(self, n, p, rho, r=None):
+        """
+        Add the charge and recombination of the defects, see defectsF.
+        """
+        if len(self.sites) == 0:
+            return
+        _n, _p, _np, ni2 = self._densities(n, p)
+        n1, p1, ve, vh, W = self.n1, self.p1, self.ve, self.vh, self.weight
+
+        # additional charge
+        f = (ve*_n + vh*p1) / (ve*(_n+n1) + vh*(_p+p1))
+        rho[self.sites] += self._sum(W * (self.a + (self.b-self.a)*f))
+
+        # additional recombination
+        if r is not None:
+            r[self.sites] += self._sum(W * (_np - ni2) / ((_n+n1)/vh + (_p+p1)/ve))
+
+    def derivatives(self, n, p, drho_dv, drho_defn=None, drho_defp=None,
+                    dr_defn=None, dr_defp=None, dr_dv=None):
+        """
+        Add the derivatives of the charge and recombination of the defects,
+        see defectsJ.
+        """
+        if len(self.sites) == 0:
+            return
+        _n, _p, _np, ni2 = self._densities(n, p)
+        n1, p1, ve, vh, W = self.n1, self.p1, self.ve, self.vh, self.weight
+        s = self.sites
+
+        # derivatives of the charge
+        Wd = W * (self.b - self.a) / (ve*(_n+n1) + vh*(_p+p1))**2
+        drho_dv[s] += self._sum(Wd * (ve**2*_n*n1 + 2*vh*ve*_np + vh**2*_p*p1))
+        if drho_defn is not None:
+            drho_defn[s] += self._sum(Wd * ve*_n * (ve*n1 + vh*_p))
+            drho_defp[s] += self._sum(Wd * (ve*_n + vh*p1) * vh*_p)
+
+        # derivatives of the recombination
+        if dr_defn is not None:
+            d = (_n+n1)/vh + (_p+p1)/ve
+            Wd = W / d**2
+            dr_defn[s] += self._sum(Wd * (_np*d - (_np-ni2)*_n/vh))
+            dr_defp[s] += self._sum(Wd * (-_np*d + (_np-ni2)*_p/ve))
+            dr_dv[s] += self._sum(Wd * (_np-ni2) * (_p/ve - _n/vh))
+
+
+def get_defects_table(sys, defects_list):
+    """
+    Return the DefectsTable of a list of defects of a system, building it if
+    needed. The tables are kept on the system until its materials or defects
+    are modified.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    defects_list: list of named tuples
+        Defects of the system.
+
+    Returns
+    -------
+    table: DefectsTable
+    """
+    cache = sys.__dict__.setdefault('_defects_table', {})
+    key = tuple(id(d) for d in defects_list)
+    if key not in cache:
+        # the defects are kept with the table so that their ids stay valid
+        cache[key] = (list(defects_list), DefectsTable(sys, defects_list))
+    return cache[key][1]
+
+
+def defectsF(sys, defects_list, n, p, rho, r=None, integration='gauss'):
     """
     These functions define the model for the charge at the defects.
 
     The functions we integrate are somewhat repetitive because I want to avoid
     making numerous Python function calls by quad.
+
+    The integrals of the continuum defects are computed with a fixed
+    Gauss-Legendre rule (integration='gauss'), in which case all the defects
+    are computed at once from their DefectsTable, or with scipy.integrate.quad
+    site by site (integration='quad').
     """
+    if integration == 'gauss':
+        get_defects_table(sys, defects_list).charge(n, p, rho, r)
+        return
 
 
     for defect in defects_list:
@@ -103,8 +315,14 @@ def defectsF(sys, defects_list, n, p, rho, r=None):
 
             
 def defectsJ(sys, defects_list, n, p, drho_dv, drho_defn=None, drho_defp=None,\
-             dr_defn=None, dr_defp=None, dr_dv=None):
-
+             dr_defn=None, dr_defp=None, dr_dv=None, integration='gauss'):
+    """
+    Derivatives of the charge and recombination at the defects, see defectsF.
+    """
+    if integration == 'gauss':
+        get_defects_table(sys, defects_list).derivatives(n, p, drho_dv, drho_defn, drho_defp,
+                                                         dr_defn, dr_defp, dr_dv)
+        return
 
     for defect in defects_list:
         sites = defect.sites
@@ -168,7 +386,7 @@ def defectsJ(sys, defects_list, n, p, drho_dv, drho_defn=None, drho_defp=None,\
 
             if var == 'efp':
                 res = -_np[sdx]*((_n[sdx]+_n1)/(sh*vh[sdx]) + (_p[sdx]+_p1)/(se*ve[sdx]))\
-                        - (_np[sdx] - ni2[sdx])*_p[sdx]/(se*ve[sdx])
+                        + (_np[sdx] - ni2[sdx])*_p[sdx]/(se*ve[sdx])
 
             if var == 'v':
                 res = (_np[sdx] - ni2[sdx]) * (_p[sdx]/(se*ve[sdx]) - _n[sdx]/(sh*vh[sdx]))
@@ -214,7 +432,7 @@ def defectsJ(sys, defects_list, n, p, drho_dv, drho_defn=None, drho_defp=None,\
                                           args=(sdx, s, 'efn'))[0] \
                                      for sdx, s in enumerate(sites)]
 
-                drho_defp[sites] -= [quad(drho, -sys.Eg[s]/2., sys.Eg[s]/2.,\
+                drho_defp[sites] += [quad(drho, -sys.Eg[s]/2., sys.Eg[s]/2.,\
                                           args=(sdx, s, 'efp'))[0] \
                                      for sdx, s in enumerate(sites)]
 
@@ -222,9 +440,53 @@ def defectsJ(sys, defects_list, n, p, drho_dv, drho_defn=None, drho_defp=None,\
                 dr_defn[sites] += [quad(dr, -sys.Eg[s]/2., sys.Eg[s]/2.,\
                                         args=(sdx, s, 'efn'))[0] \
                                    for sdx, s in enumerate(sites)]
-                dr_defp[sites] -= [quad(dr, -sys.Eg[s]/2., sys.Eg[s]/2.,\
+                dr_defp[sites] += [quad(dr, -sys.Eg[s]/2., sys.Eg[s]/2.,\
                                         args=(sdx, s, 'efp'))[0] \
                                    for sdx, s in enumerate(sites)]
                 dr_dv[sites] += [quad(dr, -sys.Eg[s]/2., sys.Eg[s]/2.,\
                                       args=(sdx, s, 'v'))[0] \
                                  for sdx, s in enumerate(sites)]
+
+
+def check_quadrature(sys, n, p, defects_list=None):
+    """
+    Compare the integrals over the gap of the continuum defects computed with
+    the Gauss-Legendre rule to those computed with scipy.integrate.quad.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    n, p: numpy arrays of floats
+        Electron and hole densities of the entire system.
+    defects_list: list of named tuples
+        Defects to check, all the continuum defects of the system by default.
+
+    Returns
+    -------
+    errors: dictionary of floats
+        Largest relative differences between the two methods for the charge
+        ('rho'), the recombination ('r') and their derivatives ('drho_dv',
+        'drho_defn', 'drho_defp', 'dr_defn', 'dr_defp', 'dr_dv') at the sites
+        of the defects.
+    """
+    if defects_list is None:
+        defects_list = [d for d in sys.defects_list if d.energy is None]
+    if len(defects_list) == 0:
+        return {}
+    names = ['rho', 'r', 'drho_dv', 'drho_defn', 'drho_defp', 'dr_defn', 'dr_defp', 'dr_dv']
+    sites = np.concatenate([d.sites for d in defects_list])
+
+    values = {}
+    for integration in ('gauss', 'quad'):
+        res = [np.zeros_like(n) for _ in names]
+        defectsF(sys, defects_list, n, p, res[0], res[1], integration=integration)
+        defectsJ(sys, defects_list, n, p, *res[2:], integration=integration)
+        values[integration] = res
+
+    errors = {}
+    for name, x, y in zip(names, values['gauss'], values['quad']):
+        scale = np.abs(y[sites])
+        scale[scale == 0] = 1
+        errors[name] = np.max(np.abs(x[sites] - y[sites]) / scale)
+    return errors
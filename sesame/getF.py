@@ -6,6 +6,49 @@
 import numpy as np
 from .observables import *
 from .defects import defectsF
+from .stencil import get_plan
+from .coefficients import get_coefficients
+
+
+def _densities(coeffs, efn, efp, v):
+    # carrier densities of all the sites
+    n = np.exp(efn + v + coeffs.vn)
+    p = np.exp(-efp - v - coeffs.vp)
+    return n, p
+
+
+def _divergence(plan, jx_s, jx_sm1, jy_s, jy_smN):
+    # divergence of a current at the inner sites
+    return (jx_s - jx_sm1) / plan.dxbar + (jy_s - jy_smN) / plan.dybar
+
+
+def _poisson(plan, coeffs, v, rho):
+    # Poisson equation at the inner sites
+    sites = plan.sites
+    sm1, sp1, smN, spN = plan.sm1, plan.sp1, plan.smN, plan.spN
+    dx, dxm1, dy, dym1 = plan.dx, plan.dxm1, plan.dy, plan.dym1
+    dxbar, dybar = plan.dxbar, plan.dybar
+
+    eps_m1x = coeffs.eps_m1x
+    eps_p1x = coeffs.eps_p1x
+    eps_m1y = coeffs.eps_m1y
+    eps_p1y = coeffs.eps_p1y
+
+    return (eps_m1x * (v[sites] - v[sm1]) / dxm1 - eps_p1x * (v[sp1] - v[sites]) / dx) / dxbar \
+           + (eps_m1y * (v[sites] - v[smN]) / dym1 - eps_p1y * (v[spN] - v[sites]) / dy) / dybar \
+           - rho[sites]
+
+
+def _contacts(sys, plan, n, p, n_eq, p_eq, jn_left, jp_left, jn_right, jp_right):
+    # boundary conditions of the continuity equations at the left (an, ap)
+    # and right (bn, bp) contacts, given the currents leaving the left sites
+    # and entering the right sites
+    left, right = plan.left, plan.right
+    an = jn_left - sys.Scn[0] * (n[left] - n_eq[left])
+    ap = jp_left + sys.Scp[0] * (p[left] - p_eq[left])
+    bn = jn_right + sys.Scn[1] * (n[right] - n_eq[right])
+    bp = jp_right - sys.Scp[1] * (p[right] - p_eq[right])
+    return an, ap, bn, bp
 
 
 def getF(sys, v, efn, efp, veq):
@@ -23,8 +66,10 @@ def getF(sys, v, efn, efp, veq):
     # fv_row = 3*s+2
 
     Nx, Ny = sys.xpts.shape[0], sys.ypts.shape[0]
-    N = Nx* Ny
-    dx, dy = sys.dx, sys.dy
+
+    # site indices and lattice distances of the system
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
 
     # right hand side vector
     vec = np.zeros((3 * Nx * Ny,))
@@ -33,12 +78,10 @@ def getF(sys, v, efn, efp, veq):
     #                     For all sites in the system                         #
     ###########################################################################
     # carrier densities
-    n = sys.Nc * np.exp(+sys.bl + efn + v)
-    p = sys.Nv * np.exp(-sys.Eg - sys.bl - efp - v)
+    n, p = _densities(coeffs, efn, efp, v)
 
     # equilibrium carrier densities
-    n_eq = sys.Nc * np.exp(+sys.bl + veq)
-    p_eq = sys.Nv * np.exp(-sys.Eg - sys.bl - veq)
+    n_eq, p_eq = coeffs.equilibrium(veq)
 
     # bulk charges
     rho = sys.rho - n + p
@@ -50,108 +93,65 @@ def getF(sys, v, efn, efp, veq):
     if len(sys.defects_list) != 0:
         defectsF(sys, sys.defects_list, n, p, rho, r)
 
-    # reshape the array as array[y-indices, x-indices]
-    _sites = np.arange(Nx * Ny, dtype=int).reshape(Ny, Nx)
-
     ###########################################################################
     #       inside the system: 0 < i < Nx-1 and 0 <= j <= Ny-1                #
     ###########################################################################
     # We compute fn, fp, fv. Those functions are only defined on the
     # inner part of the system. All the edges containing boundary conditions.
 
-    # list of the sites inside the system
-    sites = _sites[0:Ny, 1:Nx - 1].flatten()
+    # list of the sites inside the system and of their neighbors
+    sites = plan.sites
+    sm1, sp1, smN, spN = plan.sm1, plan.sp1, plan.smN, plan.spN
 
     # lattice distances
-    dx = np.tile(sys.dx[1:], Ny)
-    dxm1 = np.tile(sys.dx[:-1], Ny)
-
-    dy = np.repeat(sys.dy,Nx-2)
-    dym1 = np.repeat(np.roll(sys.dy,1),Nx-2)
-
-    dxbar = (dxm1 + dx) / 2.
-    dybar = (dym1 + dy) / 2.
-
-    infind = np.where(np.isinf(dybar))
-    for i in infind[0]:
-        if np.isinf(dy[i]):
-            dybar[i] = dy[i-Nx] / 2.
-        else:
-            dybar[i] = dy[i] / 2.
-
+    dx, dxm1, dy, dym1 = plan.dx, plan.dxm1, plan.dy, plan.dym1
 
     # compute the currents
-    jnx_s = get_jn(sys, efn, v, sites, sites + 1, dx)
-    jnx_sm1 = get_jn(sys, efn, v, sites - 1, sites, dxm1)
-    jny_s = get_jn(sys, efn, v, sites, (sites + Nx) % N, dy)
-    jny_smN = get_jn(sys, efn, v, (sites - Nx) % N, sites, dym1)
+    jnx_s = get_jn(sys, efn, v, sites, sp1, dx)
+    jnx_sm1 = get_jn(sys, efn, v, sm1, sites, dxm1)
+    jny_s = get_jn(sys, efn, v, sites, spN, dy)
+    jny_smN = get_jn(sys, efn, v, smN, sites, dym1)
 
-    jpx_s = get_jp(sys, efp, v, sites, sites + 1, dx)
-    jpx_sm1 = get_jp(sys, efp, v, sites - 1, sites, dxm1)
-    jpy_s = get_jp(sys, efp, v, sites, (sites + Nx) % N, dy)
-    jpy_smN = get_jp(sys, efp, v, (sites - Nx) % N, sites, dym1)
+    jpx_s = get_jp(sys, efp, v, sites, sp1, dx)
+    jpx_sm1 = get_jp(sys, efp, v, sm1, sites, dxm1)
+    jpy_s = get_jp(sys, efp, v, sites, spN, dy)
+    jpy_smN = get_jp(sys, efp, v, smN, sites, dym1)
 
     # ------------------------------ fn ----------------------------------------
-    fn = (jnx_s - jnx_sm1) / dxbar + (jny_s - jny_smN) / dybar \
-         + sys.g[sites] - r[sites]
+    fn = _divergence(plan, jnx_s, jnx_sm1, jny_s, jny_smN) + sys.g[sites] - r[sites]
 
     vec[3 * sites] = fn
 
     # ------------------------------ fp ----------------------------------------
-    fp = (jpx_s - jpx_sm1) / dxbar + (jpy_s - jpy_smN) / dybar \
-         + r[sites] - sys.g[sites]
+    fp = _divergence(plan, jpx_s, jpx_sm1, jpy_s, jpy_smN) + r[sites] - sys.g[sites]
 
     vec[3 * sites + 1] = fp
 
     # ------------------------------ fv ----------------------------------------
-    eps_m1x = .5 * (sys.epsilon[sites - 1] + sys.epsilon[sites])
-    eps_p1x = .5 * (sys.epsilon[sites + 1] + sys.epsilon[sites])
-    eps_m1y = .5 * (sys.epsilon[(sites - Nx)%N] + sys.epsilon[sites])
-    eps_p1y = .5 * (sys.epsilon[(sites + Nx)%N] + sys.epsilon[sites])
-
-    fv = (eps_m1x * (v[sites] - v[sites - 1]) / dxm1 - eps_p1x * (v[sites + 1] - v[sites]) / dx) / dxbar \
-         + (eps_m1y * (v[sites] - v[(sites - Nx)%N]) / dym1 - eps_p1y * (v[(sites + Nx)%N] - v[sites]) / dy) / dybar \
-         - rho[sites]
+    fv = _poisson(plan, coeffs, v, rho)
 
     vec[3 * sites + 2] = fv
 
     ###########################################################################
-    #                 left boundary: i = 0 and 0 <= j <= Ny-1                 #
-    ###########################################################################
-    # list of the sites on the left side
-    sites = _sites[:, 0].flatten()
-
-    # compute the currents
-    # s_sp1 = [i for i in zip(sites, sites + 1)]
-    jnx = get_jn(sys, efn, v, sites, sites + 1, sys.dx[0])
-    jpx = get_jp(sys, efp, v, sites, sites + 1, sys.dx[0])
-
-    # compute an, ap, av
-    an = jnx - sys.Scn[0] * (n[sites] - n_eq[sites])
-    ap = jpx + sys.Scp[0] * (p[sites] - p_eq[sites])
-    av = 0  # to ensure Dirichlet BCs
-
-    vec[3 * sites] = an
-    vec[3 * sites + 1] = ap
-    vec[3 * sites + 2] = av
-
-    ###########################################################################
-    #               right boundary: i = Nx-1 and 0 <= j <= Ny-1                 #
+    #                 left and right boundaries: i = 0 and i = Nx-1           #
     ###########################################################################
-    # list of the sites on the right side
-    sites = _sites[:, Nx - 1].flatten()
+    # list of the sites on the left and right sides
+    left, right = plan.left, plan.right
 
     # currents
-    jnx_sm1 = get_jn(sys, efn, v, sites - 1, sites, sys.dx[-1])
-    jpx_sm1 = get_jp(sys, efp, v, sites - 1, sites, sys.dx[-1])
+    jnx = get_jn(sys, efn, v, left, left + 1, sys.dx[0])
+    jpx = get_jp(sys, efp, v, left, left + 1, sys.dx[0])
+    jnx_sm1 = get_jn(sys, efn, v, right - 1, right, sys.dx[-1])
+    jpx_sm1 = get_jp(sys, efp, v, right - 1, right, sys.dx[-1])
+
+    an, ap, bn, bp = _contacts(sys, plan, n, p, n_eq, p_eq, jnx, jpx, jnx_sm1, jpx_sm1)
 
-    # b_n, b_p and b_v values
-    bn = jnx_sm1 + sys.Scn[1] * (n[sites] - n_eq[sites])
-    bp = jpx_sm1 - sys.Scp[1] * (p[sites] - p_eq[sites])
-    bv = 0  # Dirichlet BC
+    vec[3 * left] = an
+    vec[3 * left + 1] = ap
+    vec[3 * left + 2] = 0  # to ensure Dirichlet BCs
 
-    vec[3 * sites] = bn
-    vec[3 * sites + 1] = bp
-    vec[3 * sites + 2] = bv
+    vec[3 * right] = bn
+    vec[3 * right + 1] = bp
+    vec[3 * right + 2] = 0  # Dirichlet BC
 
     return vec
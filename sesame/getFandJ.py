@@ -0,0 +1,233 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import numpy as np
+
+from .observables import *
+from .defects import defectsF, defectsJ
+from .stencil import get_plan
+from .coefficients import get_coefficients
+from .getF import _densities, _divergence, _poisson, _contacts
+
+
+def getFandJ(sys, v, efn, efp, veq, bsr=False):
+    # Residual and Jacobian of the drift-diffusion-Poisson equations. This
+    # residual is the one of getF, built with the same helpers, and the
+    # currents and recombination rates are computed together with their
+    # derivatives.
+    #
+    # See getF for the organization of the right hand side vector. The rows of
+    # the Jacobian follow the same order, its sparsity pattern is given by
+    # the plan of the system. With bsr=True, the Jacobian is returned in block
+    # sparse row format, with the 3x3 blocks coupling the unknowns of two
+    # sites.
+
+    # site indices, lattice distances and sparsity pattern of the system
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    # values of the sparse Jacobian, in the order of the pattern
+    J = plan.jacobian.assembler()
+
+    # right hand side vector
+    vec = np.zeros((3 * sys.nx * sys.ny,))
+
+    ###########################################################################
+    #                     For all sites in the system                         #
+    ###########################################################################
+    # carrier densities
+    n, p = _densities(coeffs, efn, efp, v)
+
+    # equilibrium carrier densities
+    n_eq, p_eq = coeffs.equilibrium(veq)
+
+    # bulk charges and their derivatives
+    rho = sys.rho - n + p
+    drho_defn_s = - n
+    drho_defp_s = - p
+    drho_dv_s = - n - p
+
+    # bulk recombination rates and their derivatives
+    r = get_bulk_rr(sys, n, p)
+    dr_defn_s, dr_defp_s, dr_dv_s = get_bulk_rr_derivs(sys, n, p)
+
+    # charge defects
+    if len(sys.defects_list) != 0:
+        defectsF(sys, sys.defects_list, n, p, rho, r)
+        defectsJ(sys, sys.defects_list, n, p, drho_dv_s, drho_defn_s, drho_defp_s, dr_defn_s, dr_defp_s, dr_dv_s)
+
+    ###########################################################################
+    #       inside the system: 0 < i < Nx-1 and 0 <= j <= Ny-1                #
+    ###########################################################################
+    # We compute fn, fp, fv and their derivatives. Those functions are only
+    # defined on the inner part of the system. All the edges containing
+    # boundary conditions.
+
+    # list of the sites inside the system and of their neighbors
+    sites = plan.sites
+    sm1, sp1, smN, spN = plan.sm1, plan.sp1, plan.smN, plan.spN
+
+    # lattice distances
+    dx, dxm1, dy, dym1 = plan.dx, plan.dxm1, plan.dy, plan.dym1
+    dxbar, dybar = plan.dxbar, plan.dybar
+
+    def f_derivatives(djx_s, djx_sm1, djy_s, djy_smN):
+        # Derivatives of the divergence of the current with respect to the
+        # quasi-Fermi level (ef) and the potential (v), valid for both n and p
+
+        # currents derivatives
+        djx_s_def_s, djx_s_def_sp1, djx_s_dv_s, djx_s_dv_sp1 = djx_s
+        djx_sm1_def_sm1, djx_sm1_def_s, djx_sm1_dv_sm1, djx_sm1_dv_s = djx_sm1
+        djy_s_def_s, djy_s_def_spN, djy_s_dv_s, djy_s_dv_spN = djy_s
+        djy_smN_def_smN, djy_smN_def_s, djy_smN_dv_smN, djy_smN_dv_s = djy_smN
+
+        def_smN = - djy_smN_def_smN / dybar
+        dv_smN = - djy_smN_dv_smN / dybar
+
+        def_sm1 = - djx_sm1_def_sm1 / dxbar
+        dv_sm1 = - djx_sm1_dv_sm1 / dxbar
+
+        def_s = (djx_s_def_s - djx_sm1_def_s) / dxbar + \
+                (djy_s_def_s - djy_smN_def_s) / dybar
+        dv_s = (djx_s_dv_s - djx_sm1_dv_s) / dxbar + \
+               (djy_s_dv_s - djy_smN_dv_s) / dybar
+
+        def_sp1 = djx_s_def_sp1 / dxbar
+        dv_sp1 = djx_s_dv_sp1 / dxbar
+
+        def_spN = djy_s_def_spN / dybar
+        dv_spN = djy_s_dv_spN / dybar
+
+        return def_smN, dv_smN, def_sm1, dv_sm1, def_s, dv_s, \
+               def_sp1, dv_sp1, def_spN, dv_spN
+
+    # ------------------------------ fn ----------------------------------------
+    # currents and their derivatives
+    jnx_s, djx_s = get_jn_and_derivs(sys, efn, v, sites, sp1, dx)
+    jnx_sm1, djx_sm1 = get_jn_and_derivs(sys, efn, v, sm1, sites, dxm1)
+    jny_s, djy_s = get_jn_and_derivs(sys, efn, v, sites, spN, dy)
+    jny_smN, djy_smN = get_jn_and_derivs(sys, efn, v, smN, sites, dym1)
+
+    fn = _divergence(plan, jnx_s, jnx_sm1, jny_s, jny_smN) + sys.g[sites] - r[sites]
+
+    vec[3 * sites] = fn
+
+    defn_smN, dv_smN, defn_sm1, dv_sm1, defn_s, dv_s, defn_sp1, dv_sp1, \
+    defn_spN, dv_spN = f_derivatives(djx_s, djx_sm1, djy_s, djy_smN)
+    defn_s = defn_s - dr_defn_s[sites]
+    defp_s = - dr_defp_s[sites]
+    dv_s = dv_s - dr_dv_s[sites]
+
+    # update the sparse matrix values for the inner part of the system
+    dfn_data = (defn_smN, dv_smN, defn_sm1, dv_sm1, defn_s, defp_s, dv_s, \
+                defn_sp1, dv_sp1, defn_spN, dv_spN)
+
+    J.add(dfn_data)
+
+    # ------------------------------ fp ----------------------------------------
+    # currents and their derivatives
+    jpx_s, djx_s = get_jp_and_derivs(sys, efp, v, sites, sp1, dx)
+    jpx_sm1, djx_sm1 = get_jp_and_derivs(sys, efp, v, sm1, sites, dxm1)
+    jpy_s, djy_s = get_jp_and_derivs(sys, efp, v, sites, spN, dy)
+    jpy_smN, djy_smN = get_jp_and_derivs(sys, efp, v, smN, sites, dym1)
+
+    fp = _divergence(plan, jpx_s, jpx_sm1, jpy_s, jpy_smN) + r[sites] - sys.g[sites]
+
+    vec[3 * sites + 1] = fp
+
+    defp_smN, dv_smN, defp_sm1, dv_sm1, defp_s, dv_s, defp_sp1, dv_sp1, \
+    defp_spN, dv_spN = f_derivatives(djx_s, djx_sm1, djy_s, djy_smN)
+    defn_s = dr_defn_s[sites]
+    defp_s = defp_s + dr_defp_s[sites]
+    dv_s = dv_s + dr_dv_s[sites]
+
+    # update the sparse matrix values for the inner part of the system
+    dfp_data = (defp_smN, dv_smN, defp_sm1, dv_sm1, defn_s, defp_s, dv_s, \
+                defp_sp1, dv_sp1, defp_spN, dv_spN)
+
+    J.add(dfp_data)
+
+    # ------------------------------ fv ----------------------------------------
+    eps_m1x = coeffs.eps_m1x
+    eps_p1x = coeffs.eps_p1x
+    eps_m1y = coeffs.eps_m1y
+    eps_p1y = coeffs.eps_p1y
+
+    vec[3 * sites + 2] = _poisson(plan, coeffs, v, rho)
+
+    dvmN = -eps_m1y * 1. / (dym1 * dybar)
+    dvm1 = -eps_m1x * 1. / (dxm1 * dxbar)
+    dv = eps_m1x / (dxm1 * dxbar) + eps_p1x / (dx * dxbar) + eps_m1y / (dym1 * dybar) + eps_p1y / (dy * dybar) - \
+         drho_dv_s[sites]
+    dvp1 = -eps_p1x * 1. / (dx * dxbar)
+    dvpN = -eps_p1y * 1. / (dy * dybar)
+    defn = - drho_defn_s[sites]
+    defp = - drho_defp_s[sites]
+
+    # update the sparse matrix values for the inner part of the system
+    dfv_data = (dvmN, dvm1, defn, defp, dv, dvp1, dvpN)
+
+    J.add(dfv_data)
+
+    ###########################################################################
+    #                 left and right boundaries: i = 0 and i = Nx-1           #
+    ###########################################################################
+    # list of the sites on the left and right sides
+    left, right = plan.left, plan.right
+
+    # currents and their derivatives
+    jnx, djnx = get_jn_and_derivs(sys, efn, v, left, left + 1, sys.dx[0])
+    jpx, djpx = get_jp_and_derivs(sys, efp, v, left, left + 1, sys.dx[0])
+    jnx_sm1, djnx_sm1 = get_jn_and_derivs(sys, efn, v, right - 1, right, sys.dx[-1])
+    jpx_sm1, djpx_sm1 = get_jp_and_derivs(sys, efp, v, right - 1, right, sys.dx[-1])
+
+    an, ap, bn, bp = _contacts(sys, plan, n, p, n_eq, p_eq, jnx, jpx, jnx_sm1, jpx_sm1)
+
+    # -------------------------- an, ap, av ------------------------------------
+    vec[3 * left] = an
+    defn_s, defn_sp1, dv_s, dv_sp1 = djnx
+    defn_s -= sys.Scn[0] * n[left]
+    dv_s -= sys.Scn[0] * n[left]
+    dan_data = (defn_s, dv_s, defn_sp1, dv_sp1)
+
+    J.add(dan_data)
+
+    vec[3 * left + 1] = ap
+    defp_s, defp_sp1, dv_s, dv_sp1 = djpx
+    defp_s -= sys.Scp[0] * p[left]
+    dv_s -= sys.Scp[0] * p[left]
+    dap_data = (defp_s, dv_s, defp_sp1, dv_sp1)
+
+    J.add(dap_data)
+
+    vec[3 * left + 2] = 0  # to ensure Dirichlet BCs
+    dav_data = (1,)
+
+    J.add(dav_data)
+
+    # -------------------------- bn, bp, bv ------------------------------------
+    vec[3 * right] = bn
+    defn_sm1, defn_s, dv_sm1, dv_s = djnx_sm1
+    defn_s += sys.Scn[1] * n[right]
+    dv_s += sys.Scn[1] * n[right]
+    dbn_data = (defn_sm1, dv_sm1, defn_s, dv_s)
+
+    J.add(dbn_data)
+
+    vec[3 * right + 1] = bp
+    defp_sm1, defp_s, dv_sm1, dv_s = djpx_sm1
+    defp_s += sys.Scp[1] * p[right]
+    dv_s += sys.Scp[1] * p[right]
+    dbp_data = (defp_sm1, dv_sm1, defp_s, dv_s)
+
+    J.add(dbp_data)
+
+    vec[3 * right + 2] = 0  # Dirichlet BC
+    dbv_data = (1,)  # dv_s = 0
+
+    J.add(dbv_data)
+
+    if bsr:
+        return vec, plan.jacobian.bsr(J.data)
+    return vec, plan.jacobian.csr(J.data)
@@ -4,19 +4,28 @@
 # LICENSE.rst found in the top-level directory of this distribution.
 
 import numpy as np
-from itertools import chain, product
 
 from .observables import get_n, get_p
 from .defects  import defectsF, defectsJ
+from .stencil import get_plan
+from .coefficients import get_coefficients
 # remember that efn and efp are zero at equilibrium
 
-def getFandJ_eq(sys, v):
+def getFandJ_eq(sys, v, efn=0, efp=0, contacts_bcs=None):
+    # Poisson equation for the electrostatic potential v. The quasi-Fermi
+    # levels efn and efp are zero at equilibrium, and fixed when the equation is
+    # solved out of equilibrium (Gummel iteration). contacts_bcs overrides the
+    # boundary conditions of the system at the contacts.
     Nx, Ny = sys.xpts.shape[0], sys.ypts.shape[0]
-    Num = Nx * Ny
-    # lists of rows, columns and data that will create the sparse Jacobian
-    rows = []
-    columns = []
-    data = []
+    if contacts_bcs is None:
+        contacts_bcs = sys.contacts_bcs
+
+    # site indices, lattice distances and sparsity pattern of the system
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    pattern = plan.jacobian_eq(contacts_bcs)
+    # values of the sparse Jacobian, in the order of the pattern
+    J = pattern.assembler()
 
     # right hand side vector
     vec = np.zeros((Nx*Ny,))
@@ -49,8 +58,8 @@ def getFandJ_eq(sys, v):
     #                     For all sites in the system                         #
     ###########################################################################
     # carrier densities
-    n = sys.Nc * np.exp(+sys.bl + v)
-    p = sys.Nv * np.exp(-sys.Eg - sys.bl - v)
+    n = np.exp(efn + v + coeffs.vn)
+    p = np.exp(-efp - v - coeffs.vp)
 
     # bulk charges
     rho = sys.rho - n + p
@@ -61,40 +70,26 @@ def getFandJ_eq(sys, v):
         defectsF(sys, sys.defects_list, n, p, rho)
         defectsJ(sys, sys.defects_list, n, p, drho_dv)
 
-    # reshape the array as array[y-indices, x-indices]
-    _sites = np.arange(Nx*Ny, dtype=int).reshape(Ny, Nx)
-
     ###########################################################################
     #       inside the system: 0 < i < Nx-1 and 0 <= j <= Ny-1                  #
     ###########################################################################
 
-    # list of the sites inside the system
-    sites = _sites[0:Ny, 1:Nx-1].flatten()
+    # list of the sites inside the system and of their neighbors
+    sites = plan.sites
+    sm1, sp1, smN, spN = plan.sm1, plan.sp1, plan.smN, plan.spN
 
     # lattice distances
-    dx = np.tile(sys.dx[1:], Ny)
-    dxm1 = np.tile(sys.dx[:-1], Ny)
-    dy = np.repeat(sys.dy[:], Nx-2)
-    dym1 = np.repeat(np.roll(sys.dy,1),Nx-2)
-
-    dxbar = (dx + dxm1) / 2.
-    dybar = (dy + dym1) / 2.
-    infind = np.where(np.isinf(dybar))
-    for i in infind[0]:
-        if np.isinf(dy[i]):
-            dybar[i] = dy[i-Nx] / 2
-        else:
-            dybar[i] = dy[i] / 2
-
+    dx, dxm1, dy, dym1 = plan.dx, plan.dxm1, plan.dy, plan.dym1
+    dxbar, dybar = plan.dxbar, plan.dybar
 
     #------------------------------ fv ----------------------------------------
-    eps_m1x = .5 * (sys.epsilon[sites-1] + sys.epsilon[sites])
-    eps_p1x = .5 * (sys.epsilon[sites+1] + sys.epsilon[sites])
-    eps_m1y = .5 * (sys.epsilon[(sites-Nx) % Num] + sys.epsilon[sites])
-    eps_p1y = .5 * (sys.epsilon[(sites+Nx) % Num] + sys.epsilon[sites])
+    eps_m1x = coeffs.eps_m1x
+    eps_p1x = coeffs.eps_p1x
+    eps_m1y = coeffs.eps_m1y
+    eps_p1y = coeffs.eps_p1y
 
-    fvx = (eps_m1x*(v[sites] - v[sites-1]) / dxm1 - eps_p1x*(v[sites+1] - v[sites])/dx) / dxbar
-    fvy = (eps_m1y*(v[sites] - v[(sites-Nx) % Num])/dym1 - eps_p1y*(v[(sites+Nx) % Num] - v[sites])/dy) / dybar
+    fvx = (eps_m1x*(v[sites] - v[sm1]) / dxm1 - eps_p1x*(v[sp1] - v[sites])/dx) / dxbar
+    fvy = (eps_m1y*(v[sites] - v[smN])/dym1 - eps_p1y*(v[spN] - v[sites])/dy) / dybar
     fv = fvx + fvy - rho[sites]
     # update the vector rows for the inner part of the system
     vec[sites] = fv
@@ -106,71 +101,51 @@ def getFandJ_eq(sys, v):
     dvp1 = -eps_p1x*1./(dx * dxbar)
     dvpN = -eps_p1y*1./(dy * dybar)
 
-    # update the sparse matrix row and columns for the inner part of the system
-    dfv_rows = zip(sites, sites, sites, sites, sites)
-    dfv_cols = zip((sites-Nx) % Num, sites-1, sites, sites+1, (sites+Nx) % Num)
-    dfv_data = zip(dvmN, dvm1, dv, dvp1, dvpN)
+    # update the sparse matrix values for the inner part of the system
+    dfv_data = (dvmN, dvm1, dv, dvp1, dvpN)
 
-    rows += list(chain.from_iterable(dfv_rows))
-    columns += list(chain.from_iterable(dfv_cols))
-    data += list(chain.from_iterable(dfv_data))
+    J.add(dfv_data)
 
 
     ###########################################################################
     #                   left contact: i = 0 and 0 <= j <= Ny-1                #
     ###########################################################################
     # list of the sites on the left side
-    sites = _sites[:, 0].flatten()
+    sites = plan.left
 
-    if sys.contacts_bcs[0] == "Neutral":
+    if contacts_bcs[0] == "Neutral":
         # update vector with no surface charges
         vec[sites] = v[sites+1]-v[sites]
         # update Jacobian
-        dv = -np.ones(len(sites),)
-        dvp1 = np.ones(len(sites),)
-        dav_rows = zip(sites, sites)
-        dav_cols = zip(sites, sites+1)
-        dav_data = zip(dv, dvp1)
+        dav_data = (-1, 1)
 
-    if sys.contacts_bcs[0] == "Ohmic" or sys.contacts_bcs[0] == "Schottky":
+    if contacts_bcs[0] == "Ohmic" or contacts_bcs[0] == "Schottky":
         # update vector with zeros
         vec[sites] = 0
         # update Jacobian
-        dav_rows = [sites]
-        dav_cols = [sites]
-        dav_data = [np.ones((len(sites,)))]
+        dav_data = (1,)
 
-    rows += list(chain.from_iterable(dav_rows))
-    columns += list(chain.from_iterable(dav_cols))
-    data += list(chain.from_iterable(dav_data))
+    J.add(dav_data)
 
 
     ###########################################################################
     #                 right contact: i = Nx-1 and 0 <= j <= Ny-1              #
     ###########################################################################
     # list of the sites on the right side
-    sites = _sites[:, Nx-1].flatten()
+    sites = plan.right
 
-    if sys.contacts_bcs[1] == "Neutral":
+    if contacts_bcs[1] == "Neutral":
         # update vector with no surface charges
         vec[sites] = v[sites-1]-v[sites-2]
         # update Jacobian
-        dv = np.ones(len(sites),)
-        dvm1 = -np.ones(len(sites),)
-        dbv_rows = zip(sites, sites)
-        dbv_cols = zip(sites-1, sites)
-        dbv_data = zip(dvm1, dv)
+        dbv_data = (-1, 1)
 
-    if sys.contacts_bcs[1] == "Ohmic" or sys.contacts_bcs[1] == "Schottky":
+    if contacts_bcs[1] == "Ohmic" or contacts_bcs[1] == "Schottky":
         # update vector with zeros
         vec[sites] = 0
         # update Jacobian
-        dbv_rows = [sites]
-        dbv_cols = [sites]
-        dbv_data = [np.ones((len(sites,)))]
+        dbv_data = (1,)
 
-    rows += list(chain.from_iterable(dbv_rows))
-    columns += list(chain.from_iterable(dbv_cols))
-    data += list(chain.from_iterable(dbv_data))
+    J.add(dbv_data)
 
-    return vec, rows, columns, data
+    return vec, pattern.csr(J.data)
@@ -0,0 +1,193 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import numpy as np
+
+from .observables import get_bulk_rr, get_bulk_rr_derivs
+from .defects import defectsF, defectsJ
+from .stencil import get_plan
+from .coefficients import get_coefficients
+
+# The continuity equations are linear in the Slotboom variables u = exp(efn)
+# and w = exp(-efp) once the electrostatic potential is fixed: the
+# Scharfetter-Gummel currents read
+#     jn = mu_e / dl * exp(vn_i) * B(vn_i - vn_ip1) * (u_ip1 - u_i)
+#     jp = -mu_h / dl * exp(-vp_i) * B(vp_ip1 - vp_i) * (w_ip1 - w_i)
+# with vn = v + bl + log(Nc), vp = v + bl + Eg - log(Nv) and B the Bernoulli
+# function. The recombination is linearized around the current quasi-Fermi
+# levels.
+
+
+def bernoulli(x):
+    """
+    Compute the Bernoulli function x / (exp(x) - 1).
+
+    Parameters
+    ----------
+    x: numpy array of floats
+
+    Returns
+    -------
+    b: numpy array of floats
+    """
+    small = np.abs(x) < 1e-10
+    xs = np.where(small, 1., x)
+    return np.where(small, 1 - .5 * x, xs / np.expm1(xs))
+
+
+def _recombination(sys, n, p):
+    # recombination rate and its derivatives with respect to efn and efp
+    r = get_bulk_rr(sys, n, p)
+    dr_defn, dr_defp, dr_dv = get_bulk_rr_derivs(sys, n, p)
+    if len(sys.defects_list) != 0:
+        rho = np.zeros_like(n)
+        defectsF(sys, sys.defects_list, n, p, rho, r)
+        defectsJ(sys, sys.defects_list, n, p, np.zeros_like(n), np.zeros_like(n),
+                 np.zeros_like(n), dr_defn, dr_defp, dr_dv)
+    return r, dr_defn, dr_defp
+
+
+def _continuity(sys, K, c, rhs, contacts):
+    # Assemble the linear system A * u = b of a continuity equation, where the
+    # current between sites i and ip1 is K(i, ip1) * (u_ip1 - u_i), and the
+    # inner rows read div(j) - c * u = rhs. The rows of the contact sites read
+    # j + a * u + d = 0, with contacts = ((K, a, d) left, (K, a, d) right).
+    plan = get_plan(sys)
+    pattern = plan.jacobian_eq(("Neutral", "Neutral"))
+    A = pattern.assembler()
+    b = np.zeros((sys.nx * sys.ny,))
+
+    # inner sites
+    sites = plan.sites
+    Kx_s, Kx_sm1, Ky_s, Ky_smN = K
+    dxbar, dybar = plan.dxbar, plan.dybar
+    A.add((Ky_smN / dybar, Kx_sm1 / dxbar,
+           -(Kx_s + Kx_sm1) / dxbar - (Ky_s + Ky_smN) / dybar - c,
+           Kx_s / dxbar, Ky_s / dybar))
+    b[sites] = rhs
+
+    # left contact: columns (s, s+1)
+    K, a, d = contacts[0]
+    A.add((-K + a, K))
+    b[plan.left] = -d
+
+    # right contact: columns (s-1, s)
+    K, a, d = contacts[1]
+    A.add((-K, K + a))
+    b[plan.right] = -d
+
+    return pattern.csr(A.data), b
+
+
+def _conductances(vp, mu, sign, dl, sites_i, sites_ip1):
+    # coefficient of (u_ip1 - u_i) in the current between sites i and ip1
+    ev = np.exp(sign * vp[sites_i])
+    return sign * mu[sites_i] / dl * ev * bernoulli(sign * (vp[sites_i] - vp[sites_ip1]))
+
+
+def get_continuity_n(sys, v, efn, efp, veq):
+    """
+    Linear system of the electron continuity equation for the Slotboom
+    variable u = exp(efn), at fixed electrostatic potential and hole
+    quasi-Fermi level. The recombination is linearized around efn.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    v: numpy array of floats
+        Electrostatic potential.
+    efn, efp: numpy arrays of floats
+        Electron and hole quasi-Fermi levels.
+    veq: numpy array of floats
+        Electrostatic potential at thermal equilibrium.
+
+    Returns
+    -------
+    A: scipy.sparse.csr_matrix
+    b: numpy array of floats
+        The new u is the solution of A * u = b.
+    """
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    vn = v + coeffs.vn
+    nv = np.exp(vn)
+    n = nv * np.exp(efn)
+    p = np.exp(-efp - v - coeffs.vp)
+    n_eq, _ = coeffs.equilibrium(veq)
+
+    r, dr_defn, _ = _recombination(sys, n, p)
+    u = np.exp(efn)
+    # r(u) = r0 + dr/du * (u - u0) with dr/du = dr/defn / u
+    s = plan.sites
+    c = dr_defn[s] / u[s]
+    rhs = -sys.g[s] + r[s] - c * u[s]
+
+    K = (_conductances(vn, sys.mu_e, 1, plan.dx, s, plan.sp1),
+         _conductances(vn, sys.mu_e, 1, plan.dxm1, plan.sm1, s),
+         _conductances(vn, sys.mu_e, 1, plan.dy, s, plan.spN),
+         _conductances(vn, sys.mu_e, 1, plan.dym1, plan.smN, s))
+
+    left, right = plan.left, plan.right
+    K_left = _conductances(vn, sys.mu_e, 1, sys.dx[0], left, left + 1)
+    K_right = _conductances(vn, sys.mu_e, 1, sys.dx[-1], right - 1, right)
+    # an = jn - Scn * (n - n_eq), bn = jn + Scn * (n - n_eq)
+    contacts = ((K_left, -sys.Scn[0] * nv[left], sys.Scn[0] * n_eq[left]),
+                (K_right, sys.Scn[1] * nv[right], -sys.Scn[1] * n_eq[right]))
+
+    return _continuity(sys, K, c, rhs, contacts)
+
+
+def get_continuity_p(sys, v, efn, efp, veq):
+    """
+    Linear system of the hole continuity equation for the Slotboom variable
+    w = exp(-efp), at fixed electrostatic potential and electron quasi-Fermi
+    level. The recombination is linearized around efp.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    v: numpy array of floats
+        Electrostatic potential.
+    efn, efp: numpy arrays of floats
+        Electron and hole quasi-Fermi levels.
+    veq: numpy array of floats
+        Electrostatic potential at thermal equilibrium.
+
+    Returns
+    -------
+    A: scipy.sparse.csr_matrix
+    b: numpy array of floats
+        The new w is the solution of A * w = b.
+    """
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    vp = v + coeffs.vp
+    pv = np.exp(-vp)
+    n = np.exp(efn + v + coeffs.vn)
+    p = pv * np.exp(-efp)
+    _, p_eq = coeffs.equilibrium(veq)
+
+    r, _, dr_defp = _recombination(sys, n, p)
+    w = np.exp(-efp)
+    # r(w) = r0 + dr/dw * (w - w0) with dr/dw = -dr/defp / w
+    s = plan.sites
+    c = dr_defp[s] / w[s]
+    rhs = sys.g[s] - r[s] - c * w[s]
+
+    K = (_conductances(vp, sys.mu_h, -1, plan.dx, s, plan.sp1),
+         _conductances(vp, sys.mu_h, -1, plan.dxm1, plan.sm1, s),
+         _conductances(vp, sys.mu_h, -1, plan.dy, s, plan.spN),
+         _conductances(vp, sys.mu_h, -1, plan.dym1, plan.smN, s))
+
+    left, right = plan.left, plan.right
+    K_left = _conductances(vp, sys.mu_h, -1, sys.dx[0], left, left + 1)
+    K_right = _conductances(vp, sys.mu_h, -1, sys.dx[-1], right - 1, right)
+    # ap = jp + Scp * (p - p_eq), bp = jp - Scp * (p - p_eq)
+    contacts = ((K_left, sys.Scp[0] * pv[left], -sys.Scp[0] * p_eq[left]),
+                (K_right, -sys.Scp[1] * pv[right], sys.Scp[1] * p_eq[right]))
+
+    return _continuity(sys, K, c, rhs, contacts)
@@ -0,0 +1,207 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import logging
+import os
+from importlib.util import find_spec
+from math import exp, expm1
+
+# Compiled versions of the Scharfetter-Gummel currents and of the bulk
+# recombination, used by sesame.observables once enabled. Each kernel is a
+# generalized ufunc that evaluates one site (or one link) per call, so that the
+# Taylor expansions are selected per element instead of being evaluated over
+# the full arrays, without temporaries. The ufuncs follow the broadcasting
+# rules of NumPy, and the work is spread over the cores. The kernels are
+# compiled by enable() (or at import if the environment variable SESAME_JIT is
+# set to 1), and the compiled code is cached on disk.
+
+# check if Numba is available, it is only imported by enable()
+numba_available = find_spec('numba') is not None
+
+# The compiled kernels are used when this flag is True, see enable() and
+# disable(). The NumPy kernels are used by default.
+enabled = False
+
+
+def enable():
+    """
+    Use the kernels compiled with Numba to compute the currents and the bulk
+    recombination. The kernels are compiled the first time this function is
+    called.
+
+    Raises
+    ------
+    ImportError
+        If Numba is not installed.
+    """
+    global enabled
+    if not numba_available:
+        raise ImportError("Numba is required for the compiled kernels.")
+    _compile()
+    enabled = True
+
+
+def disable():
+    """
+    Use the NumPy kernels to compute the currents and the bulk recombination.
+    """
+    global enabled
+    enabled = False
+
+# thresholds of the Taylor expansions, see sesame.observables.get_jn
+_tol1 = 1e-12
+_tol2 = 1e-5
+_tol3 = 1e-9
+
+
+def _jn(efnp0, efnp1, vp0, vp1, mu, dl):
+    # electron current between sites i and ip1 and its derivatives with
+    # respect to efn_i, efn_ip1, v_i, v_ip1, see
+    # sesame.observables.get_jn_and_derivs
+    dv0 = vp0 - vp1
+    dv = dv0 + _tol1 if abs(dv0) < _tol1 else dv0
+    defn = efnp1 - efnp0
+
+    ev0 = exp(vp0)
+    ep1 = exp(efnp1)
+    em = expm1(-defn)
+    if abs(defn) < _tol3:
+        A = ep1 * defn
+        defn_i = ep1
+        defn_ip1 = -ep1 * (1 + defn)
+    else:
+        A = -ep1 * em
+        defn_i = ep1 * (1 + em)
+        defn_ip1 = -ep1
+
+    C = mu * A * ev0 / dl
+    if abs(dv0) < _tol2:
+        q = 6 + 3 * dv0 + dv0**2
+        S = -1. / (1 + .5 * dv0 + 1 / 6. * dv0**2)
+        dv_i = -C * 6 * (3 + dv0 + dv0**2) / q**2
+        dv_ip1 = -C * 6 * (3 + 2 * dv0) / q**2
+    else:
+        edv = exp(dv)
+        S = dv / (1 - edv)
+        dv_i = -C * (1 + dv - edv) / (edv - 1)**2
+        dv_ip1 = -C * (edv * (1 - dv) - 1) / (edv - 1)**2
+    W = mu * ev0 / dl * S
+
+    return -A * W, defn_i * W, defn_ip1 * W, dv_i, dv_ip1
+
+
+def _jp(efp0, efp1, vp0, vp1, mu, dl):
+    # hole current between sites i and ip1 and its derivatives with respect
+    # to efp_i, efp_ip1, v_i, v_ip1, see sesame.observables.get_jp_and_derivs
+    dv0 = vp0 - vp1
+    dv = dv0 + _tol1 if abs(dv0) < _tol1 else dv0
+    efpp1 = -efp1
+    defp = efpp1 + efp0
+
+    emv0 = exp(-vp0)
+    ep1 = exp(efpp1)
+    em = expm1(-defp)
+    ep0 = ep1 * (1 + em)
+    if abs(defp) < _tol3:
+        A = ep1 * defp
+        B = ep0 * defp
+        defp_i = -ep1
+        defp_ip1 = ep1 * (1 + defp)
+    else:
+        A = -ep1 * em
+        B = A
+        defp_i = -ep0
+        defp_ip1 = ep1
+
+    C = mu * B * emv0 / dl
+    if abs(dv0) < _tol2:
+        q = 6 - 3 * dv0 + dv0**2
+        S = 1. / (1 - .5 * dv0 + 1 / 6. * dv0**2)
+        dv_i = -C * 6 * (3 - dv0 + dv0**2) / q**2
+        dv_ip1 = C * 6 * (2 * dv0 - 3) / q**2
+    else:
+        emdv = exp(-dv)
+        S = dv / (1 - emdv)
+        dv_i = C * (emdv - 1 + dv) / (1 - emdv)**2
+        dv_ip1 = C * (1 - emdv * (1 + dv)) / (1 - emdv)**2
+    W = mu * emv0 / dl * S
+
+    return -A * W, defp_i * W, defp_ip1 * W, dv_i, dv_ip1
+
+
+def _rr(n, p, ni2, tau_e, tau_h, n1, p1, B, Cn, Cp):
+    # bulk recombination rate and its derivatives with respect to efn, efp and
+    # v, see sesame.observables.get_bulk_rr
+    _np = n * p
+    den = tau_h * (n + n1) + tau_e * (p + p1)
+    r = (_np - ni2) / den + (Cn * n + Cp * p) * (_np - ni2) + B * (_np - ni2)
+
+    defn = (_np * den - (_np - ni2) * n * tau_h) / den**2 \
+           + Cn * n * (2 * _np - ni2) + Cp * _np * p + B * _np
+    defp = -(_np * den - (_np - ni2) * p * tau_e) / den**2 \
+           + Cn * n * _np + Cp * p * (2 * _np - ni2) + B * _np
+    dv = (_np - ni2) * (tau_e * p - tau_h * n) / den**2 \
+         + Cn * n * (_np - ni2) - Cp * p * (_np - ni2)
+    return r, defn, defp, dv
+
+
+_compiled = False
+
+
+def _compile():
+    # compile the kernels and add them to the module
+    global _compiled, _jn, _jp, _rr, jn, jn_and_derivs, jp, jp_and_derivs,\
+           bulk_rr, bulk_rr_derivs
+    if _compiled:
+        return
+    import numba
+
+    _jn = numba.njit(cache=True)(_jn)
+    _jp = numba.njit(cache=True)(_jp)
+    _rr = numba.njit(cache=True)(_rr)
+
+    _current = ['void(' + ', '.join(['float64'] * 6) + ', float64[:])']
+    _current_derivs = ['void(' + ', '.join(['float64'] * 6 + ['float64[:]'] * 5) + ')']
+    _rate = ['void(' + ', '.join(['float64'] * 10) + ', float64[:])']
+    _rate_derivs = ['void(' + ', '.join(['float64'] * 10 + ['float64[:]'] * 3) + ')']
+
+    @numba.guvectorize(_current, '(),(),(),(),(),()->()', target='parallel', cache=True)
+    def jn(efnp0, efnp1, vp0, vp1, mu, dl, j):
+        j[0] = _jn(efnp0, efnp1, vp0, vp1, mu, dl)[0]
+
+    @numba.guvectorize(_current_derivs, '(),(),(),(),(),()->(),(),(),(),()',
+                       target='parallel', cache=True)
+    def jn_and_derivs(efnp0, efnp1, vp0, vp1, mu, dl, j, defn_i, defn_ip1, dv_i, dv_ip1):
+        j[0], defn_i[0], defn_ip1[0], dv_i[0], dv_ip1[0] = \
+            _jn(efnp0, efnp1, vp0, vp1, mu, dl)
+
+    @numba.guvectorize(_current, '(),(),(),(),(),()->()', target='parallel', cache=True)
+    def jp(efp0, efp1, vp0, vp1, mu, dl, j):
+        j[0] = _jp(efp0, efp1, vp0, vp1, mu, dl)[0]
+
+    @numba.guvectorize(_current_derivs, '(),(),(),(),(),()->(),(),(),(),()',
+                       target='parallel', cache=True)
+    def jp_and_derivs(efp0, efp1, vp0, vp1, mu, dl, j, defp_i, defp_ip1, dv_i, dv_ip1):
+        j[0], defp_i[0], defp_ip1[0], dv_i[0], dv_ip1[0] = \
+            _jp(efp0, efp1, vp0, vp1, mu, dl)
+
+    @numba.guvectorize(_rate, '(),(),(),(),(),(),(),(),(),()->()', target='parallel',
+                       cache=True)
+    def bulk_rr(n, p, ni2, tau_e, tau_h, n1, p1, B, Cn, Cp, r):
+        r[0] = _rr(n, p, ni2, tau_e, tau_h, n1, p1, B, Cn, Cp)[0]
+
+    @numba.guvectorize(_rate_derivs, '(),(),(),(),(),(),(),(),(),()->(),(),()',
+                       target='parallel', cache=True)
+    def bulk_rr_derivs(n, p, ni2, tau_e, tau_h, n1, p1, B, Cn, Cp, defn, defp, dv):
+        _, defn[0], defp[0], dv[0] = _rr(n, p, ni2, tau_e, tau_h, n1, p1, B, Cn, Cp)
+    _compiled = True
+
+
+if os.environ.get('SESAME_JIT', '0') == '1':
+    try:
+        enable()
+    except ImportError:
+        logging.warning("SESAME_JIT is set but Numba is not installed, the NumPy "\
+                        "kernels are used.")
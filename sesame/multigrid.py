@@ -0,0 +1,212 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix, identity, kron
+import scipy.sparse.linalg as lg
+
+
+def _interpolation(h, periodic):
+    # Linear interpolation from every other node of a line of nodes separated
+    # by the lengths h. The first node is kept, and the last one when the line
+    # is not periodic. When the line is periodic, h has one more entry: the
+    # length of the link between the last node and the first one. Return the
+    # interpolation matrix and the lengths of the links of the coarse line.
+    n = len(h) if periodic else len(h) + 1
+    coarse = np.arange(0, n, 2)
+    if not periodic and coarse[-1] != n - 1:
+        coarse = np.append(coarse, n - 1)
+    position = np.concatenate(([0], np.cumsum(h)))
+    if periodic:
+        hc = np.diff(np.append(position[coarse], position[n]))
+    else:
+        hc = np.diff(position[coarse])
+
+    # the removed nodes are the odd ones, between the coarse nodes i-1 and
+    # i+1 (the first node for the last one of a periodic line)
+    fine = np.arange(1, n, 2)
+    fine = fine[~np.isin(fine, coarse)]
+    left = (fine - 1) // 2
+    right = ((fine + 1) // 2) % len(coarse)
+    wl = h[fine] / (h[fine - 1] + h[fine])
+    wr = h[fine - 1] / (h[fine - 1] + h[fine])
+
+    rows = np.concatenate((coarse, fine, fine))
+    columns = np.concatenate((np.arange(len(coarse)), left, right))
+    data = np.concatenate((np.ones(len(coarse)), wl, wr))
+    P = csr_matrix((data, (rows, columns)), shape=(n, len(coarse)))
+    return P, hc
+
+
+def _block_triangular(A, m, lower):
+    # LU decomposition of the block lower (upper) triangular part of A, with
+    # blocks of size m
+    A = A.tocoo()
+    keep = A.col // m <= A.row // m if lower else A.col // m >= A.row // m
+    T = csc_matrix((A.data[keep], (A.row[keep], A.col[keep])), shape=A.shape)
+    return lg.splu(T, permc_spec='NATURAL', diag_pivot_thresh=0.,
+                   options=dict(SymmetricMode=True))
+
+
+class Multigrid():
+    """
+    Geometric multigrid V-cycle for a matrix discretized on the tensor product
+    grid of a system, with m unknowns per site.
+
+    The coarse grids keep every other line of sites in the x- and/or the
+    y-direction, with the linear interpolation between the lines given by the
+    (nonuniform) lattice distances. A direction is only coarsened when its
+    typical lattice distance is at most twice the one of the other direction
+    (semi-coarsening of anisotropic meshes). The y-direction is periodic when
+    the last entry of dy is finite, and abrupt otherwise, as in
+    :class:`sesame.Builder`. The coarse matrices are the Galerkin products
+    P^T A P, the smoother is a symmetric block Gauss-Seidel sweep over the
+    sites (the m unknowns of a site are relaxed together), and the coarsest
+    matrix is solved with a sparse LU decomposition.
+
+    Parameters
+    ----------
+    A: scipy sparse matrix
+        The matrix, with the sites s = i + j*nx.
+    dx: numpy array of floats
+        Lattice distances of the nx sites in the x-direction (size nx-1).
+    dy: numpy array of floats
+        Lattice distances of the ny sites in the y-direction, the last one
+        being the distance between the last row and the first one (size ny).
+    m: integer
+        Number of unknowns per site.
+    fields: boolean
+        The unknowns are stored field by field (see the layout option of
+        :class:`sesame.solvers.Solver`) instead of site by site.
+    coarse_size: integer
+        Size of the matrices solved directly.
+    """
+
+    def __init__(self, A, dx, dy, m=1, fields=False, coarse_size=500):
+        A = csr_matrix(A)
+        # the cycles are done with the unknowns of each site next to each
+        # other
+        self.order = None
+        if fields and m > 1:
+            self.order = np.arange(A.shape[0]).reshape(m, -1).T.ravel()
+            A = A[self.order][:, self.order]
+        self.matrices = [A]
+        self.interpolations = []
+        periodic = np.isfinite(dy[-1])
+        hx, hy = np.asarray(dx), np.asarray(dy) if periodic else np.asarray(dy[:-1])
+        nx, ny = len(dx) + 1, len(dy)
+
+        while self.matrices[-1].shape[0] > coarse_size:
+            # coarsen the directions with the strongest couplings
+            cx = nx >= 3 and (ny < 3 or np.median(hx) <= 2 * np.median(hy))
+            cy = ny >= 3 and (nx < 3 or np.median(hy) <= 2 * np.median(hx))
+            if not (cx or cy):
+                break
+            Px, Py = identity(nx, format='csr'), identity(ny, format='csr')
+            if cx:
+                Px, hx = _interpolation(hx, False)
+                nx = Px.shape[1]
+            if cy:
+                Py, hy = _interpolation(hy, periodic)
+                ny = Py.shape[1]
+            P = kron(kron(Py, Px), identity(m)).tocsr()
+            self.interpolations.append(P)
+            self.matrices.append((P.T.dot(self.matrices[-1]).dot(P)).tocsr())
+
+        # block Gauss-Seidel sweeps: the block triangular parts are
+        # factorized without ordering, which only fills the diagonal blocks
+        self.smoothers = [(_block_triangular(A, m, True), _block_triangular(A, m, False))
+                          for A in self.matrices[:-1]]
+        self.coarse = lg.splu(self.matrices[-1].tocsc())
+        self.shape = self.matrices[0].shape
+
+    def cycle(self, b, x=None):
+        """
+        Apply one V-cycle to A * x = b.
+
+        Parameters
+        ----------
+        b: numpy array of floats
+            Right hand side.
+        x: numpy array of floats
+            Initial guess, zero by default.
+
+        Returns
+        -------
+        x: numpy array of floats
+            Improved solution.
+        """
+        b = np.asarray(b, dtype=np.float64)
+        if self.order is None:
+            return self._cycle(0, b, x)
+        if x is not None:
+            x = x[self.order]
+        y = np.empty_like(b)
+        y[self.order] = self._cycle(0, b[self.order], x)
+        return y
+
+    def _cycle(self, level, b, x):
+        if level == len(self.interpolations):
+            return self.coarse.solve(b)
+        A, P = self.matrices[level], self.interpolations[level]
+        lower, upper = self.smoothers[level]
+        # pre-smoothing (forward sweep)
+        if x is None:
+            x = lower.solve(b)
+        else:
+            x = x + lower.solve(b - A.dot(x))
+        # coarse grid correction
+        x += P.dot(self._cycle(level + 1, P.T.dot(b - A.dot(x)), None))
+        # post-smoothing (backward sweep)
+        x += upper.solve(b - A.dot(x))
+        return x
+
+    def solve(self, b, tol=1e-8, maxiter=100):
+        """
+        Solve A * x = b with V-cycles.
+
+        Parameters
+        ----------
+        b: numpy array of floats
+            Right hand side.
+        tol: float
+            Relative accuracy of the solution (norm of the residual over the
+            norm of b).
+        maxiter: integer
+            Maximum number of V-cycles.
+
+        Returns
+        -------
+        x: numpy array of floats
+            The solution.
+        info: integer
+            0 if the accuracy was reached, the number of cycles otherwise.
+        """
+        b = np.asarray(b, dtype=np.float64)
+        if self.order is not None:
+            x, info = self._solve(b[self.order], tol, maxiter)
+            y = np.empty_like(b)
+            y[self.order] = x
+            return y, info
+        return self._solve(b, tol, maxiter)
+
+    def _solve(self, b, tol, maxiter):
+        A = self.matrices[0]
+        norm = np.linalg.norm(b)
+        x = np.zeros_like(b)
+        if norm == 0:
+            return x, 0
+        for _ in range(maxiter):
+            x = self._cycle(0, b, x)
+            if np.linalg.norm(b - A.dot(x)) <= tol * norm:
+                return x, 0
+        return x, maxiter
+
+    def aslinearoperator(self):
+        """
+        Return one V-cycle from a zero guess as a LinearOperator, to be used
+        as the preconditioner of a Krylov method.
+        """
+        return lg.LinearOperator(self.shape, self.cycle)
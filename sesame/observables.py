@@ -6,6 +6,9 @@
 from numpy import exp
 import numpy as np
 
+from .coefficients import get_coefficients
+from . import jit
+
 
 def get_n(sys, efn, v, sites):
     """
@@ -27,7 +30,8 @@ def get_n(sys, efn, v, sites):
     n: numpy array
     """
 
-    n = sys.Nc[sites] * exp(+sys.bl[sites] + efn[sites] + v[sites])
+    vn = get_coefficients(sys).vn
+    n = exp(efn[sites] + v[sites] + vn[sites])
     return n
 
 
@@ -50,17 +54,18 @@ def get_p(sys, efp, v, sites):
     -------
     p: numpy array
     """
-    bl = sys.bl[sites]
-    Eg = sys.Eg[sites]
-    Nv = sys.Nv[sites]
-    p = Nv * exp(-Eg - bl - efp[sites] - v[sites])
+    vp = get_coefficients(sys).vp
+    p = exp(-efp[sites] - v[sites] - vp[sites])
     return p
 
 
 def get_bulk_rr(sys, n, p):
     # Compute the bulk recombination of the entire system for SRH, radiative and
     # Auger mechanisms
-    ni2 = sys.ni ** 2
+    ni2 = get_coefficients(sys).ni2
+    if jit.enabled:
+        return jit.bulk_rr(n, p, ni2, sys.tau_e, sys.tau_h, sys.n1, sys.p1,
+                           sys.B, sys.Cn, sys.Cp)
     _np = n * p
     r = (_np - ni2) / (sys.tau_h * (n + sys.n1) + sys.tau_e * (p + sys.p1)) \
         + (sys.Cn * n + sys.Cp * p) * (_np - ni2) \
@@ -69,7 +74,10 @@ def get_bulk_rr(sys, n, p):
 
 
 def get_bulk_rr_derivs(sys, n, p):
-    ni2 = sys.ni ** 2
+    ni2 = get_coefficients(sys).ni2
+    if jit.enabled:
+        return jit.bulk_rr_derivs(n, p, ni2, sys.tau_e, sys.tau_h, sys.n1,
+                                  sys.p1, sys.B, sys.Cn, sys.Cp)
     _np = n * p
 
     defn = (_np * (sys.tau_h * (n + sys.n1) + sys.tau_e * (p + sys.p1)) - (_np - ni2) * n * sys.tau_h) \
@@ -114,6 +122,17 @@ def get_jn(sys, efn, v, sites_i, sites_ip1, dl):
     -------
     jn: numpy array of floats
     """
+    vn = get_coefficients(sys).vn
+    return _jn(efn[sites_i], efn[sites_ip1], v[sites_i] + vn[sites_i],
+               v[sites_ip1] + vn[sites_ip1], sys.mu_e[sites_i], dl)
+
+
+def _jn(efnp0, efnp1, vp0, vp1, mu, dl):
+    # electron current between sites i and ip1, given the quasi-Fermi levels
+    # and the potentials v + bl + log(Nc) of both sites, the mobility of site i
+    # and the lattice distance. The arrays can have any (common) shape.
+    if jit.enabled:
+        return jit.jn(efnp0, efnp1, vp0, vp1, mu, dl)
 
     # tol1 controls the minimum value of dv.  all values less than tol1 are set equal to tol1
     tol1 = 1e-12
@@ -123,16 +142,11 @@ def get_jn(sys, efn, v, sites_i, sites_ip1, dl):
     tol3 = 1e-9
     # this description of tol variables applies for the jp function, and jn and jp derivative functions
 
-    vp0 = v[sites_i] + sys.bl[sites_i] + np.log(sys.Nc[sites_i])
-    dv = vp0 - (v[sites_ip1] + sys.bl[sites_ip1] + np.log(sys.Nc[sites_ip1]))
+    dv = vp0 - vp1
     dv0 = dv
     dv = dv + (np.abs(dv) < tol1) * tol1
 
-    efnp0 = efn[sites_i]
-    efnp1 = efn[sites_ip1]
     defn = efnp1 - efnp0
-    mu = sys.mu_e[sites_i]
-
 
     jn = (    mu * exp(efnp1)*(1 - exp(efnp0-efnp1)) / dl * dv / (-exp(-vp0) * (1 - exp(dv))) * (np.abs(dv0) >= tol2) + \
          -1 * mu * exp(efnp1)*(1 - exp(efnp0-efnp1)) / dl / (-exp(-vp0) * (1 + .5 * dv0 + 1/6.*(dv0)**2)) * (np.abs(dv0) < tol2)) * (np.abs(defn)>=tol3) + \
@@ -168,21 +182,30 @@ def get_jp(sys, efp, v, sites_i, sites_ip1, dl):
     -------
     jp: numpy array of floats
     """
+    vp = get_coefficients(sys).vp
+    return _jp(efp[sites_i], efp[sites_ip1], v[sites_i] + vp[sites_i],
+               v[sites_ip1] + vp[sites_ip1], sys.mu_h[sites_i], dl)
+
+
+def _jp(efp0, efp1, vp0, vp1, mu, dl):
+    # hole current between sites i and ip1, given the quasi-Fermi levels and
+    # the potentials v + bl + Eg - log(Nv) of both sites, the mobility of site
+    # i and the lattice distance. The arrays can have any (common) shape.
+    if jit.enabled:
+        return jit.jp(efp0, efp1, vp0, vp1, mu, dl)
+
     tol1 = 1e-12
     tol2 = 1e-5
     tol3 = 1e-9
 
-    vp0 = v[sites_i] + sys.bl[sites_i] + sys.Eg[sites_i] - np.log(sys.Nv[sites_i])
-    dv = vp0 - (v[sites_ip1] + sys.bl[sites_ip1] + sys.Eg[sites_ip1] - np.log(sys.Nv[sites_ip1]))
+    dv = vp0 - vp1
     dv0 = dv
     dv = dv + (np.abs(dv) < tol1) * tol1
 
-    efpp0 = -efp[sites_i]
-    efpp1 = -efp[sites_ip1]
+    efpp0 = -efp0
+    efpp1 = -efp1
     defp = efpp1 - efpp0
 
-    mu = sys.mu_h[sites_i]
-
     jp = (mu * exp(efpp1) * (1 - exp(efpp0-efpp1)) / dl * dv / (-exp(vp0) * (1 - exp(-dv))) * (np.abs(dv0) >= tol2) + \
           mu * exp(efpp1) * (1 - exp(efpp0-efpp1)) / dl * 1 / (-exp(vp0) * (1 - .5*(dv0) + 1/6.*(dv0)**2.)) * (np.abs(dv0) < tol2)) * (np.abs(defp) >= tol3) + \
          (mu * exp(efpp1) * ( -(efpp0 - efpp1))    / dl * dv / (-exp(vp0) * (1 - exp(-dv))) * (np.abs(dv0) >= tol2) + \
@@ -193,13 +216,17 @@ def get_jp(sys, efp, v, sites_i, sites_ip1, dl):
 
 
 def get_jn_derivs(sys, efn, v, sites_i, sites_ip1, dl):
+    if jit.enabled:
+        return get_jn_and_derivs(sys, efn, v, sites_i, sites_ip1, dl)[1]
+
     tol1 = 1e-12
     tol2 = 1e-5
     tol3 = 1e-9
 
 
-    vp0 = v[sites_i] + sys.bl[sites_i] + np.log(sys.Nc[sites_i])
-    vp1 = v[sites_ip1] + sys.bl[sites_ip1] + np.log(sys.Nc[sites_ip1])
+    vn = get_coefficients(sys).vn
+    vp0 = v[sites_i] + vn[sites_i]
+    vp1 = v[sites_ip1] + vn[sites_ip1]
     dv = vp0 - vp1
     dv0 = dv
     dv = dv + (np.abs(dv) < tol1) * tol1
@@ -243,12 +270,16 @@ def get_jn_derivs(sys, efn, v, sites_i, sites_ip1, dl):
 
 
 def get_jp_derivs(sys, efp, v, sites_i, sites_ip1, dl):
+    if jit.enabled:
+        return get_jp_and_derivs(sys, efp, v, sites_i, sites_ip1, dl)[1]
+
     tol1 = 1e-12
     tol2 = 1e-5
     tol3 = 1e-9
 
-    vp0 = v[sites_i] + sys.bl[sites_i] + sys.Eg[sites_i] - np.log(sys.Nv[sites_i])
-    vp1 = v[sites_ip1] + sys.bl[sites_ip1] + sys.Eg[sites_ip1] - np.log(sys.Nv[sites_ip1])
+    vp = get_coefficients(sys).vp
+    vp0 = v[sites_i] + vp[sites_i]
+    vp1 = v[sites_ip1] + vp[sites_ip1]
     dv = vp0 - vp1
     dv0 = dv
     dv = dv + (np.abs(dv) < tol1) * tol1
@@ -290,6 +321,169 @@ def get_jp_derivs(sys, efp, v, sites_i, sites_ip1, dl):
     return mu * defp_i, mu * defp_ip1, mu * dv_i, mu * dv_ip1
 
 
+def get_jn_and_derivs(sys, efn, v, sites_i, sites_ip1, dl):
+    """
+    Compute the electron current between sites ``site_i`` and ``sites_ip1``
+    together with its derivatives. This is equivalent to calling
+    :func:`get_jn` and :func:`get_jn_derivs`, but the exponentials are
+    evaluated only once.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    efn: numpy array of floats
+        Values of the electron quasi-Fermi level for the entire system (as given
+        by the drift diffusion Poisson solver).
+    v: numpy array of floats
+        Values of the electrostatic potential for the entire system (as given
+        by the drift diffusion Poisson solver).
+    sites_i: list of integers
+        Indices of the sites the current is coming from.
+    sites_ip1: list of integers
+        Indices of the sites the current is going to.
+    dl: numpy arrays of floats
+        Lattice distances between sites ``sites_i`` and sites ``sites_ip1``.
+
+    Returns
+    -------
+    jn: numpy array of floats
+    derivs: tuple of numpy arrays of floats
+        Derivatives of the current with respect to efn_i, efn_ip1, v_i,
+        v_ip1, in the order returned by :func:`get_jn_derivs`.
+    """
+    vn = get_coefficients(sys).vn
+    return _jn_and_derivs(efn[sites_i], efn[sites_ip1], v[sites_i] + vn[sites_i],
+                          v[sites_ip1] + vn[sites_ip1], sys.mu_e[sites_i], dl)
+
+
+def _jn_and_derivs(efnp0, efnp1, vp0, vp1, mu, dl):
+    # electron current and its derivatives, with the arguments of _jn
+    if jit.enabled:
+        jn, *derivs = jit.jn_and_derivs(efnp0, efnp1, vp0, vp1, mu, dl)
+        return jn, tuple(derivs)
+
+    tol1 = 1e-12
+    tol2 = 1e-5
+    tol3 = 1e-9
+
+    dv0 = vp0 - vp1
+    dv = dv0 + (np.abs(dv0) < tol1) * tol1
+    series_v = np.abs(dv0) < tol2
+
+    defn = efnp1 - efnp0
+    series_f = np.abs(defn) < tol3
+
+    # exponentials shared by the current and its derivatives
+    ev0 = exp(vp0)
+    edv = exp(dv)
+    ep1 = exp(efnp1)
+    em = np.expm1(-defn)
+    ep0 = ep1 * (1 + em)
+
+    # ep1 * (1 - exp(efnp0 - efnp1)) and its Taylor expansion
+    A = np.where(series_f, ep1 * defn, -ep1 * em)
+
+    # Bernoulli factor of the Scharfetter-Gummel scheme and its Taylor expansion
+    q = 6 + 3 * dv0 + dv0**2
+    S = np.where(series_v, -1. / (1 + .5 * dv0 + 1 / 6. * dv0**2), dv / (1 - edv))
+    W = mu * ev0 / dl * S
+    C = mu * A * ev0 / dl
+
+    jn = -A * W
+
+    defn_i = np.where(series_f, ep1, ep0) * W
+    defn_ip1 = -ep1 * W * np.where(series_f, 1 + defn, 1)
+    dv_i = -C * np.where(series_v, 6 * (3 + dv0 + dv0**2) / q**2,
+                         (1 + dv - edv) / (edv - 1)**2)
+    dv_ip1 = -C * np.where(series_v, 6 * (3 + 2 * dv0) / q**2,
+                           (edv * (1 - dv) - 1) / (edv - 1)**2)
+
+    return jn, (defn_i, defn_ip1, dv_i, dv_ip1)
+
+
+def get_jp_and_derivs(sys, efp, v, sites_i, sites_ip1, dl):
+    """
+    Compute the hole current between sites ``site_i`` and ``sites_ip1``
+    together with its derivatives. This is equivalent to calling
+    :func:`get_jp` and :func:`get_jp_derivs`, but the exponentials are
+    evaluated only once.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    efp: numpy array of floats
+        Values of the hole quasi-Fermi level for the entire system (as given
+        by the drift diffusion Poisson solver).
+    v: numpy array of floats
+        Values of the electrostatic potential for the entire system (as given
+        by the drift diffusion Poisson solver).
+    sites_i: list of integers
+        Indices of the sites the current is coming from.
+    sites_ip1: list of integers
+        Indices of the sites the current is going to.
+    dl: numpy arrays of floats
+        Lattice distances between sites ``sites_i`` and sites ``sites_ip1``.
+
+    Returns
+    -------
+    jp: numpy array of floats
+    derivs: tuple of numpy arrays of floats
+        Derivatives of the current with respect to efp_i, efp_ip1, v_i,
+        v_ip1, in the order returned by :func:`get_jp_derivs`.
+    """
+    vp = get_coefficients(sys).vp
+    return _jp_and_derivs(efp[sites_i], efp[sites_ip1], v[sites_i] + vp[sites_i],
+                          v[sites_ip1] + vp[sites_ip1], sys.mu_h[sites_i], dl)
+
+
+def _jp_and_derivs(efp0, efp1, vp0, vp1, mu, dl):
+    # hole current and its derivatives, with the arguments of _jp
+    if jit.enabled:
+        jp, *derivs = jit.jp_and_derivs(efp0, efp1, vp0, vp1, mu, dl)
+        return jp, tuple(derivs)
+
+    tol1 = 1e-12
+    tol2 = 1e-5
+    tol3 = 1e-9
+
+    dv0 = vp0 - vp1
+    dv = dv0 + (np.abs(dv0) < tol1) * tol1
+    series_v = np.abs(dv0) < tol2
+
+    efpp1 = -efp1
+    defp = efpp1 + efp0
+    series_f = np.abs(defp) < tol3
+
+    # exponentials shared by the current and its derivatives
+    emv0 = exp(-vp0)
+    emdv = exp(-dv)
+    ep1 = exp(efpp1)
+    em = np.expm1(-defp)
+    ep0 = ep1 * (1 + em)
+
+    # ep1 * (1 - exp(efpp0 - efpp1)) and its Taylor expansion
+    A = np.where(series_f, ep1 * defp, -ep1 * em)
+
+    # Bernoulli factor of the Scharfetter-Gummel scheme and its Taylor expansion
+    q = 6 - 3 * dv0 + dv0**2
+    S = np.where(series_v, 1. / (1 - .5 * dv0 + 1 / 6. * dv0**2), dv / (1 - emdv))
+    W = mu * emv0 / dl * S
+    C = mu * np.where(series_f, ep0 * defp, A) * emv0 / dl
+
+    jp = -A * W
+
+    defp_i = -np.where(series_f, ep1, ep0) * W
+    defp_ip1 = ep1 * W * np.where(series_f, 1 + defp, 1)
+    dv_i = C * np.where(series_v, -6 * (3 - dv0 + dv0**2) / q**2,
+                        (emdv - 1 + dv) / (1 - emdv)**2)
+    dv_ip1 = C * np.where(series_v, 6 * (2 * dv0 - 3) / q**2,
+                          (1 - emdv * (1 + dv)) / (1 - emdv)**2)
+
+    return jp, (defp_i, defp_ip1, dv_i, dv_ip1)
+
+
 def get_srh_rr_derivs(sys, n, p, n1, p1, tau_e, tau_h):
     ni2 = n1 * p1
     _np = n * p
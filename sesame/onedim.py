@@ -0,0 +1,512 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.linalg.lapack import dgbtrf, dgbtrs
+
+from .observables import *
+from .defects import defectsF, defectsJ
+from .stencil import get_plan
+from .workspace import Workspace
+from .coefficients import get_coefficients
+
+# Kernels of one-dimensional systems. The general kernels (getF, getFandJ,
+# getFandJ_eq) compute currents and fluxes in the y-direction between a site
+# and itself, which vanish when the system has a single row of sites. Here only
+# the x-direction is computed, and each current is computed once per link
+# between neighboring sites. With the unknowns (efn, efp, v) of each site
+# interleaved, the Jacobian is block tridiagonal, see
+# :class:`BlockTridiagonal`. The drift-diffusion-Poisson kernels
+# write their arrays in the buffers of a Workspace when one is given.
+#
+# The kernels also accept a BatchSystem, a stack of systems with the same
+# number of sites. The arrays of the stack have a trailing batch axis (one
+# column per system), so that the same expressions evaluate all the systems
+# at once.
+
+
+def _inverses(D):
+    # inverses of a stack of matrices of shape (batch, m, m), set to nan for
+    # the singular and non-finite matrices
+    try:
+        Dinv = np.linalg.inv(D)
+    except np.linalg.LinAlgError:
+        Dinv = np.full_like(D, np.nan)
+        for b in range(D.shape[0]):
+            try:
+                Dinv[b] = np.linalg.inv(D[b])
+            except np.linalg.LinAlgError:
+                pass
+    Dinv[~np.all(np.isfinite(Dinv), axis=(1, 2))] = np.nan
+    return Dinv
+
+
+class BlockTridiagonal():
+    """
+    Block tridiagonal matrix of a one-dimensional system. The row of blocks s
+    couples the m unknowns of site s to those of sites s-1, s and s+1.
+
+    The matrix is solved with a banded LU decomposition (LAPACK dgbtrf), in
+    O(N) operations: with interleaved unknowns the lower and upper bandwidths
+    are 2m-1.
+
+    The blocks can have a trailing batch axis, in which case the object holds
+    one matrix per system of a batch. These matrices are solved together by the
+    block Thomas algorithm, vectorized over the batch, and the right hand sides
+    have the shape (N*m, number of systems). The solutions of the singular
+    matrices of the batch are set to nan, the others are not affected.
+
+    Parameters
+    ----------
+    lower: numpy array of floats of shape (N, m, m) or (N, m, m, batch size)
+        Blocks coupling site s to site s-1 (the first block is not used).
+    diagonal: numpy array of floats of shape (N, m, m) or (N, m, m, batch size)
+        Blocks coupling site s to itself.
+    upper: numpy array of floats of shape (N, m, m) or (N, m, m, batch size)
+        Blocks coupling site s to site s+1 (the last block is not used).
+    """
+
+    def __init__(self, lower, diagonal, upper):
+        self.lower, self.diagonal, self.upper = lower, diagonal, upper
+        N, m = diagonal.shape[0], diagonal.shape[1]
+        self.shape = (N * m, N * m)
+        self.bandwidth = 2 * m - 1
+
+    def _coordinates(self):
+        # rows and columns of the entries of the three sets of blocks
+        N, m = self.diagonal.shape[0], self.diagonal.shape[1]
+        s = np.arange(N)[:, None, None]
+        a = np.arange(m)[None, :, None]
+        b = np.arange(m)[None, None, :]
+        rows = np.broadcast_to(m * s + a, (N, m, m))
+        return rows, m * s + b, m * (s - 1) + b, m * (s + 1) + b
+
+    def tocsr(self):
+        """
+        Return the matrix in compressed sparse row format.
+        """
+        rows, cols, cols_m1, cols_p1 = self._coordinates()
+        cols = np.broadcast_to(cols, rows.shape)
+        cols_m1 = np.broadcast_to(cols_m1, rows.shape)
+        cols_p1 = np.broadcast_to(cols_p1, rows.shape)
+        data = np.concatenate((self.lower[1:].ravel(), self.diagonal.ravel(),
+                               self.upper[:-1].ravel()))
+        r = np.concatenate((rows[1:].ravel(), rows.ravel(), rows[:-1].ravel()))
+        c = np.concatenate((cols_m1[1:].ravel(), cols.ravel(), cols_p1[:-1].ravel()))
+        return csr_matrix((data, (r, c)), shape=self.shape)
+
+    def dot(self, x):
+        """
+        Return the product of the matrix with a vector.
+        """
+        N, m = self.diagonal.shape[0], self.diagonal.shape[1]
+        batch = self.diagonal.shape[3:]
+        x = np.reshape(x, (N, m) + batch)
+        y = np.einsum('sab...,sb...->sa...', self.diagonal, x)
+        y[1:] += np.einsum('sab...,sb...->sa...', self.lower[1:], x[:-1])
+        y[:-1] += np.einsum('sab...,sb...->sa...', self.upper[:-1], x[1:])
+        return y.reshape((N * m,) + batch)
+
+    def factorize(self):
+        """
+        Compute the LU decomposition of the matrix.
+
+        Returns
+        -------
+        solve: function
+            Function returning the solution x of A * x = f for a right hand
+            side f.
+        """
+        # the equations have very different scales (surface recombination at
+        # the contacts, currents and Poisson), scale each row by its largest
+        # entry
+        scale = np.maximum(abs(self.diagonal).max(axis=2),
+                           np.maximum(abs(self.lower).max(axis=2),
+                                      abs(self.upper).max(axis=2)))
+        scale[scale == 0] = 1
+        scale = 1. / scale
+        if self.diagonal.ndim > 3:
+            return self._thomas(scale)
+
+        kl = ku = self.bandwidth
+        # LAPACK band storage with kl additional rows for the fill-in of the
+        # partial pivoting: A[i, j] is stored in ab[kl + ku + i - j, j]
+        ab = np.zeros((2 * kl + ku + 1, self.shape[0]))
+        rows, cols, cols_m1, cols_p1 = self._coordinates()
+        s = scale[:, :, None]
+        ab[kl + ku + rows - cols, cols] = s * self.diagonal
+        ab[kl + ku + rows[1:] - cols_m1[1:], cols_m1[1:]] = s[1:] * self.lower[1:]
+        ab[kl + ku + rows[:-1] - cols_p1[:-1], cols_p1[:-1]] = s[:-1] * self.upper[:-1]
+        scale = scale.ravel()
+
+        lu, piv, info = dgbtrf(ab, kl, ku, overwrite_ab=1)
+        if info != 0:
+            raise RuntimeError("Factor is exactly singular")
+
+        def solve(f, eta=None):
+            x, info = dgbtrs(lu, kl, ku, scale * f, piv)
+            return x
+
+        return solve
+
+    def _thomas(self, scale):
+        # Block Thomas algorithm for a batch of matrices: elimination of the
+        # lower blocks site by site, with all the systems of the batch handled
+        # at once. The arrays are reordered as (N, batch, m, m).
+        N, m = self.diagonal.shape[0], self.diagonal.shape[1]
+        s = scale[:, :, None]
+        L = np.moveaxis(s * self.lower, 3, 1)
+        D = np.moveaxis(s * self.diagonal, 3, 1)
+        U = np.moveaxis(s * self.upper, 3, 1)
+        scale = np.moveaxis(scale, 2, 1)
+
+        # inverses of the diagonal blocks after elimination, and upper blocks
+        # multiplied by them. The systems of the batch are independent: a
+        # singular matrix only gives nan in the solution of its own system.
+        Dinv = np.empty_like(D)
+        C = np.empty_like(U)
+        Dinv[0] = _inverses(D[0])
+        C[0] = Dinv[0] @ U[0]
+        for i in range(1, N):
+            Dinv[i] = _inverses(D[i] - L[i] @ C[i-1])
+            C[i] = Dinv[i] @ U[i]
+
+        def solve(f, eta=None):
+            b = scale * np.moveaxis(np.reshape(f, (N, m, -1)), 2, 1)
+            y = np.empty_like(b)
+            y[0] = np.einsum('bij,bj->bi', Dinv[0], b[0])
+            for i in range(1, N):
+                y[i] = np.einsum('bij,bj->bi', Dinv[i],
+                                 b[i] - np.einsum('bij,bj->bi', L[i], y[i-1]))
+            for i in range(N-2, -1, -1):
+                y[i] -= np.einsum('bij,bj->bi', C[i], y[i+1])
+            return np.moveaxis(y, 1, 2).reshape(np.shape(f))
+
+        return solve
+
+
+class BatchSystem():
+    """
+    Stack of one-dimensional systems with the same number of sites, whose
+    equations are evaluated together by the one-dimensional kernels, see
+    :meth:`sesame.solvers.Solver.solve_batch`.
+
+    The material parameters and the generation of the systems are stacked in
+    arrays of shape (number of sites, number of systems). The systems must
+    have the same types of contacts.
+
+    Parameters
+    ----------
+    systems: list of Builder
+        The discretized one-dimensional systems.
+    """
+
+    # site-dependent parameters of the systems used by the kernels
+    _site_attributes = ['Nc', 'Nv', 'Eg', 'bl', 'ni', 'rho', 'g', 'epsilon',
+                        'mu_e', 'mu_h', 'tau_e', 'tau_h', 'n1', 'p1', 'B', 'Cn',
+                        'Cp', 'mass_e', 'mass_h']
+
+    def __init__(self, systems):
+        systems = list(systems)
+        if len(systems) == 0:
+            raise ValueError("The batch of systems is empty.")
+        ref = systems[0]
+        for system in systems:
+            if system.dimension != 1 or system.nx != ref.nx:
+                raise ValueError("The systems of a batch must be one-dimensional "\
+                                 "with the same number of sites.")
+            if list(system.contacts_bcs) != list(ref.contacts_bcs):
+                raise ValueError("The systems of a batch must have the same "\
+                                 "types of contacts.")
+        self.systems = systems
+        self.size = len(systems)
+
+        self.nx, self.ny, self.dimension = ref.nx, 1, 1
+        self.xpts, self.ypts = ref.xpts, ref.ypts
+        self.contacts_bcs = ref.contacts_bcs
+
+        for name in self._site_attributes:
+            setattr(self, name, np.stack([getattr(s, name) for s in systems], axis=-1))
+        self.dx = np.stack([s.dx for s in systems], axis=-1)
+        self.dy = ref.dy
+        self.Scn = np.array([s.Scn for s in systems]).T
+        self.Scp = np.array([s.Scp for s in systems]).T
+
+    def subset(self, members):
+        """
+        Return the batch made of some of the systems.
+
+        Parameters
+        ----------
+        members: list of integers
+            Indices of the systems in the batch.
+        """
+        return BatchSystem([self.systems[b] for b in members])
+
+
+def _members(sys):
+    # systems with their columns in the arrays of the kernels
+    if isinstance(sys, BatchSystem):
+        return [(member, np.s_[:, b]) for b, member in enumerate(sys.systems)]
+    return [(sys, np.s_[...])]
+
+
+def getF_1D(sys, v, efn, efp, veq, workspace=None):
+    # Residual of the drift-diffusion-Poisson equations of a one-dimensional
+    # system. See getF for the organization of the right hand side vector.
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    ws = Workspace() if workspace is None else workspace
+    N = sys.nx
+
+    # right hand side vector (with the batch axis of a stack of systems)
+    batch = np.shape(v)[1:]
+    vec = ws.zeros('getF', (3 * N,) + batch)
+
+    # carrier densities
+    n, p = coeffs.densities(v, efn, efp, ws)
+
+    # equilibrium carrier densities
+    n_eq, p_eq = coeffs.equilibrium(veq)
+
+    # bulk charges
+    rho = np.subtract(sys.rho, n, out=ws.empty('rho', n.shape))
+    rho += p
+
+    # recombination rates
+    r = get_bulk_rr(sys, n, p)
+
+    # charge defects
+    for member, b in _members(sys):
+        if len(member.defects_list) != 0:
+            defectsF(member, member.defects_list, n[b], p[b], rho[b], r[b])
+
+    # currents between the sites i and i+1, for 0 <= i < N-1
+    links = np.arange(N - 1)
+    jn = get_jn(sys, efn, v, links, links + 1, sys.dx)
+    jp = get_jp(sys, efp, v, links, links + 1, sys.dx)
+
+    # inside the system: 0 < i < N-1
+    sites, sm1, sp1 = plan.sites, plan.sm1, plan.sp1
+    dx, dxm1, dxbar = plan.dx, plan.dxm1, plan.dxbar
+
+    vec[3 * sites] = (jn[1:] - jn[:-1]) / dxbar + sys.g[sites] - r[sites]
+    vec[3 * sites + 1] = (jp[1:] - jp[:-1]) / dxbar + r[sites] - sys.g[sites]
+
+    eps_m1x = coeffs.eps_m1x
+    eps_p1x = coeffs.eps_p1x
+    vec[3 * sites + 2] = (eps_m1x * (v[sites] - v[sm1]) / dxm1 \
+                          - eps_p1x * (v[sp1] - v[sites]) / dx) / dxbar - rho[sites]
+
+    # left contact (Dirichlet BC for v)
+    s = 0
+    vec[3 * s] = jn[0] - sys.Scn[0] * (n[s] - n_eq[s])
+    vec[3 * s + 1] = jp[0] + sys.Scp[0] * (p[s] - p_eq[s])
+
+    # right contact (Dirichlet BC for v)
+    s = N - 1
+    vec[3 * s] = jn[-1] + sys.Scn[1] * (n[s] - n_eq[s])
+    vec[3 * s + 1] = jp[-1] - sys.Scp[1] * (p[s] - p_eq[s])
+
+    return vec
+
+
+def getFandJ_1D(sys, v, efn, efp, veq, workspace=None):
+    # Residual and Jacobian of the drift-diffusion-Poisson equations of a
+    # one-dimensional system. The Jacobian is returned as a BlockTridiagonal
+    # matrix, with blocks indexed by (equation, unknown) in the order
+    # (efn, efp, v).
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    ws = Workspace() if workspace is None else workspace
+    N = sys.nx
+
+    # right hand side vector and blocks of the Jacobian (with the batch axis
+    # of a stack of systems). The blocks are not taken from the workspace, the
+    # Jacobian can be kept by the caller after the next evaluation.
+    batch = np.shape(v)[1:]
+    vec = ws.zeros('getFandJ', (3 * N,) + batch)
+    L = np.zeros((N, 3, 3) + batch)
+    D = np.zeros((N, 3, 3) + batch)
+    U = np.zeros((N, 3, 3) + batch)
+
+    # carrier densities
+    n, p = coeffs.densities(v, efn, efp, ws)
+
+    # equilibrium carrier densities
+    n_eq, p_eq = coeffs.equilibrium(veq)
+
+    # bulk charges and their derivatives
+    rho = np.subtract(sys.rho, n, out=ws.empty('rho', n.shape))
+    rho += p
+    drho_defn_s = np.negative(n, out=ws.empty('drho_defn', n.shape))
+    drho_defp_s = np.negative(p, out=ws.empty('drho_defp', n.shape))
+    drho_dv_s = np.subtract(drho_defn_s, p, out=ws.empty('drho_dv', n.shape))
+
+    # bulk recombination rates and their derivatives
+    r = get_bulk_rr(sys, n, p)
+    dr_defn_s, dr_defp_s, dr_dv_s = get_bulk_rr_derivs(sys, n, p)
+
+    # charge defects
+    for member, b in _members(sys):
+        if len(member.defects_list) != 0:
+            defectsF(member, member.defects_list, n[b], p[b], rho[b], r[b])
+            defectsJ(member, member.defects_list, n[b], p[b], drho_dv_s[b], drho_defn_s[b],
+                     drho_defp_s[b], dr_defn_s[b], dr_defp_s[b], dr_dv_s[b])
+
+    # currents between the sites i and i+1, for 0 <= i < N-1, and their
+    # derivatives with respect to (ef_i, ef_ip1, v_i, v_ip1)
+    links = np.arange(N - 1)
+    jn, djn = get_jn_and_derivs(sys, efn, v, links, links + 1, sys.dx)
+    jp, djp = get_jp_and_derivs(sys, efp, v, links, links + 1, sys.dx)
+
+    ###########################################################################
+    #                  inside the system: 0 < i < N-1                         #
+    ###########################################################################
+    sites, sm1, sp1 = plan.sites, plan.sm1, plan.sp1
+    dx, dxm1, dxbar = plan.dx, plan.dxm1, plan.dxbar
+
+    # ----------------------------- fn and fp ---------------------------------
+    for row, j, (dj_def_i, dj_def_ip1, dj_dv_i, dj_dv_ip1) in ((0, jn, djn), (1, jp, djp)):
+        # currents j_s (between s and s+1) and j_sm1 (between s-1 and s)
+        vec[3 * sites + row] = (j[1:] - j[:-1]) / dxbar
+
+        L[sites, row, row] = - dj_def_i[:-1] / dxbar
+        L[sites, row, 2] = - dj_dv_i[:-1] / dxbar
+        D[sites, row, row] = (dj_def_i[1:] - dj_def_ip1[:-1]) / dxbar
+        D[sites, row, 2] = (dj_dv_i[1:] - dj_dv_ip1[:-1]) / dxbar
+        U[sites, row, row] = dj_def_ip1[1:] / dxbar
+        U[sites, row, 2] = dj_dv_ip1[1:] / dxbar
+
+    vec[3 * sites] += sys.g[sites] - r[sites]
+    D[sites, 0, 0] -= dr_defn_s[sites]
+    D[sites, 0, 1] -= dr_defp_s[sites]
+    D[sites, 0, 2] -= dr_dv_s[sites]
+
+    vec[3 * sites + 1] += r[sites] - sys.g[sites]
+    D[sites, 1, 0] += dr_defn_s[sites]
+    D[sites, 1, 1] += dr_defp_s[sites]
+    D[sites, 1, 2] += dr_dv_s[sites]
+
+    # ------------------------------ fv ----------------------------------------
+    eps_m1x = coeffs.eps_m1x
+    eps_p1x = coeffs.eps_p1x
+
+    vec[3 * sites + 2] = (eps_m1x * (v[sites] - v[sm1]) / dxm1 \
+                          - eps_p1x * (v[sp1] - v[sites]) / dx) / dxbar - rho[sites]
+
+    L[sites, 2, 2] = -eps_m1x / (dxm1 * dxbar)
+    D[sites, 2, 0] = - drho_defn_s[sites]
+    D[sites, 2, 1] = - drho_defp_s[sites]
+    D[sites, 2, 2] = eps_m1x / (dxm1 * dxbar) + eps_p1x / (dx * dxbar) - drho_dv_s[sites]
+    U[sites, 2, 2] = -eps_p1x / (dx * dxbar)
+
+    ###########################################################################
+    #                       left contact: i = 0                               #
+    ###########################################################################
+    s = 0
+    vec[3 * s] = jn[0] - sys.Scn[0] * (n[s] - n_eq[s])
+    D[s, 0, 0] = djn[0][0] - sys.Scn[0] * n[s]
+    D[s, 0, 2] = djn[2][0] - sys.Scn[0] * n[s]
+    U[s, 0, 0] = djn[1][0]
+    U[s, 0, 2] = djn[3][0]
+
+    vec[3 * s + 1] = jp[0] + sys.Scp[0] * (p[s] - p_eq[s])
+    D[s, 1, 1] = djp[0][0] - sys.Scp[0] * p[s]
+    D[s, 1, 2] = djp[2][0] - sys.Scp[0] * p[s]
+    U[s, 1, 1] = djp[1][0]
+    U[s, 1, 2] = djp[3][0]
+
+    # Dirichlet BC
+    D[s, 2, 2] = 1
+
+    ###########################################################################
+    #                      right contact: i = N-1                             #
+    ###########################################################################
+    s = N - 1
+    vec[3 * s] = jn[-1] + sys.Scn[1] * (n[s] - n_eq[s])
+    L[s, 0, 0] = djn[0][-1]
+    L[s, 0, 2] = djn[2][-1]
+    D[s, 0, 0] = djn[1][-1] + sys.Scn[1] * n[s]
+    D[s, 0, 2] = djn[3][-1] + sys.Scn[1] * n[s]
+
+    vec[3 * s + 1] = jp[-1] - sys.Scp[1] * (p[s] - p_eq[s])
+    L[s, 1, 1] = djp[0][-1]
+    L[s, 1, 2] = djp[2][-1]
+    D[s, 1, 1] = djp[1][-1] + sys.Scp[1] * p[s]
+    D[s, 1, 2] = djp[3][-1] + sys.Scp[1] * p[s]
+
+    # Dirichlet BC
+    D[s, 2, 2] = 1
+
+    return vec, BlockTridiagonal(L, D, U)
+
+
+def getFandJ_eq_1D(sys, v, efn=0, efp=0, contacts_bcs=None):
+    # Poisson equation of a one-dimensional system, see getFandJ_eq. The
+    # Jacobian is tridiagonal, returned as a BlockTridiagonal matrix with 1x1
+    # blocks.
+    if contacts_bcs is None:
+        contacts_bcs = sys.contacts_bcs
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    N = sys.nx
+
+    # right hand side vector and diagonals of the Jacobian (with the batch
+    # axis of a stack of systems)
+    batch = np.shape(v)[1:]
+    vec = np.zeros((N,) + batch)
+    L = np.zeros((N, 1, 1) + batch)
+    D = np.zeros((N, 1, 1) + batch)
+    U = np.zeros((N, 1, 1) + batch)
+
+    # carrier densities
+    n = np.exp(efn + v + coeffs.vn)
+    p = np.exp(-efp - v - coeffs.vp)
+
+    # bulk charges
+    rho = sys.rho - n + p
+    drho_dv = -n - p
+
+    # charge defects
+    for member, b in _members(sys):
+        if len(member.defects_list) != 0:
+            defectsF(member, member.defects_list, n[b], p[b], rho[b])
+            defectsJ(member, member.defects_list, n[b], p[b], drho_dv[b])
+
+    # inside the system: 0 < i < N-1
+    sites, sm1, sp1 = plan.sites, plan.sm1, plan.sp1
+    dx, dxm1, dxbar = plan.dx, plan.dxm1, plan.dxbar
+
+    eps_m1x = coeffs.eps_m1x
+    eps_p1x = coeffs.eps_p1x
+
+    vec[sites] = (eps_m1x * (v[sites] - v[sm1]) / dxm1 \
+                  - eps_p1x * (v[sp1] - v[sites]) / dx) / dxbar - rho[sites]
+
+    L[sites, 0, 0] = -eps_m1x / (dxm1 * dxbar)
+    D[sites, 0, 0] = eps_m1x / (dxm1 * dxbar) + eps_p1x / (dx * dxbar) - drho_dv[sites]
+    U[sites, 0, 0] = -eps_p1x / (dx * dxbar)
+
+    # left contact
+    if contacts_bcs[0] == "Neutral":
+        # no surface charges
+        vec[0] = v[1] - v[0]
+        D[0, 0, 0], U[0, 0, 0] = -1, 1
+    else:
+        # Dirichlet BC
+        D[0, 0, 0] = 1
+
+    # right contact
+    if contacts_bcs[1] == "Neutral":
+        # no surface charges
+        vec[N - 1] = v[N - 2] - v[N - 3]
+        L[N - 1, 0, 0], D[N - 1, 0, 0] = -1, 1
+    else:
+        # Dirichlet BC
+        D[N - 1, 0, 0] = 1
+
+    return vec, BlockTridiagonal(L, D, U)
@@ -4,6 +4,7 @@
 # LICENSE.rst found in the top-level directory of this distribution.
 
 import numpy as np
+from functools import partial
 from scipy.io import savemat
 from . import analyzer
 from .utils import save_sim
@@ -11,15 +12,22 @@ from .utils import save_sim
 from .analyzer import Analyzer
 
 import scipy.sparse.linalg as lg
-from scipy.sparse import coo_matrix, csr_matrix
+from scipy.optimize import brentq
+from scipy.sparse import diags, tril
 from .getFandJ_eq import getFandJ_eq
+from .getFandJ import getFandJ
 from .getF import getF
-from .jacobian import getJ
+from .onedim import getF_1D, getFandJ_1D, getFandJ_eq_1D, BatchSystem, BlockTridiagonal
+from .structured import getF_2D, getFandJ_2D, getFandJ_eq_2D
+from .stencil import get_plan
+from .workspace import Workspace
+from .multigrid import Multigrid
+from .gummel import get_continuity_n, get_continuity_p
 
 import logging
 logging.basicConfig(level=logging.DEBUG, format='%(levelname)s: %(message)s')
 
-__all__ = ['solve', 'IVcurve']
+__all__ = ['solve', 'IVcurve', 'solve_batch', 'generation_ramp', 'figures_of_merit']
 
 # check if MUMPS is available
 mumps_available = False
@@ -29,7 +37,38 @@ try:
 except:
     pass
 
+
+def _krylov(method, A, b, rtol, M, **kwargs):
+    # The relative tolerance of the Krylov methods of scipy was renamed from
+    # tol to rtol in scipy 1.12
+    try:
+        return method(A, b, rtol=rtol, atol=0., M=M, **kwargs)
+    except TypeError:
+        return method(A, b, tol=rtol, atol=0., M=M, **kwargs)
+
         
+def _block_jacobi(A, m=3):
+    # Block Jacobi preconditioner of A: the inverses of the m x m diagonal
+    # blocks, applied to the unknowns of each site. Return None if a diagonal
+    # block is singular.
+    if A.format != 'bsr' or A.blocksize != (m, m):
+        A = A.tobsr(blocksize=(m, m))
+    n = A.shape[0] // m
+    rows = np.repeat(np.arange(n), np.diff(A.indptr))
+    D = np.zeros((n, m, m))
+    diagonal = A.indices == rows
+    D[rows[diagonal]] = A.data[diagonal]
+    try:
+        Dinv = np.linalg.inv(D)
+    except np.linalg.LinAlgError:
+        return None
+
+    def apply(x):
+        return np.einsum('sij,sj->si', Dinv, np.reshape(x, (n, m))).ravel()
+
+    return lg.LinearOperator(A.shape, apply)
+
+
 class NewtonError(Exception):
     pass
 
@@ -58,16 +97,232 @@ class Solver():
     use_mumps: boolean
         Flag for the use of the MUMPS library if available. The flag is set to
         True by default. If the MUMPS library is absent, the flag has no effect.
+    iterative: boolean
+        Flag for the use of a preconditioned Krylov method instead of a direct
+        solver for the linear systems of the Newton-Raphson scheme. The flag is
+        set to False by default. When the Krylov method fails to converge, the
+        linear system is solved with the direct solver.
+    iterative_method: string
+        Krylov method used when iterative is True: 'gmres' (default) or
+        'bicgstab'. The options iterative_method, forcing and preconditioner
+        require iterative=True.
+    iterative_tol: float
+        Relative accuracy of the linear solves of the Krylov method. With
+        adaptive forcing terms, this is the tightest accuracy requested.
+    forcing: boolean
+        Adapt the accuracy of the linear solves to the progress of the
+        Newton-Raphson scheme (inexact Newton method with the forcing terms of
+        Eisenstat and Walker). Set to True by default.
+    ilu_drop: float
+        Drop tolerance of the incomplete LU factorization used as
+        preconditioner.
+    ilu_fill: float
+        Upper bound of the ratio between the number of nonzeros of the
+        incomplete LU factorization and of the Jacobian.
+    preconditioner: string
+        Preconditioner of the Krylov method: 'ilu' (default) for an
+        incomplete LU factorization, 'block_jacobi' for the inverses of the
+        3x3 diagonal blocks coupling the unknowns of each site, or
+        'multigrid' for a geometric multigrid V-cycle on the grid of the
+        system (see :class:`sesame.multigrid.Multigrid`). The multigrid cycle
+        is only a good approximation of the inverse of the Jacobian close to
+        the solution: start from a good guess, e.g. the previous point of an
+        IV curve.
+    equilibrium_solver: string
+        Linear solver of the Poisson equation at thermal equilibrium (and of
+        the Poisson steps of the Gummel iterations). With 'lu' (default), the
+        Jacobian is solved with the general LU decomposition. With 'ldlt' and
+        'cg', the contact rows are eliminated and the other rows are scaled by
+        the area of their control volume, which makes the system symmetric
+        positive definite. 'ldlt' then uses MUMPS for symmetric positive
+        definite matrices (or SuperLU in symmetric mode), 'cg' the conjugate
+        gradient method preconditioned by an incomplete factorization, and
+        'multigrid' geometric multigrid V-cycles, the last two with the
+        accuracy iterative_tol. The banded solver of one-dimensional systems
+        is not affected.
+    reuse_jacobian: boolean
+        Keep the factorization of the Jacobian and reuse it for the following
+        Newton steps (chord method) and for the next call of the solver on the
+        same system. Set to False by default.
+    reuse_rate: float
+        The Jacobian is computed and factorized again when the ratio of the
+        errors of two successive Newton steps exceeds this value (0.5 by
+        default), when a step is damped, or when a step computed with the old
+        Jacobian does not reduce the error.
+    globalization: string
+        Strategy used to ensure the convergence of the Newton-Raphson scheme
+        far from the solution. With 'damping' (default), the large components
+        of the Newton steps are reduced logarithmically. With 'linesearch', the
+        damped steps are further shortened by a backtracking line search until
+        the norm of the residual decreases.
+    gummel: boolean
+        Start the out of equilibrium solutions with Gummel iterations: the
+        Poisson equation is solved at fixed quasi-Fermi levels, then the
+        linear continuity equations for the electrons and the holes, which is
+        repeated until the updates are smaller than gummel_switch. The coupled
+        Newton-Raphson scheme is then used to converge. Set to False by
+        default.
+    gummel_switch: float
+        Largest update of the Gummel iterations at which the coupled
+        Newton-Raphson scheme takes over (1e-2 by default).
+    gummel_maxiter: integer
+        Maximum number of Gummel iterations, after which the coupled
+        Newton-Raphson scheme takes over anyway.
+    anderson: integer
+        Number of previous Gummel iterations used by Anderson acceleration. The
+        default value 0 disables the acceleration, other values require
+        gummel=True.
+    banded: boolean
+        Use the dedicated kernels of one-dimensional systems, whose Jacobian is
+        block tridiagonal and solved by a banded LU decomposition in O(N)
+        operations. The other linear solver options do not apply to these
+        systems. Set to True by default.
+    structured: boolean
+        Compute the residual and the Jacobian with the kernels written on the
+        (ny, nx) grid of the system, which use slices of the grid instead of
+        gathering the neighbors of every site. Set to False to use the
+        original site-list kernels, e.g. for validation. Set to True by
+        default.
+    bsr: boolean
+        Assemble the Jacobian in block sparse row format, with the 3x3 blocks
+        coupling the unknowns (efn, efp, v) of two sites, which needs less
+        index memory and speeds up the products of the Krylov methods. Set to
+        False by default.
+    layout: string
+        Storage order of the unknowns of the drift-diffusion-Poisson equations.
+        With 'interleaved' (default), the unknowns (efn, efp, v) of each site
+        are stored next to each other. With 'fields', the arrays efn, efp and v
+        are stored one after the other, so that the kernels receive contiguous
+        arrays, and the Jacobian is permuted accordingly. The field-major
+        layout requires the structured kernels, and cannot be combined with
+        the 3x3 blocks of the bsr format or of the block Jacobi
+        preconditioner. One-dimensional systems solved with the banded kernels
+        always use the interleaved layout.
+    homotopy_tol: float
+        Accepted error of the Newton-Raphson scheme for the intermediate
+        values of the homotopy parameter (1 by default).
+    homotopy_min_step: float
+        Smallest step of the homotopy parameter. When a homotopy is requested
+        (htp larger than 1 or a list of values), the step is cut in two each
+        time a homotopy problem cannot be solved, and the solver gives up when
+        it would fall below this value (1/64 by default).
 
     Attributes
     ----------
     equilibrium: numpy array of floats
         Electrostatic potential computed at thermal equilibrium.
+    batch_equilibrium: numpy array of floats
+        Electrostatic potentials computed at thermal equilibrium for the last
+        batch of systems (one column per system).
+    step_lengths: list of floats
+        Fractions of the (damped) Newton steps taken during the last call to
+        the Newton-Raphson scheme.
+    homotopy: list of floats
+        Values of the homotopy parameter reached during the last call to the
+        Newton-Raphson scheme. The list can be passed as the htp argument of a
+        similar problem to start from the same schedule.
     """
 
-    def __init__(self, use_mumps=True):
+    def __init__(self, use_mumps=True, iterative=False, iterative_method='gmres',
+                 iterative_tol=1e-6, forcing=True, ilu_drop=1e-4, ilu_fill=10,
+                 preconditioner='ilu', equilibrium_solver='lu',
+                 reuse_jacobian=False, reuse_rate=0.5, globalization='damping',
+                 gummel=False, gummel_switch=1e-2, gummel_maxiter=100, anderson=0,
+                 banded=True, structured=True, bsr=False, layout='interleaved',
+                 homotopy_tol=1., homotopy_min_step=1./64):
         self.equilibrium = None
+        # MUMPS contexts kept alive between linear solves, one per size,
+        # number of entries and symmetry of the matrices (equilibrium and
+        # drift-diffusion problems, continuity equations of the Gummel
+        # iterations), created first so that a solver rejected below can be
+        # collected
+        self._mumps_contexts = {}
         self.use_mumps = use_mumps
+        self.iterative = iterative
+        if iterative_method not in ('gmres', 'bicgstab'):
+            raise ValueError("Unknown Krylov method '{0}', use 'gmres' or 'bicgstab'."\
+                             .format(iterative_method))
+        if not iterative and (iterative_method != 'gmres' or not forcing):
+            raise ValueError("The options iterative_method and forcing require iterative=True.")
+        self.iterative_method = iterative_method
+        if not 0 < iterative_tol < 1:
+            raise ValueError("The accuracy iterative_tol must be between 0 and 1.")
+        self.iterative_tol = iterative_tol
+        self.forcing = forcing
+        if ilu_drop < 0 or ilu_fill <= 0:
+            raise ValueError("The drop tolerance ilu_drop must be positive or zero, "
+                             "and the fill factor ilu_fill positive.")
+        self.ilu_drop = ilu_drop
+        self.ilu_fill = ilu_fill
+        self.preconditioner = preconditioner
+        if preconditioner not in ('ilu', 'block_jacobi', 'multigrid'):
+            raise ValueError("Unknown preconditioner '{0}', use 'ilu', 'block_jacobi' or "
+                             "'multigrid'.".format(preconditioner))
+        if not iterative and preconditioner != 'ilu':
+            raise ValueError("The option preconditioner requires iterative=True.")
+        if equilibrium_solver not in ('lu', 'ldlt', 'cg', 'multigrid'):
+            raise ValueError("Unknown equilibrium solver '{0}', use 'lu', 'ldlt', 'cg' or "
+                             "'multigrid'.".format(equilibrium_solver))
+        self.equilibrium_solver = equilibrium_solver
+        self.reuse_jacobian = reuse_jacobian
+        if reuse_rate <= 0:
+            raise ValueError("The ratio reuse_rate must be positive.")
+        self.reuse_rate = reuse_rate
+        if globalization not in ('damping', 'linesearch'):
+            raise ValueError("Unknown globalization '{0}', use 'damping' or 'linesearch'."\
+                             .format(globalization))
+        self.globalization = globalization
+        self.gummel = gummel
+        if gummel_switch <= 0 or gummel_maxiter < 1:
+            raise ValueError("The update gummel_switch must be positive, and "
+                             "gummel_maxiter at least 1.")
+        self.gummel_switch = gummel_switch
+        self.gummel_maxiter = gummel_maxiter
+        if anderson < 0:
+            raise ValueError("The number of iterations anderson must be positive or zero.")
+        if anderson > 0 and not gummel:
+            raise ValueError("Anderson acceleration requires gummel=True.")
+        self.anderson = anderson
+        self.banded = banded
+        self.structured = structured
+        self.bsr = bsr
+        if layout not in ('interleaved', 'fields'):
+            raise ValueError("Unknown layout '{0}', use 'interleaved' or 'fields'."\
+                             .format(layout))
+        if layout == 'fields' and (not structured or bsr or preconditioner == 'block_jacobi'):
+            raise ValueError("The field-major layout requires the structured kernels "
+                             "and cannot be combined with bsr or block_jacobi.")
+        self.layout = layout
+        if homotopy_tol <= 0 or not 0 < homotopy_min_step <= 1:
+            raise ValueError("The error homotopy_tol must be positive, and the step "
+                             "homotopy_min_step between 0 and 1.")
+        self.homotopy_tol = homotopy_tol
+        self.homotopy_min_step = homotopy_min_step
+        # equilibrium potentials of the last batch of systems
+        self.batch_equilibrium = None
+        # lengths of the steps taken by the last call to the Newton-Raphson
+        # scheme
+        self.step_lengths = []
+        # values of the homotopy parameter reached by the last call to the
+        # Newton-Raphson scheme
+        self.homotopy = []
+        # last factorization of the Jacobian as (system, size, solve function)
+        self._factorization = None
+        # buffers of the kernels during a call to the Newton-Raphson scheme
+        self._workspace = None
+
+    def __del__(self):
+        self.clear_mumps()
+
+    def clear_mumps(self):
+        """
+        Release the MUMPS contexts (and the symbolic analysis they hold) kept
+        by the solver. They are rebuilt at the next linear solve.
+        """
+        for ctx, _, _, _ in self._mumps_contexts.values():
+            ctx.destroy()
+        self._mumps_contexts = {}
+        self._factorization = None
     
     def make_guess(self, system):
         # Make a linear assumption based on Dirichlet contacts
@@ -133,8 +388,13 @@ class Solver():
         verbose: boolean
             The solver returns the step number and the associated error at every
             step if set to True (default).
-        htp: integer
-            Number of homotopic Newton loops to perform.
+        htp: integer or list of floats
+            Number of homotopic Newton loops to start with, or values of the
+            homotopy parameter to reach before the original problem (e.g. the
+            attribute homotopy of a previous solve). The steps of the
+            homotopy parameter are then adapted to the difficulty of the
+            problems. With htp=1 (default), the original problem is solved
+            directly and no homotopy is attempted if it fails.
 
         Returns
         -------
@@ -178,22 +438,146 @@ class Solver():
         if compute == 'all':
             # array to pass to Newton routine
             x = np.zeros((3*system.nx*system.ny,), dtype=np.float64)
+            efn, efp, v = self._fields(system, x)
             if guess is None: # I will try with equilibrium
-                x[2::3] = np.copy(self.equilibrium)
+                v[:] = self.equilibrium
             else:
-                x[0::3] = guess['efn']
-                x[1::3] = guess['efp']
-                x[2::3] = guess['v']
+                efn[:] = guess['efn']
+                efp[:] = guess['efp']
+                v[:] = guess['v']
+
+            # Decoupled iterations to get close to the solution
+            if self.gummel:
+                x = self._gummel(system, x, tol=tol, verbose=verbose)
 
             # Compute solution (Newton returns an array)
             x = self._newton(system, x, tol=tol, periodic_bcs=periodic_bcs,\
                              maxiter=maxiter, verbose=verbose, htp=htp)
 
             if x is not None:
-                return {'efn': x[0::3], 'efp': x[1::3], 'v': x[2::3]}
+                efn, efp, v = self._fields(system, x)
+                return {'efn': efn, 'efp': efp, 'v': v}
             else:
                 return None
 
+    def solve_batch(self, systems, compute='all', guess=None, tol=1e-6,
+                    maxiter=300, verbose=True):
+        """
+        Solve the drift diffusion Poisson equations of several one-dimensional
+        systems with the same number of sites at once. The residuals and
+        Jacobians of all the systems are computed together, the linear systems
+        are solved as a batch, and the systems which have converged are left
+        out of the next Newton-Raphson steps. As for :meth:`solve`, the
+        equilibrium electrostatic potentials are computed first if needed and
+        kept for further computations.
+
+        Parameters
+        ----------
+        systems: list of Builder
+            The discretized one-dimensional systems, with the same number of
+            sites and the same types of contacts.
+        compute: string
+            Set to 'all' to solve the full drift-diffusion-Poisson equations, or
+            to 'Poisson' to only solve the Poisson equation. Default is set to
+            'all'.
+        guess: list of dictionaries of numpy arrays of floats
+            Initial guesses for each system, see :meth:`solve`.
+        tol: float
+            Accepted error made by the Newton-Raphson scheme.
+        maxiter: integer
+            Maximum number of steps taken by the Newton-Raphson scheme.
+        verbose: boolean
+            The solver returns the step number, the largest error and the number
+            of systems left at every step if set to True (default).
+
+        Returns
+        -------
+        solutions: list of dictionaries with numpy arrays of floats
+            Solutions of the systems, in the format returned by :meth:`solve`.
+            The solution is None for the systems which did not converge.
+        """
+        batch = BatchSystem(systems)
+        N = batch.nx
+
+        if compute == 'Poisson':
+            self.batch_equilibrium = None
+
+        if self.batch_equilibrium is None:
+            if verbose:
+                logging.info("Solving for the equilibrium electrostatic potentials")
+            if guess is None:
+                v = np.stack([self.make_guess(s) for s in batch.systems], axis=-1)
+            else:
+                v = np.stack([g['v'] if type(g) is dict else g for g in guess], axis=-1)
+            self.batch_equilibrium = self._newton_batch(batch, v, None, tol=tol,
+                                                        maxiter=maxiter, verbose=verbose)
+
+        veq = self.batch_equilibrium
+        if compute == 'Poisson':
+            return [None if np.isnan(veq[0, b]) else
+                    {'efn': np.zeros((N,)), 'efp': np.zeros((N,)), 'v': np.copy(veq[:, b])}
+                    for b in range(batch.size)]
+
+        # array to pass to the Newton routine, one column per system
+        x = np.zeros((3*N, batch.size), dtype=np.float64)
+        if guess is None:
+            x[2::3] = veq
+        else:
+            x[0::3] = np.stack([g['efn'] for g in guess], axis=-1)
+            x[1::3] = np.stack([g['efp'] for g in guess], axis=-1)
+            x[2::3] = np.stack([g['v'] for g in guess], axis=-1)
+
+        x = self._newton_batch(batch, x, veq, tol=tol, maxiter=maxiter, verbose=verbose)
+
+        return [None if np.isnan(x[0, b]) else
+                {'efn': x[0::3, b], 'efp': x[1::3, b], 'v': x[2::3, b]}
+                for b in range(batch.size)]
+
+    def _newton_batch(self, batch, x, veq, tol=1e-6, maxiter=300, verbose=True):
+        # Newton-Raphson scheme for a batch of one-dimensional systems, with
+        # one column of x per system (the equilibrium problem if veq is None).
+        # The systems are removed from the batch once converged or diverged,
+        # the columns of x of the latter are set to nan.
+        x = np.copy(x)
+        active = np.arange(batch.size)
+        system = batch
+
+        for cc in range(1, maxiter + 1):
+            xa = x[:, active]
+            if veq is None:
+                f, J = getFandJ_eq_1D(system, xa)
+            else:
+                f, J = getFandJ_1D(system, xa[2::3], xa[0::3], xa[1::3], veq[:, active])
+            # the steps of the systems with a singular Jacobian are nan
+            dx = J.factorize()(-f)
+
+            error = np.max(np.abs(dx), axis=0)
+            failed = ~(error < 1e30)
+            converged = error < tol
+            # damping and new values of x for the systems still iterating
+            going = ~(failed | converged)
+            self._damping(dx)
+            x[:, active[going]] += dx[:, going]
+            x[:, active[failed]] = np.nan
+
+            if verbose:
+                logging.info('step {0}, error = {1}, {2} systems left'\
+                             .format(cc, np.max(error[going], initial=0), np.sum(going)))
+
+            if not np.all(going):
+                active = active[going]
+                if len(active) == 0:
+                    break
+                system = batch.subset(active)
+        else:
+            msg = "**  Maximum number of iterations reached for {0} systems  **"
+            logging.error(msg.format(len(active)))
+            x[:, active] = np.nan
+
+        if np.any(np.isnan(x[0])):
+            logging.error("**  The Newton-Raphson algorithm did not converge for {0} systems  **"\
+                          .format(np.sum(np.isnan(x[0]))))
+        return x
 
     def _damping(self, dx):
         # This damping procedure is inspired from Solid-State Electronics, vol. 19,
@@ -203,51 +587,490 @@ class Solver():
         dx[b] = np.log(1+np.abs(dx[b])*1.72)*np.sign(dx[b])
 
 
-    def _sparse_solver(self, J, f):
-        spsolve = lg.spsolve
-        if self.use_mumps and mumps_available: 
-            spsolve = mumps.spsolve
+    def _sparse_solver(self, J, f, eta=None):
+        return self._factorize(J)(f, eta)
+
+    def _factorize(self, J, system=None, poisson=False):
+        # Return a function solving J * dx = f, with a relative accuracy eta
+        # for the iterative solver. The factorization (or preconditioner) is
+        # kept by the function so that it can be reused for several right hand
+        # sides. The system of the matrix is needed by the symmetric solvers of
+        # the Poisson equation at equilibrium (poisson=True) and by the
+        # multigrid preconditioner.
+        if isinstance(J, BlockTridiagonal):
+            return J.factorize()
+        if poisson and self.equilibrium_solver != 'lu':
+            return self._symmetric_factorize(J, system)
+        if self.iterative:
+            solve = self._krylov_factorize(J, system)
+            if solve is not None:
+                return solve
+        return self._direct_factorize(J)
+
+    def _direct_factorize(self, J):
+        if self.use_mumps and mumps_available:
+            solve = self._mumps_factorize(J)
         else:
-            J = J.tocsr()
-        dx = spsolve(J, f)
-        return dx
+            lu = lg.splu(J.tocsc())
+            def solve(f, eta=None):
+                return lu.solve(np.asarray(f, dtype=np.float64))
+        return solve
+
+    def _krylov_factorize(self, J, system=None):
+        # Prepare the solution of J * dx = f with an ILU preconditioned Krylov
+        # method on the row-equilibrated system. Return None if the
+        # factorization fails. When the iteration fails for a given right hand
+        # side, the direct solver is used instead.
+
+        # the equations have very different scales (currents and Poisson),
+        # scale each row by its largest entry
+        scale = abs(J).max(axis=1).toarray().ravel()
+        scale[scale == 0] = 1
+        if J.format == 'bsr':
+            # keep the blocks: scale the rows of each block in place
+            A = J.copy()
+            m = A.blocksize[0]
+            rows = np.repeat(np.arange(A.shape[0] // m), np.diff(A.indptr))
+            A.data *= (1. / scale).reshape(-1, m)[rows][:, :, None]
+        else:
+            A = diags(1. / scale).dot(J).tocsc()
 
+        if self.preconditioner == 'block_jacobi':
+            M = _block_jacobi(A)
+            if M is None:
+                logging.warning("Singular diagonal block, switching to the direct solver")
+                return None
+        elif self.preconditioner == 'multigrid' and system is not None:
+            m = A.shape[0] // (system.nx * system.ny)
+            M = Multigrid(A, system.dx, system.dy, m=m,
+                          fields=self._field_major(system)).aslinearoperator()
+        else:
+            try:
+                ilu = lg.spilu(A.tocsc(), drop_tol=self.ilu_drop, fill_factor=self.ilu_fill)
+            except RuntimeError:
+                logging.warning("Incomplete LU factorization failed, switching to the direct solver")
+                return None
+            M = lg.LinearOperator(A.shape, ilu.solve)
+        direct = []
+
+        def solve(f, eta=None):
+            if eta is None:
+                eta = self.iterative_tol
+            b = f / scale
+            if direct:
+                return direct[0](b)
+
+            if self.iterative_method == 'gmres':
+                dx, info = _krylov(lg.gmres, A, b, eta, M, restart=50, maxiter=20)
+            else:
+                dx, info = _krylov(lg.bicgstab, A, b, eta, M, maxiter=500)
+
+            # accept the solution only if the residual of the original
+            # (unscaled) system reached the requested accuracy, up to a factor
+            # 10: the convergence test of the Krylov method is made on the
+            # preconditioned scaled system, and a nearly singular
+            # preconditioner can report convergence for a meaningless step
+            res = np.linalg.norm(f - J.dot(dx)) / np.linalg.norm(f)
+            if not res <= min(10 * eta, 0.5):
+                logging.warning("The Krylov method did not converge (info {0}, relative "\
+                                "residual {1:.2e}), switching to the direct solver"\
+                                .format(info, res))
+                direct.append(self._direct_factorize(A))
+                dx = direct[0](b)
+            return dx
+
+        return solve
+
+    def _symmetric_factorize(self, J, system):
+        # Solve the Poisson equation at equilibrium in symmetric form. The
+        # contact rows only couple a contact site to itself and to its inner
+        # neighbor (Neutral contacts), so eliminating them only changes the
+        # diagonal of the inner rows. The inner rows, scaled by the area
+        # dxbar*dybar of their control volume, are then symmetric: the
+        # coupling between two sites is the permittivity of their link times
+        # the ratio of the width of the face to the length of the link.
+        plan = get_plan(system)
+        inner = plan.sites
+        contacts = np.concatenate((plan.left, plan.right))
+        J = J.tocsr()
+        Jc = J[contacts]
+        Jcc = Jc[:, contacts].diagonal()
+        Jci = Jc[:, inner]
+        E = J[inner][:, contacts].dot(diags(1. / Jcc))
+        w = plan.dxbar * plan.dybar
+        A = diags(w).dot(J[inner][:, inner] - E.dot(Jci))
+        # remove the rounding errors of the scaling
+        A = ((A + A.T) * .5).tocsc()
+
+        if self.equilibrium_solver == 'cg':
+            solve_inner = self._cg_factorize(A)
+        elif self.equilibrium_solver == 'multigrid':
+            # grid of the inner sites
+            solve_inner = self._multigrid_factorize(A, system.dx[1:-1], system.dy)
+        else:
+            solve_inner = self._ldlt_factorize(A)
+
+        def solve(f, eta=None):
+            fc = f[contacts]
+            x = np.empty_like(f, dtype=np.float64)
+            x[inner] = solve_inner(w * (f[inner] - E.dot(fc)))
+            x[contacts] = (fc - Jci.dot(x[inner])) / Jcc
+            return x
+
+        return solve
+
+    def _ldlt_factorize(self, A):
+        # Factorization of a symmetric positive definite matrix
+        if self.use_mumps and mumps_available:
+            solve = self._mumps_factorize(A, sym=1)
+        else:
+            lu = lg.splu(A, permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.,
+                         options=dict(SymmetricMode=True))
+            solve = lu.solve
+        return solve
+
+    def _cg_factorize(self, A):
+        # Conjugate gradient method preconditioned by an incomplete
+        # factorization computed without pivoting and with a symmetric
+        # ordering, which keeps the preconditioner close to symmetric. The
+        # direct solver is used when the iteration fails.
+        try:
+            ilu = lg.spilu(A, drop_tol=self.ilu_drop, fill_factor=self.ilu_fill,
+                           permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.,
+                           options=dict(SymmetricMode=True))
+            M = lg.LinearOperator(A.shape, ilu.solve)
+        except RuntimeError:
+            logging.warning("Incomplete factorization failed, switching to the direct solver")
+            return self._ldlt_factorize(A)
+        direct = []
+
+        def solve(f):
+            if direct:
+                return direct[0](f)
+            x, info = _krylov(lg.cg, A, f, self.iterative_tol, M, maxiter=500)
+            if info != 0:
+                logging.warning("The conjugate gradient method did not converge, "\
+                                "switching to the direct solver")
+                direct.append(self._ldlt_factorize(A))
+                x = direct[0](f)
+            return x
+
+        return solve
+
+    def _multigrid_factorize(self, A, dx, dy):
+        # Multigrid V-cycles, the direct solver is used when they do not
+        # converge
+        mg = Multigrid(A, dx, dy)
+        direct = []
+
+        def solve(f):
+            if direct:
+                return direct[0](f)
+            x, info = mg.solve(f, tol=self.iterative_tol)
+            if info != 0:
+                logging.warning("The multigrid cycles did not converge, "\
+                                "switching to the direct solver")
+                direct.append(self._ldlt_factorize(A))
+                x = direct[0](f)
+            return x
+
+        return solve
+
+    def _forcing_term(self, fnorm, fnorm_prev, eta_prev):
+        # Accuracy of the next linear solve of the inexact Newton method,
+        # choice 2 of Eisenstat and Walker, SIAM J. Sci. Comput. 17, 16 (1996)
+        eta_max = 0.1
+        if not self.forcing:
+            return self.iterative_tol
+        if fnorm_prev is None:
+            return eta_max
+        eta = 0.9 * (fnorm / fnorm_prev)**2
+        # safeguard against an oversolving decrease of the forcing term
+        if 0.9 * eta_prev**2 > 0.1:
+            eta = max(eta, 0.9 * eta_prev**2)
+        return min(max(eta, self.iterative_tol), eta_max)
+
+    def _mumps_factorize(self, J, sym=0):
+        # The sparsity pattern of the Jacobian is the same for every Newton
+        # step of a given system, so the analysis phase (ordering, symbolic
+        # factorization) is done once and only the numerical factorization is
+        # performed with the new values afterwards. With sym=1 the matrix is
+        # symmetric positive definite, and only its lower triangle is given.
+        # Return a function solving the system with the factors.
+        if sym:
+            J = tril(J)
+        J = J.tocoo()
+        n = J.shape[0]
+        # MUMPS expects one-based 32-bit indices
+        irn = (J.row + 1).astype(np.int32)
+        jcn = (J.col + 1).astype(np.int32)
+        # copied, the solve function may outlive the matrix values
+        values = np.array(J.data, dtype=np.float64)
+
+        key = (n, J.nnz, sym)
+        # the context is shared by all the matrices with the same key, its
+        # factors belong to the last matrix factorized with it
+        owner = object()
+
+        def factorize():
+            ctx = None
+            if key in self._mumps_contexts:
+                ctx, _irn, _jcn, _ = self._mumps_contexts[key]
+                if not (np.array_equal(_irn, irn) and np.array_equal(_jcn, jcn)):
+                    ctx.destroy()
+                    ctx = None
+
+            if ctx is None:
+                ctx = mumps.DMumpsContext(sym=sym)
+                # Silence most messages
+                ctx.set_silent()
+                # Ordering package
+                # 3: SCOTCH
+                # 4: PORD
+                # 5: METIS
+                ctx.set_icntl(7, 4)
+                ctx.set_shape(n)
+                ctx.set_assembled_rows_cols(irn, jcn)
+                # Analysis
+                ctx.run(job=1)
+            self._mumps_contexts[key] = (ctx, irn, jcn, owner)
+
+            ctx.set_assembled_values(values)
+            # Factorization
+            ctx.run(job=2)
+            return ctx
+
+        factorize()
+
+        def solve(f, eta=None):
+            # factorize the matrix again if the context has been used for
+            # another matrix since (e.g. a factorization kept for the next
+            # Newton steps and the one of a predictor), or released
+            ctx, _, _, _owner = self._mumps_contexts.get(key, (None, None, None, None))
+            if _owner is not owner:
+                ctx = factorize()
+            return self._mumps_solve(ctx, f)
+        return solve
+
+    def _mumps_solve(self, ctx, f):
+        # Solve with the factors held by the context
+        x = np.array(f, dtype=np.float64)
+        ctx.set_rhs(x)
+        ctx.run(job=3)
+        return x
+
+
+    def _line_search(self, system, x, dx, error, solve, eta, gamma, f0, periodic_bcs):
+        # Backtracking line search along dx. The equations have very different
+        # scales, so the decrease is measured on the natural level function
+        # max|J^-1 f| (the norm of the Newton step at the new point computed
+        # with the current Jacobian), with a sufficient decrease condition of
+        # the Armijo type. Return the step length and the residual (without
+        # the homotopy term) at the new point, or a full step and None if no
+        # decrease was found.
+        alpha = 1e-4
+        length = 1.
+        for _ in range(10):
+            xt = np.multiply(dx, length, out=self._workspace.empty('trial', x.shape))
+            xt += x
+            ft = self._get_residual(xt, system, periodic_bcs)
+            fh = ft if gamma == 1 else ft - (1-gamma)*f0
+            if np.all(np.isfinite(fh)):
+                error_t = max(np.abs(solve(-fh, eta)))
+                if error_t <= (1 - alpha * length) * error:
+                    return length, ft
+            length = 0.5 * length
+        logging.info("The line search could not reduce the residual, taking the damped step")
+        return 1., None
+
+    def _field_major(self, system):
+        # True if the unknowns of the system are stored in field-major order
+        return self.layout == 'fields' and not (self.banded and system.dimension == 1)
+
+    def _fields(self, system, x):
+        # views of efn, efp and v in the vector of the unknowns of a system
+        if self._field_major(system):
+            N = system.nx * system.ny
+            return x[:N], x[N:2*N], x[2*N:]
+        return x[0::3], x[1::3], x[2::3]
+
+    def _kernels(self, system):
+        # Functions computing the residual, the residual and Jacobian, and the
+        # residual and Jacobian at equilibrium of a system. The kernels of the
+        # drift-diffusion-Poisson equations write in the workspace of the
+        # current solve.
+        ws = self._workspace
+        if self.banded and system.dimension == 1:
+            return partial(getF_1D, workspace=ws), partial(getFandJ_1D, workspace=ws),\
+                   getFandJ_eq_1D
+        if self.structured:
+            fields = self._field_major(system)
+            kernels = partial(getF_2D, fields=fields, workspace=ws),\
+                      partial(getFandJ_2D, fields=fields, workspace=ws), getFandJ_eq_2D
+        else:
+            kernels = getF, getFandJ, getFandJ_eq
+        if self.bsr:
+            kernels = kernels[0], partial(kernels[1], bsr=True), kernels[2]
+        return kernels
 
     def _get_system(self, x, system, periodic_bcs):
         # Compute the right hand side of J * x = f
+        # and the Jacobian, assembled on the fixed sparsity pattern of the system
+        _, get_FandJ, get_FandJ_eq = self._kernels(system)
         if self.equilibrium is None:
-            size = system.nx * system.ny
-            f, rows, columns, data = getFandJ_eq(system, x)
+            f, J = get_FandJ_eq(system, x)
         else:
-            f = getF(system, x[2::3], x[0::3], x[1::3], self.equilibrium)
-            rows, columns, data = getJ(system, x[2::3], x[0::3], x[1::3])
+            efn, efp, v = self._fields(system, x)
+            f, J = get_FandJ(system, v, efn, efp, self.equilibrium)
 
-        # form the Jacobian
-        if self.use_mumps and mumps_available:
-            J = coo_matrix((data, (rows, columns)), dtype=np.float64)
+        return f, J
+
+    def _get_residual(self, x, system, periodic_bcs):
+        # Compute the right hand side of J * x = f only
+        get_F, _, get_FandJ_eq = self._kernels(system)
+        if self.equilibrium is None:
+            f, _ = get_FandJ_eq(system, x)
         else:
-            J = csr_matrix((data, (rows, columns)), dtype=np.float64)
+            efn, efp, v = self._fields(system, x)
+            f = get_F(system, v, efn, efp, self.equilibrium)
+
+        return f
+
+
+    def _gummel(self, system, x, tol=1e-6, verbose=True):
+        # Gummel iterations: nonlinear Poisson equation at fixed quasi-Fermi
+        # levels, followed by the linear continuity equations for the Slotboom
+        # variables exp(efn) and exp(-efp). The iterations define a fixed point
+        # map x -> G(x), optionally accelerated with Anderson mixing. Return
+        # the last iterate, to be refined by the coupled Newton-Raphson scheme.
+        N = system.nx * system.ny
+        efn, efp, v = self._fields(system, x)
+        y = np.concatenate((v, efn, efp))
+        # history of the iterates and fixed point residuals for Anderson mixing
+        Gs, Fs = [], []
+
+        for cc in range(1, self.gummel_maxiter + 1):
+            v, efn, efp = y[:N], y[N:2*N], y[2*N:]
+            try:
+                g = self._gummel_step(system, v, efn, efp, tol)
+            except (RuntimeError, np.linalg.LinAlgError) as e:
+                # singular system or negative Slotboom variables: the input is
+                # left to the Newton-Raphson scheme
+                logging.info("Gummel iterations failed ({0}), moving on to the "\
+                             "Newton-Raphson scheme".format(e))
+                return x
+            fp = g - y
+            error = max(np.abs(fp))
+            if verbose:
+                logging.info('Gummel step {0}, error = {1}'.format(cc, error))
+            if error < self.gummel_switch:
+                break
 
-        return f, J
+            y = g
+            if self.anderson > 0:
+                # y = G - dG.gamma where gamma minimizes |F - dF.gamma|
+                Gs.append(g)
+                Fs.append(fp)
+                Gs, Fs = Gs[-self.anderson-1:], Fs[-self.anderson-1:]
+                if len(Fs) > 1:
+                    dF = np.diff(Fs, axis=0).T
+                    dG = np.diff(Gs, axis=0).T
+                    gamma = np.linalg.lstsq(dF, fp, rcond=None)[0]
+                    ya = g - dG.dot(gamma)
+                    if np.all(np.isfinite(ya)):
+                        y = ya
+
+        x = np.empty_like(x)
+        efn, efp, v = self._fields(system, x)
+        v[:], efn[:], efp[:] = g[:N], g[N:2*N], g[2*N:]
+        return x
+
+    def _gummel_step(self, system, v, efn, efp, tol):
+        # One Gummel iteration, returns the new (v, efn, efp) concatenated.
+        # Raise RuntimeError if a linear system is singular or if the
+        # continuity equations give non-positive Slotboom variables.
+        veq = self.equilibrium
+        get_FandJ_eq = self._kernels(system)[2]
+
+        # nonlinear Poisson equation, the potential at the contacts is fixed
+        # as in the coupled problem
+        v = np.copy(v)
+        for _ in range(100):
+            f, J = get_FandJ_eq(system, v, efn, efp, ("Ohmic", "Ohmic"))
+            dv = self._factorize(J, system, poisson=True)(-f)
+            error = max(np.abs(dv))
+            if not np.isfinite(error):
+                raise RuntimeError("non-finite Poisson update")
+            self._damping(dv)
+            v += dv
+            if error < tol:
+                break
 
+        # continuity equations
+        A, b = get_continuity_n(system, v, efn, efp, veq)
+        u = self._factorize(A, system)(b)
+        if not (np.all(np.isfinite(u)) and np.all(u > 0)):
+            raise RuntimeError("non-positive electron Slotboom variable")
+        efn = np.log(u)
+        A, b = get_continuity_p(system, v, efn, efp, veq)
+        w = self._factorize(A, system)(b)
+        if not (np.all(np.isfinite(w)) and np.all(w > 0)):
+            raise RuntimeError("non-positive hole Slotboom variable")
+        efp = -np.log(w)
+        return np.concatenate((v, efn, efp))
 
     def _newton(self, system, x, tol=1e-6, periodic_bcs=True, maxiter=300, verbose=True, htp=1):
 
-        htpy = np.linspace(1./htp, 1, htp)
-
-        for gdx, gamma in enumerate(htpy):
+        # homotopy schedule: values of the homotopy parameter still to reach,
+        # the last one being 1 (original problem). The schedule is only
+        # adapted if a homotopy was requested.
+        if np.ndim(htp) == 0:
+            targets = list(np.linspace(1./htp, 1, htp))
+            adaptive = htp > 1
+        else:
+            targets = [gamma for gamma in htp if 0 < gamma < 1] + [1.]
+            adaptive = True
+        self.homotopy = []
+        self.step_lengths = []
+        # buffers of the kernels, allocated at the first iteration and
+        # released at the end of the solve
+        self._workspace = Workspace()
+
+        # factorization kept from a previous call (e.g. the previous voltage of
+        # an IV curve) for the same system and problem
+        if self.reuse_jacobian and self._factorization is not None\
+           and self._factorization[0] is system and self._factorization[1] == x.size:
+            solve = self._factorization[2]
+        else:
+            solve = None
+
+        # the homotopy problems f(x) - (1-gamma) * f(x0) = 0 go from the
+        # starting point x0 (gamma = 0) to the solution (gamma = 1). The steps
+        # of gamma are doubled after problems solved in a few iterations, and
+        # cut in two when a problem could not be solved.
+        gamma_prev, x_prev = 0., np.copy(x)
+        f0 = None
+        loop = 0
+        converged = False
+        while targets:
+            gamma = targets[0]
+            loop += 1
             if verbose:
-                logging.info("Newton loop {0}/{1}".format(gdx+1, htp))
+                logging.info("Newton loop {0}, homotopy parameter {1}".format(loop, gamma))
 
             if gamma < 1:
-                htol = 1
+                htol = self.homotopy_tol
             else:
                 htol = tol
 
             cc = 0
             converged = False
-            if gamma != 1:
-                f0, _ = self._get_system(x, system, periodic_bcs)
+            fnorm, eta = None, None
+            error_prev = None
+            f_next = None
+            if gamma != 1 and f0 is None:
+                # copied, the residual is overwritten by the next evaluations
+                f0 = np.copy(self._get_residual(x, system, periodic_bcs))
             while not converged:
                 cc = cc + 1
                 # break if no solution found after maxiterations
@@ -256,32 +1079,83 @@ class Solver():
                     logging.error(msg)
                     break
 
-                # solve linear system
-                f, J = self._get_system(x, system, periodic_bcs)
+                # solve linear system, with a new Jacobian unless the last
+                # factorization is reused
+                try:
+                    refresh = solve is None or not self.reuse_jacobian
+                    if refresh:
+                        f, J = self._get_system(x, system, periodic_bcs)
+                        # the system of the Poisson equation at equilibrium
+                        # can be solved in symmetric form
+                        solve = self._factorize(J, system, poisson=self.equilibrium is None)
+                        if self.reuse_jacobian:
+                            self._factorization = (system, x.size, solve)
+                    elif f_next is not None:
+                        # residual already computed by the line search
+                        f = f_next
+                    else:
+                        f = self._get_residual(x, system, periodic_bcs)
+                    f_next = None
+                except RuntimeError:
+                    solve = None
+                    msg = "**  The linear system could not be solved  **"
+                    logging.error(msg)
+                    break
                 if gamma != 1:
                     f -= (1-gamma)*f0
 
+                # accuracy of the linear solve (iterative solver only)
+                if self.iterative:
+                    fnorm, fnorm_prev = np.linalg.norm(f), fnorm
+                    eta = self._forcing_term(fnorm, fnorm_prev, eta)
+
                 try:
-                    dx = self._sparse_solver(J, -f)
+                    dx = solve(-f, eta)
                     if dx is None:
                         raise SparseSolverError
-                        break
                     else:
-                        dx.transpose()
                         # compute error
                         error = max(np.abs(dx))
+                        if not refresh and error_prev is not None\
+                           and not error < error_prev:
+                            # the step computed with the old Jacobian does not
+                            # contract, compute it again with a new one
+                            solve = None
+                            if verbose:
+                                logging.info('step {0}, error = {1}, refreshing the Jacobian'.format(cc, error))
+                            continue
                         if np.isnan(error) or error > 1e30:
                             raise NewtonError
-                            break
                         if error < htol:
                             converged = True
+                            length = 0
+                        elif self.globalization == 'linesearch':
+                            # damped step shortened until the residual
+                            # decreases
+                            self._damping(dx)
+                            length, f_next = self._line_search(system, x, dx, error, solve, eta,
+                                                              gamma, f0, periodic_bcs)
+                            x += length * dx
                         else: 
                             # damping and new value of x
                             self._damping(dx)
                             x += dx
+                            length = 1
+                        if not converged:
+                            self.step_lengths.append(length)
+                        # refresh the Jacobian at the next step if the step
+                        # was damped (far from the solution) or if the
+                        # contraction rate of the steps degrades
+                        if self.reuse_jacobian and (error > 1 or\
+                           (error_prev is not None and error > self.reuse_rate * error_prev)):
+                            solve = None
+                        error_prev = error
                         # print status of solution procedure
                         if verbose:
-                            logging.info('step {0}, error = {1}'.format(cc, error))
+                            if self.globalization == 'linesearch':
+                                logging.info('step {0}, error = {1}, step length = {2}'.format(cc, error, length))
+                            else:
+                                logging.info('step {0}, error = {1}'.format(cc, error))
                 except SparseSolverError:
                     msg = "**  The linear system could not be solved  **"
                     logging.error(msg)
@@ -291,14 +1165,39 @@ class Solver():
                     msg = "**  The Newton-Raphson algorithm diverged, try a better guess or finer grid  **"
                     logging.error(msg)
                     break
-                        
+
+            if converged:
+                self.homotopy.append(gamma)
+                targets.pop(0)
+                step = gamma - gamma_prev
+                gamma_prev = gamma
+                if targets and cc <= 4:
+                    # easy problem, double the step
+                    gamma = min(1., gamma + 2 * step)
+                    targets = [gamma] + [g for g in targets if g > gamma]
+                if targets:
+                    x_prev[:] = x
+            else:
+                # start again from the last solution with half the step
+                step = (gamma - gamma_prev) / 2
+                if not adaptive or step < self.homotopy_min_step:
+                    break
+                if verbose:
+                    logging.info("Newton loop failed, homotopy step reduced to {0}".format(step))
+                targets.insert(0, gamma_prev + step)
+                x[:] = x_prev
+                solve = None
+
+        self._workspace = None
         if converged:
             return x
         else:
+            self._factorization = None
             return None
 
     def IVcurve(self, system, voltages, file_name, guess=None, tol=1e-6, 
-                periodic_bcs=True, maxiter=300, verbose=True, htp=1, fmt='npz'):
+                periodic_bcs=True, maxiter=300, verbose=True, htp=1, fmt='npz',
+                predictor='secant', substeps=6, Rs=0, Rsh=np.inf):
         """
         Solve the Drift Diffusion Poisson equations for the voltages provided. The
         results are stored in files with ``.npz`` format by default (See below for
@@ -306,6 +1205,12 @@ class Solver():
         end of the voltage loop and returned. Note that the
         potential is always applied on the right contact.
 
+        The voltages are reached by continuation: the solution at a new
+        voltage is predicted from the previous ones, the size of the internal
+        voltage steps is adapted to the number of Newton-Raphson iterations
+        they take, and a step that fails is cut in two and tried again. The
+        results are only saved at the requested voltages.
+
         Parameters
         ----------
         system: Builder
@@ -329,16 +1234,43 @@ class Solver():
         verbose: boolean
             The solver returns the step number and the associated error at every
             step, and this function prints the current applied voltage if set to True (default).
-        htp: integer
-            Number of homotopic Newton loops to perform.
+        htp: integer or list of floats
+            Number of homotopic Newton loops to start with, or values of the
+            homotopy parameter to reach before the original problem (e.g. the
+            attribute homotopy of a previous solve). The steps of the
+            homotopy parameter are then adapted to the difficulty of the
+            problems. With htp=1 (default), the original problem is solved
+            directly and no homotopy is attempted if it fails.
         fmt: string
             Format string for the data files. Use ``mat`` to save the data in a
             Matlab format (version 5 and above).
+        predictor: string
+            Starting point of the Newton-Raphson scheme at a new voltage. With
+            'secant' (default), the solution is extrapolated linearly from the
+            last two solutions. With 'tangent', it is extrapolated along the
+            derivative of the solution with respect to the applied voltage,
+            computed with the Jacobian of the last solution (one more
+            factorization per step). With 'none', the previous solution is used
+            with the new contact potential.
+        substeps: integer
+            Number of times a failed voltage step is cut in two before the
+            computation of the curve is stopped.
+        Rs: float
+            Series resistance times area of the external circuit, in
+            Ohm.cm^2 (Ohm.m^2 if the unit of length of the system is m).
+        Rsh: float
+            Shunt resistance times area of the external circuit, in the unit
+            of Rs (infinite by default).
 
         Returns
         -------
         J: numpy array of floats
-            Steady state current computed for each voltage value.
+            Steady state current computed for each voltage value. With a
+            series or shunt resistance, the voltages are applied on the
+            terminals of the circuit and J is its external current: the
+            voltage vd on the system solves vd = V + Rs * J with
+            J = J_system(vd) - vd / Rsh, and the saved data are those of the
+            system at the voltage vd.
 
         Notes
         -----
@@ -349,6 +1281,10 @@ class Solver():
         >>> efp = results['efp']
         >>> v = results['v']
         """
+        if predictor not in ('secant', 'tangent', 'none'):
+            raise ValueError("Unknown predictor '{0}', use 'secant', 'tangent' or 'none'."\
+                             .format(predictor))
+
         # create a dictionary 'result' with efn and efp
         if guess is None:
             result = self.solve(system, compute='Poisson', tol=tol,
@@ -357,16 +1293,6 @@ class Solver():
         else:
             result = guess
 
-        # sites of the right contact
-        nx = system.nx
-        s = [nx-1 + j*nx for j in range(system.ny)]
-
-        # sign of the voltage to apply
-        if system.rho[nx-1] < 0:
-            q = 1
-        else:
-            q = -1
-
         # Solving equilbrium potential first
         if self.equilibrium is not None:
             if verbose:
@@ -382,17 +1308,30 @@ class Solver():
         J = np.zeros((len(Vapp),))
         J[:] = np.nan
 
+        # continuation state, starting from the guess
+        state = self._bias_state(system, result)
+
+        # dimensionless series resistance and shunt conductance for the
+        # current of the system (integrated over the width of 2D systems)
+        width = 1
+        if system.dimension == 2:
+            width = (system.ypts[-1] - system.ypts[0]) / system.scaling.length
+        rs = Rs * system.scaling.current / (system.scaling.energy * width)
+        gsh = width * system.scaling.energy / (Rsh * system.scaling.current)
+        jext = 0
+
         for idx, vapp in enumerate(Vapp):
 
             if verbose:
                 logging.info("Applied voltage: {0} V".format(voltages[idx]))
 
-            # Apply the voltage on the right contact
-            result['v'][s] = self.equilibrium[s] + q*vapp
-
-            # Call the Drift Diffusion Poisson solver
-            result = self.solve(system, guess=result, tol=tol, periodic_bcs=periodic_bcs,\
-                                maxiter=maxiter, verbose=verbose, htp=htp)
+            if rs == 0 and gsh == 0:
+                result = self._bias(system, state, vapp, tol, periodic_bcs, maxiter,
+                                    verbose, htp, predictor, substeps)
+            else:
+                result, jext = self._resistive_bias(system, state, vapp, rs, gsh, jext,
+                                                    tol, periodic_bcs, maxiter, verbose,
+                                                    htp, predictor, substeps)
 
             if result is not None:
                 # 1. Save efn, efp, v
@@ -408,6 +1347,8 @@ class Solver():
                 try:
                     az = Analyzer(system, result)
                     J[idx] = az.full_current()
+                    if rs != 0 or gsh != 0:
+                        J[idx] = jext
                 except Exception:
                    logging.info("Could not compute the current for the applied voltage"\
                     + " {0} V (index {1}).".format(voltages[idx], idx))
@@ -416,10 +1357,407 @@ class Solver():
                 logging.info("The solver failed to converge for the applied voltage"\
                       + " {0} V (index {1}).".format(voltages[idx], idx))
                 return J
-                break
         return J
 
+    def figures_of_merit(self, system, guess=None, vstep=0.1, vtol=1e-3, tol=1e-6,
+                         periodic_bcs=True, maxiter=300, verbose=True, htp=1,
+                         predictor='secant', substeps=6):
+        """
+        Compute the short circuit current, the open circuit voltage and the
+        maximum power point of an illuminated system with a few solutions of
+        the Drift Diffusion Poisson equations, instead of a dense IV curve.
+
+        The current is computed at zero bias, then for voltages increasing by
+        vstep until it changes sign. The short circuit current can be positive
+        or negative depending on the side of the n and p regions. The open circuit voltage is located in
+        the last interval with Brent's method, and the maximum power point by
+        a golden-section search around the sampled voltage of largest power.
+        Each voltage is reached by continuation from the previous one (see
+        :func:`IVcurve`). The potential is applied on the right contact.
+
+        Parameters
+        ----------
+        system: Builder
+            The discretized system.
+        guess: dictionary of numpy arrays of floats (optional)
+            Starting point of the solver, the solution in the dark (equilibrium)
+            by default. Keys of the dictionary must be 'efn', 'efp' and 'v'.
+        vstep: float
+            Voltage step (in V) of the search of the open circuit voltage.
+        vtol: float
+            Accuracy (in V) of the open circuit voltage and of the voltage of
+            the maximum power point.
+        tol: float
+            Accepted error made by the Newton-Raphson scheme.
+        periodic_bcs: boolean
+            Defines the choice of boundary conditions in the y-direction. True
+            (False) corresponds to periodic (abrupt) boundary conditions.
+        maxiter: integer
+            Maximum number of steps taken by the Newton-Raphson scheme.
+        verbose: boolean
+            The solver returns the step number and the associated error at every
+            step, and this function prints the current applied voltage if set to
+            True (default).
+        htp: integer or list of floats
+            Homotopy of the Newton-Raphson scheme, see :func:`solve`.
+        predictor: string
+            Predictor of the continuation between voltages, see :func:`IVcurve`.
+        substeps: integer
+            Number of times a failed voltage step is cut in two, see
+            :func:`IVcurve`.
+
+        Returns
+        -------
+        fom: dictionary of floats
+            Short circuit current 'Jsc' and current at the maximum power point
+            'Jmpp' (dimensionless, as returned by :func:`IVcurve`), open circuit
+            voltage 'Voc' and voltage at the maximum power point 'Vmpp' (in V),
+            and fill factor 'FF'. The quantities that could not be computed are
+            NaN.
+        """
+        fom = dict.fromkeys(('Jsc', 'Voc', 'Vmpp', 'Jmpp', 'FF'), np.nan)
+        if self.equilibrium is None:
+            self.solve(system, compute='Poisson', tol=tol, periodic_bcs=periodic_bcs,
+                       maxiter=maxiter, verbose=verbose, htp=htp)
+            if self.equilibrium is None:
+                return fom
+        if guess is None:
+            guess = {'efn': np.zeros_like(self.equilibrium),
+                     'efp': np.zeros_like(self.equilibrium), 'v': self.equilibrium}
+
+        state = self._bias_state(system, guess)
+        currents = {}
+
+        def current(V):
+            # steady state current at the voltage V, computed once
+            if V not in currents:
+                if verbose:
+                    logging.info("Applied voltage: {0} V".format(V))
+                result = self._bias(system, state, V / system.scaling.energy, tol,
+                                    periodic_bcs, maxiter, verbose, htp, predictor,
+                                    substeps)
+                if result is None:
+                    raise NewtonError
+                currents[V] = Analyzer(system, result).full_current()
+            return currents[V]
+
+        def photocurrent(V):
+            # current counted positive in the direction of the short circuit
+            # current
+            return sign * current(V)
+
+        try:
+            fom['Jsc'] = jsc = current(0.)
+            if jsc == 0 or not np.isfinite(jsc):
+                logging.info("No current at zero bias, the open circuit voltage is"\
+                             " not defined.")
+                return fom
+            # the sign of the photocurrent depends on the side of the n and p
+            # regions of the system
+            sign = np.sign(jsc)
+
+            # interval containing the open circuit voltage, which is lower than
+            # the largest band gap
+            vmax = np.max(system.Eg) * system.scaling.energy
+            low, high = 0., 0.
+            while photocurrent(high) > 0:
+                if high >= vmax:
+                    logging.info("The current does not change sign below {0} V."\
+                                 .format(vmax))
+                    return fom
+                low, high = high, min(high + vstep, vmax)
+            fom['Voc'] = voc = brentq(photocurrent, low, high, xtol=vtol)
+
+            # golden-section search of the largest power around the sampled
+            # voltage of largest power
+            vbest = max([V for V in currents if V <= voc], key=lambda V: V * photocurrent(V))
+            a, b = max(vbest - vstep, 0.), min(vbest + vstep, voc)
+            r = (np.sqrt(5) - 1) / 2
+            c, d = b - r * (b - a), a + r * (b - a)
+            while b - a > vtol:
+                if c * photocurrent(c) > d * photocurrent(d):
+                    b, d = d, c
+                    c = b - r * (b - a)
+                else:
+                    a, c = c, d
+                    d = a + r * (b - a)
+            vmpp = c if c * photocurrent(c) > d * photocurrent(d) else d
+            fom['Vmpp'], fom['Jmpp'] = vmpp, current(vmpp)
+            fom['FF'] = vmpp * currents[vmpp] / (voc * jsc)
+        except NewtonError:
+            logging.info("The solver failed to converge, the figures of merit are"\
+                         " incomplete.")
+        return fom
+
+    def _bias_state(self, system, solution):
+        # Continuation state of the applied voltage (see IVcurve and
+        # figures_of_merit): sites 's' of the right contact, sign 'q' of the
+        # applied voltage, last solution 'x' and its dimensionless voltage
+        # 'v' (read from the contact potential), previous solution and
+        # voltage for the secant predictor, derivative of the solution for
+        # the tangent predictor, and size of the next internal voltage step.
+        nx = system.nx
+        s = [nx-1 + j*nx for j in range(system.ny)]
+        if system.rho[nx-1] < 0:
+            q = 1
+        else:
+            q = -1
+        x = self._unknowns(system, solution)
+        v = np.mean(q * (self._fields(system, x)[2][s] - self.equilibrium[s]))
+        return {'s': s, 'q': q, 'x': x, 'v': v, 'previous': None, 'tangent': None,
+                'step': np.inf}
+
+    def _unknowns(self, system, solution):
+        # vector of the unknowns of a solution dictionary
+        x = np.zeros((3*system.nx*system.ny,), dtype=np.float64)
+        efn, efp, v = self._fields(system, x)
+        efn[:], efp[:], v[:] = solution['efn'], solution['efp'], solution['v']
+        return x
+
+    def _bias(self, system, state, vapp, tol, periodic_bcs, maxiter, verbose, htp,
+              predictor='secant', substeps=6):
+        # Solution at the dimensionless applied voltage vapp, reached by
+        # continuation from the state, which is updated with the solutions of
+        # the internal steps. The steps are adapted to the number of Newton
+        # iterations (target of 10 iterations per step), and a failed step is
+        # cut in two up to substeps times. Return None if the voltage could
+        # not be reached.
+        s, q = state['s'], state['q']
+        failures = 0
+        while True:
+            x, vx, step = state['x'], state['v'], state['step']
+            # next internal voltage, the requested one if it is close enough
+            last = abs(vapp - vx) <= step
+            if last:
+                vnext = vapp
+            else:
+                vnext = vx + np.sign(vapp - vx) * step
+            dv = vnext - vx
+
+            # predicted solution at the new voltage
+            if predictor == 'tangent' and dv != 0:
+                if state['tangent'] is None:
+                    state['tangent'] = self._tangent(system, x, s, q, periodic_bcs)
+                if state['tangent'] is not None:
+                    xp = x + dv * state['tangent']
+                else:
+                    xp = np.copy(x)
+            elif predictor == 'secant' and state['previous'] is not None and dv != 0:
+                vprev, xprev = state['previous']
+                xp = x + dv / (vx - vprev) * (x - xprev)
+            else:
+                xp = np.copy(x)
+            efn, efp, v = self._fields(system, xp)
+
+            # Apply the voltage on the right contact
+            v[s] = self.equilibrium[s] + q*vnext
+
+            if verbose and vnext != vapp:
+                logging.info("Intermediate voltage: {0} V".format(vnext * system.scaling.energy))
+
+            # Call the Drift Diffusion Poisson solver
+            result = self.solve(system, guess={'efn': efn, 'efp': efp, 'v': v}, tol=tol,
+                                periodic_bcs=periodic_bcs, maxiter=maxiter,
+                                verbose=verbose, htp=htp)
+
+            if result is None:
+                # cut the step in two and try again from the last solution
+                failures += 1
+                if failures > substeps:
+                    return None
+                state['step'] = abs(dv) / 2
+                if verbose:
+                    logging.info("The voltage step failed, trying a step of {0} V."\
+                                 .format(state['step'] * system.scaling.energy))
+                continue
+
+            if dv != 0:
+                # a short last step that was easy says nothing about the size
+                # of the next steps
+                iterations = len(self.step_lengths) + 1
+                factor = min(2, max(0.5, 10. / iterations))
+                if not last or factor < 1:
+                    state['step'] = abs(dv) * factor
+                state['previous'] = (vx, x)
+                state['tangent'] = None
+            state['x'], state['v'] = self._unknowns(system, result), vnext
+            failures = 0
+            if vnext == vapp:
+                return result
+
+    def _resistive_bias(self, system, state, vapp, rs, gsh, jext, tol, periodic_bcs,
+                        maxiter, verbose, htp, predictor='secant', substeps=6):
+        # Solution at the dimensionless terminal voltage vapp of a circuit made
+        # of the system, a series resistance rs and a shunt conductance gsh.
+        # The voltage vd on the system solves
+        #     g(vd) = vd - vapp - rs * (J(vd) - gsh * vd) = 0
+        # where J is the current of the system. g increases with vd, its root
+        # is found with the secant method, starting with the external current
+        # jext of the previous voltage. Return the solution and the external
+        # current, or None and NaN.
+        def g(vd):
+            result = self._bias(system, state, vd, tol, periodic_bcs, maxiter,
+                                verbose, htp, predictor, substeps)
+            if result is None:
+                return None, np.nan, np.nan
+            j = Analyzer(system, result).full_current() - gsh * vd
+            return result, j, vd - vapp - rs * j
+
+        vd = vapp + rs * jext
+        result, j, gd = g(vd)
+        # first step of the fixed point iteration vd = vapp + rs * j
+        vd_prev, g_prev, vd = vd, gd, vd - gd
+        for _ in range(20):
+            if result is None or abs(gd) < tol:
+                break
+            result, j, gd = g(vd)
+            if gd == g_prev:
+                # the secant step is not defined anymore
+                break
+            vd_prev, g_prev, vd = vd, gd, vd - gd * (vd - vd_prev) / (gd - g_prev)
+        if result is None:
+            return None, np.nan
+        if not abs(gd) < tol:
+            logging.error("The voltage on the system did not converge (error {0}).".format(abs(gd)))
+            return None, np.nan
+        if verbose:
+            logging.info("Voltage on the system: {0} V".format(state['v'] * system.scaling.energy))
+        return result, j
+
+    def generation_ramp(self, system, scales=(1,), guess=None, start=1e-6, tol=1e-6,
+                        ramp_tol=1e-2, periodic_bcs=True, maxiter=300, verbose=True,
+                        htp=1, substeps=6):
+        """
+        Solve the Drift Diffusion Poisson equations for increasing intensities
+        of the generation rate, by continuation from a low intensity.
+
+        The generation rate of the system is multiplied by a scale factor
+        increased in log space, from start to the largest requested scale. The
+        number of decades of each step is adapted to the number of
+        Newton-Raphson iterations of the previous one, and a step that fails is
+        cut in two and tried again. The intermediate scales are only solved
+        with the accuracy ramp_tol, the requested ones with the accuracy tol.
+        The generation rate of the system is restored at the end.
+
+        Parameters
+        ----------
+        system: Builder
+            The discretized system.
+        scales: array-like
+            Positive scale factors of the generation rate of the system for
+            which the solutions are returned. By default, only the solution for
+            the generation rate of the system is computed.
+        guess: dictionary of numpy arrays of floats (optional)
+            Starting point of the solver, the solution in the dark (equilibrium)
+            by default. Keys of the dictionary must be 'efn', 'efp' and 'v'.
+        start: float
+            Scale factor of the first problem, solved from the guess.
+        tol: float
+            Accepted error made by the Newton-Raphson scheme for the requested
+            scales.
+        ramp_tol: float
+            Accepted error made by the Newton-Raphson scheme for the
+            intermediate scales.
+        periodic_bcs: boolean
+            Defines the choice of boundary conditions in the y-direction. True
+            (False) corresponds to periodic (abrupt) boundary conditions.
+        maxiter: integer
+            Maximum number of steps taken by the Newton-Raphson scheme.
+        verbose: boolean
+            The solver returns the step number and the associated error at every
+            step, and this function prints the current scale factor if set to
+            True (default).
+        htp: integer or list of floats
+            Homotopy of the Newton-Raphson scheme, see :func:`solve`.
+        substeps: integer
+            Number of times a failed step is cut in two before the continuation
+            is stopped.
+
+        Returns
+        -------
+        solutions: list of dictionaries
+            Solutions for the scale factors, in the order of scales. The
+            solutions that could not be computed are None.
+        """
+        if np.any(np.asarray(scales) <= 0):
+            raise ValueError("The scale factors of the generation rate must be positive.")
+
+        if self.equilibrium is None:
+            self.solve(system, compute='Poisson', tol=tol, periodic_bcs=periodic_bcs,
+                       maxiter=maxiter, verbose=verbose, htp=htp)
+            if self.equilibrium is None:
+                return [None for _ in scales]
+
+        solutions = [None for _ in scales]
+        g = system.g
+        # log10 of the scale factor of the last solution (None for the guess)
+        # and number of decades of the next step
+        level, step = None, 1.
+        solution = guess
+        try:
+            for idx in np.argsort(scales, kind='stable'):
+                target = np.log10(scales[idx])
+                failures = 0
+                while True:
+                    if level is None:
+                        scale = min(np.log10(start), target)
+                    elif abs(target - level) <= step:
+                        scale = target
+                    else:
+                        scale = level + np.sign(target - level) * step
+
+                    if verbose:
+                        logging.info("Generation rate scaled by {0}".format(10**scale))
+                    system.g = g * 10**scale
+                    result = self.solve(system, guess=solution, periodic_bcs=periodic_bcs,
+                                        tol=tol if scale == target else ramp_tol,
+                                        maxiter=maxiter, verbose=verbose, htp=htp)
+
+                    if result is None:
+                        # cut the step in two and try again from the last
+                        # solution
+                        failures += 1
+                        if level is None or failures > substeps:
+                            logging.info("The solver failed to converge for the generation"\
+                                         " rate scaled by {0}.".format(10**scale))
+                            return solutions
+                        step = abs(scale - level) / 2
+                        continue
+
+                    if level is not None and scale != level:
+                        iterations = len(self.step_lengths) + 1
+                        step = abs(scale - level) * min(2, max(0.5, 10. / iterations))
+                    solution, level = result, scale
+                    failures = 0
+                    if scale == target:
+                        solutions[idx] = result
+                        break
+        finally:
+            system.g = g
+        return solutions
+
+    def _tangent(self, system, x, sites, q, periodic_bcs):
+        # Derivative of the solution x with respect to the (dimensionless)
+        # applied voltage. The voltage only enters the Dirichlet condition on
+        # the potential of the right contact, whose rows of the Jacobian are
+        # those of the identity, so that the derivative solves J * t = b with
+        # b = q on these rows and zero elsewhere. Return None if the linear
+        # system could not be solved.
+        try:
+            _, J = self._get_system(x, system, periodic_bcs)
+            solve = self._factorize(J, system)
+            b = np.zeros_like(x)
+            self._fields(system, b)[2][sites] = q
+            t = solve(b, self.iterative_tol)
+        except RuntimeError:
+            return None
+        if t is None or not np.all(np.isfinite(t)):
+            return None
+        return t
 
 default = Solver()
 solve = default.solve
 IVcurve = default.IVcurve
+solve_batch = default.solve_batch
+generation_ramp = default.generation_ramp
+figures_of_merit = default.figures_of_merit
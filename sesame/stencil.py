@@ -0,0 +1,368 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import numpy as np
+from scipy.sparse import csr_matrix, bsr_matrix
+
+
+class Assembler():
+    """
+    Preallocated values of a sparse matrix in coordinate format, filled in
+    place block by block. A block gives k entries to each of n rows.
+
+    When no block structure is given, the rows and columns of the entries are
+    stored as well, and the block structure is recorded to be reused by
+    assemblers that only compute values.
+
+    Parameters
+    ----------
+    nnz: integer
+        Total number of entries of the matrix (duplicates included).
+    blocks: list of tuples of integers
+        Sizes (n, k) of the blocks, in the order they are added.
+    """
+
+    def __init__(self, nnz, blocks=None):
+        self.data = np.empty((nnz,), dtype=np.float64)
+        if blocks is None:
+            self.rows = np.empty((nnz,), dtype=np.int32)
+            self.columns = np.empty((nnz,), dtype=np.int32)
+            self.blocks = []
+        else:
+            self.rows, self.columns = None, None
+            self.blocks = blocks
+        self.size = 0
+        self.count = 0
+
+    def add(self, data=None, rows=None, columns=None):
+        """
+        Add a block of entries.
+
+        Parameters
+        ----------
+        data: sequence of k numpy arrays of floats
+            Values of the entries, each array (or scalar) of size n. The arrays
+            can have any shape, they are read in C order.
+        rows: numpy array of integers
+            The n rows of the block (only when the coordinates are stored).
+        columns: sequence of k numpy arrays of integers
+            Columns of the entries, each array of size n (only when the
+            coordinates are stored).
+        """
+        if self.rows is None:
+            n, k = self.blocks[self.count]
+        else:
+            n, k = len(rows), len(columns)
+            self.blocks.append((n, k))
+        block = slice(self.size, self.size + n * k)
+        if data is not None:
+            d = self.data[block].reshape(n, k)
+            for i in range(k):
+                d[:, i] = np.ravel(data[i])
+        if self.rows is not None:
+            self.rows[block].reshape(n, k)[...] = np.asarray(rows)[:, None]
+            c = self.columns[block].reshape(n, k)
+            for i in range(k):
+                c[:, i] = columns[i]
+        self.size += n * k
+        self.count += 1
+
+    def clear(self):
+        """
+        Start again from the first block, keeping the allocated entries.
+        """
+        self.size = 0
+        self.count = 0
+
+
+class Pattern():
+    """
+    Fixed sparsity pattern of a matrix in compressed sparse row format.
+
+    The entries are given in coordinate format, in the order in which the
+    kernels compute their values. Duplicated entries are summed when the
+    values are scattered into the matrix.
+
+    The matrix can also be filled in block sparse row format, see
+    :meth:`bsr`.
+
+    Parameters
+    ----------
+    J: Assembler
+        Assembler holding the coordinates and block structure of the entries.
+    shape: integer
+        Size of the (square) matrix.
+    """
+
+    def __init__(self, J, shape):
+        self.blocks = J.blocks
+        keys = J.rows.astype(np.int64) * shape + J.columns
+        unique, self.scatter = np.unique(keys, return_inverse=True)
+        self.scatter = self.scatter.ravel()
+        self.shape = (shape, shape)
+        self.size = len(keys)
+        self.nnz = len(unique)
+
+        self.indices = (unique % shape).astype(np.int32)
+        self.indptr = np.zeros((shape+1,), dtype=np.int32)
+        np.cumsum(np.bincount(unique // shape, minlength=shape), out=self.indptr[1:])
+        self._bsr = {}
+
+    def assembler(self):
+        """
+        Return an empty Assembler for the values of the entries.
+        """
+        return Assembler(self.size, self.blocks)
+
+    def csr(self, data):
+        """
+        Return the matrix of the pattern with new values.
+
+        Parameters
+        ----------
+        data: numpy array of floats
+            Values of the entries, in the order of the coordinates given when
+            the pattern was created.
+
+        Returns
+        -------
+        J: scipy.sparse.csr_matrix
+            A new matrix, which shares the (read-only) index arrays of the
+            pattern with the other matrices of the pattern.
+        """
+        values = np.bincount(self.scatter, weights=data, minlength=self.nnz)
+        return csr_matrix((values, self.indices, self.indptr), shape=self.shape)
+
+    def bsr(self, data, blocksize=3):
+        """
+        Fill the matrix in block sparse row format with new values. The block
+        structure is computed once per block size.
+
+        Parameters
+        ----------
+        data: numpy array of floats
+            Values of the entries, in the order of the coordinates given when
+            the pattern was created.
+        blocksize: integer
+            Size of the square blocks, which must divide the size of the
+            matrix. The default value 3 groups the unknowns (efn, efp, v) of
+            each site.
+
+        Returns
+        -------
+        J: scipy.sparse.bsr_matrix
+            A new matrix, which shares the (read-only) index arrays of the
+            block structure with the other matrices of the pattern.
+        """
+        if blocksize not in self._bsr:
+            m = blocksize
+            n = self.shape[0] // m
+            # coordinates of the entries of the compressed matrix
+            rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+            columns = self.indices
+            blocks, inverse = np.unique((rows // m).astype(np.int64) * n + columns // m,
+                                        return_inverse=True)
+            # position of each entry in the values of the blocks
+            position = inverse.ravel() * m**2 + (rows % m) * m + columns % m
+
+            indptr = np.zeros((n+1,), dtype=np.int32)
+            np.cumsum(np.bincount(blocks // n, minlength=n), out=indptr[1:])
+            indices = (blocks % n).astype(np.int32)
+            self._bsr[blocksize] = (indices, indptr, position[self.scatter])
+
+        m = blocksize
+        indices, indptr, scatter = self._bsr[blocksize]
+        values = np.bincount(scatter, weights=data, minlength=len(indices) * m**2)
+        return bsr_matrix((values.reshape(-1, m, m), indices, indptr), shape=self.shape)
+
+
+class StencilPlan():
+    """
+    Site indices, lattice distances and sparsity patterns of the discretized
+    equations of a system. They only depend on the mesh and are computed once
+    per system, see :func:`get_plan`.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+    """
+
+    def __init__(self, sys):
+        Nx, Ny = sys.xpts.shape[0], sys.ypts.shape[0]
+        Num = Nx * Ny
+        self.nx, self.ny = Nx, Ny
+        self.mesh_dx, self.mesh_dy = np.copy(sys.dx), np.copy(sys.dy)
+
+        # reshape the array as array[y-indices, x-indices]
+        _sites = np.arange(Nx * Ny, dtype=int).reshape(Ny, Nx)
+
+        # sites inside the system: 0 < i < Nx-1 and 0 <= j <= Ny-1, and their
+        # neighbors
+        sites = _sites[0:Ny, 1:Nx - 1].flatten()
+        self.sites = sites
+        self.sm1 = sites - 1
+        self.sp1 = sites + 1
+        self.smN = (sites - Nx) % Num
+        self.spN = (sites + Nx) % Num
+
+        # sites of the contacts
+        self.left = _sites[:, 0].flatten()
+        self.right = _sites[:, Nx - 1].flatten()
+
+        # lattice distances
+        self.dx = np.tile(sys.dx[1:], Ny)
+        self.dxm1 = np.tile(sys.dx[:-1], Ny)
+        self.dy = np.repeat(sys.dy, Nx-2)
+        self.dym1 = np.repeat(np.roll(sys.dy, 1), Nx-2)
+
+        self.dxbar = (self.dxm1 + self.dx) / 2.
+        self.dybar = (self.dym1 + self.dy) / 2.
+
+        # abrupt boundary conditions in the y-direction
+        infind = np.where(np.isinf(self.dybar))[0]
+        top = np.isinf(self.dy[infind])
+        self.dybar[infind[top]] = self.dy[infind[top] - Nx] / 2.
+        self.dybar[infind[~top]] = self.dy[infind[~top]] / 2.
+
+        self._jacobian = None
+        self._jacobian_fields = None
+        self._jacobian_eq = {}
+
+    def matches(self, sys):
+        """
+        Check that the plan was built for the current mesh of a system.
+        """
+        return self.nx == sys.xpts.shape[0] and self.ny == sys.ypts.shape[0]\
+               and np.array_equal(self.mesh_dx, sys.dx)\
+               and np.array_equal(self.mesh_dy, sys.dy)
+
+    @property
+    def jacobian(self):
+        """
+        Sparsity pattern of the Jacobian of the drift-diffusion-Poisson
+        equations, with entries in the order they are computed by
+        :func:`sesame.getFandJ.getFandJ`. The unknowns are interleaved: (efn,
+        efp, v) of the site s are the unknowns 3s, 3s+1 and 3s+2.
+        """
+        if self._jacobian is None:
+            self._jacobian = self._drift_diffusion(lambda s, k: 3 * s + k)
+        return self._jacobian
+
+    @property
+    def jacobian_fields(self):
+        """
+        Sparsity pattern of the Jacobian of the drift-diffusion-Poisson
+        equations for the field-major layout of the unknowns: the arrays efn,
+        efp and v are stored one after the other, so that (efn, efp, v) of the
+        site s are the unknowns s, N+s and 2N+s, with N the number of sites.
+        The entries are in the same order as those of :attr:`jacobian`.
+        """
+        if self._jacobian_fields is None:
+            N = self.nx * self.ny
+            self._jacobian_fields = self._drift_diffusion(lambda s, k: k * N + s)
+        return self._jacobian_fields
+
+    def _drift_diffusion(self, u):
+        # pattern of the drift-diffusion-Poisson equations, where u(s, k) is
+        # the index of the unknown k (0 for efn, 1 for efp, 2 for v) of the
+        # sites s
+        Nx, Ny = self.nx, self.ny
+        sites, sm1, sp1, smN, spN = self.sites, self.sm1, self.sp1,\
+                                    self.smN, self.spN
+        # 29 entries per inner site, 9 per contact site
+        J = Assembler(29 * (Nx - 2) * Ny + 18 * Ny)
+
+        # fn, fp and fv derivatives inside the system
+        J.add(rows=u(sites, 0),
+              columns=(u(smN, 0), u(smN, 2), u(sm1, 0), u(sm1, 2),
+                       u(sites, 0), u(sites, 1), u(sites, 2),
+                       u(sp1, 0), u(sp1, 2), u(spN, 0), u(spN, 2)))
+        J.add(rows=u(sites, 1),
+              columns=(u(smN, 1), u(smN, 2), u(sm1, 1), u(sm1, 2),
+                       u(sites, 0), u(sites, 1), u(sites, 2),
+                       u(sp1, 1), u(sp1, 2), u(spN, 1), u(spN, 2)))
+        J.add(rows=u(sites, 2),
+              columns=(u(smN, 2), u(sm1, 2), u(sites, 0), u(sites, 1),
+                       u(sites, 2), u(sp1, 2), u(spN, 2)))
+
+        # an, ap, av derivatives on the left contact
+        s = self.left
+        J.add(rows=u(s, 0),
+              columns=(u(s, 0), u(s, 2), u(s + 1, 0), u(s + 1, 2)))
+        J.add(rows=u(s, 1),
+              columns=(u(s, 1), u(s, 2), u(s + 1, 1), u(s + 1, 2)))
+        J.add(rows=u(s, 2), columns=(u(s, 2),))
+
+        # bn, bp, bv derivatives on the right contact
+        s = self.right
+        J.add(rows=u(s, 0),
+              columns=(u(s - 1, 0), u(s - 1, 2), u(s, 0), u(s, 2)))
+        J.add(rows=u(s, 1),
+              columns=(u(s - 1, 1), u(s - 1, 2), u(s, 1), u(s, 2)))
+        J.add(rows=u(s, 2), columns=(u(s, 2),))
+
+        return Pattern(J, 3 * Nx * Ny)
+
+    def jacobian_eq(self, contacts_bcs):
+        """
+        Sparsity pattern of the Jacobian of the Poisson equation at thermal
+        equilibrium, with entries in the order they are computed by
+        :func:`sesame.getFandJ_eq.getFandJ_eq`.
+
+        Parameters
+        ----------
+        contacts_bcs: list of strings
+            Boundary conditions of the left and right contacts.
+        """
+        key = tuple(contacts_bcs)
+        if key not in self._jacobian_eq:
+            Nx, Ny = self.nx, self.ny
+            # 5 entries per inner site, 1 per contact site (2 for a neutral
+            # contact)
+            nnz = 5 * (Nx - 2) * Ny
+            for bc in contacts_bcs:
+                nnz += 2 * Ny if bc == "Neutral" else Ny
+            J = Assembler(nnz)
+
+            sites = self.sites
+            J.add(rows=sites, columns=(self.smN, self.sm1, sites, self.sp1, self.spN))
+
+            s = self.left
+            if contacts_bcs[0] == "Neutral":
+                J.add(rows=s, columns=(s, s+1))
+            else:
+                J.add(rows=s, columns=(s,))
+
+            s = self.right
+            if contacts_bcs[1] == "Neutral":
+                J.add(rows=s, columns=(s-1, s))
+            else:
+                J.add(rows=s, columns=(s,))
+
+            self._jacobian_eq[key] = Pattern(J, Nx * Ny)
+        return self._jacobian_eq[key]
+
+
+def get_plan(sys):
+    """
+    Return the stencil plan of a system, building it if the system has none
+    yet or if its mesh has changed.
+
+    Parameters
+    ----------
+    sys: Builder
+        The discretized system.
+
+    Returns
+    -------
+    plan: StencilPlan
+    """
+    plan = getattr(sys, '_plan', None)
+    if plan is None or not plan.matches(sys):
+        plan = StencilPlan(sys)
+        sys._plan = plan
+    return plan
+
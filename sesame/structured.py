@@ -0,0 +1,369 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import numpy as np
+
+from .observables import get_bulk_rr, get_bulk_rr_derivs, _jn, _jp, \
+                         _jn_and_derivs, _jp_and_derivs
+from .defects import defectsF, defectsJ
+from .stencil import get_plan
+from .workspace import Workspace
+from .coefficients import get_coefficients
+
+# The general kernels (getF, getFandJ, getFandJ_eq) written on the structured
+# grid of the system. The site s = i + j*Nx is the entry [j, i] of an array
+# reshaped to (Ny, Nx), so that the neighbors s-1 and s+1 of the inner sites
+# are contiguous slices of the grid and the neighbors s-Nx and s+Nx are
+# obtained by rolling the rows (the system is periodic in the y-direction).
+# The currents are computed once per link between neighboring sites: in the
+# x-direction between the sites (j, i) and (j, i+1) for 0 <= i < Nx-1, and in
+# the y-direction between the inner sites (j, i) and (j+1, i).
+#
+# The residual and the Jacobian entries are the same as those of the general
+# kernels, in the same order. The unknowns are either interleaved as in the
+# general kernels, or stored in field-major order [efn, efp, v] (fields=True),
+# see sesame.stencil.StencilPlan.jacobian_fields. The residual, the carrier
+# densities, the charges and the values of the Jacobian are written in the
+# buffers of a Workspace when one is given.
+
+# inner sites of the grid: 0 < i < Nx-1 and 0 <= j <= Ny-1
+_inner = np.s_[:, 1:-1]
+
+
+def _grid(sys, x):
+    # array of the sites reshaped to (Ny, Nx) (a view of x)
+    return np.reshape(x, (sys.ny, sys.nx))
+
+
+def _rows(sys, fields, workspace, name):
+    # right hand side vector, and its view vec[j, i] holding the rows
+    # (fn, fp, fv) of the site (j, i)
+    if fields:
+        f = workspace.zeros(name, (3, sys.ny, sys.nx))
+        return f, np.moveaxis(f, 0, -1)
+    f = workspace.zeros(name, (sys.ny, sys.nx, 3))
+    return f, f
+
+
+def _shifted_potentials(v, coeffs, workspace):
+    # potentials v + vn and v + vp entering the currents of the electrons and
+    # of the holes
+    vn = np.add(v, coeffs.vn, out=workspace.empty('vn', np.shape(v)))
+    vp = np.add(v, coeffs.vp, out=workspace.empty('vp', np.shape(v)))
+    return vn, vp
+
+
+def _currents(current, sys, ef, vc, mu):
+    # currents (and their derivatives) of the links in the x-direction,
+    # shape (Ny, Nx-1), and in the y-direction, shape (Ny, Nx-2)
+    jx = current(ef[:, :-1], ef[:, 1:], vc[:, :-1], vc[:, 1:], mu[:, :-1], sys.dx)
+    ef, vc = ef[_inner], vc[_inner]
+    jy = current(ef, np.roll(ef, -1, axis=0), vc, np.roll(vc, -1, axis=0),
+                 mu[_inner], sys.dy[:, None])
+    return jx, jy
+
+
+def _lattice(sys, plan, coeffs):
+    # lattice distances and permittivities of the inner sites on the grid
+    shape = (sys.ny, sys.nx - 2)
+    return [np.reshape(x, shape) for x in (plan.dx, plan.dxm1, plan.dy, plan.dym1,
+                                           plan.dxbar, plan.dybar, coeffs.eps_m1x,
+                                           coeffs.eps_p1x, coeffs.eps_m1y,
+                                           coeffs.eps_p1y)]
+
+
+def _poisson(sys, v, lattice):
+    # discretized -div(eps grad v) on the inner sites
+    dx, dxm1, dy, dym1, dxbar, dybar, eps_m1x, eps_p1x, eps_m1y, eps_p1y = lattice
+    v = _grid(sys, v)
+    v_s = v[_inner]
+    dvx = v[:, 1:] - v[:, :-1]
+    dvy = np.roll(v_s, -1, axis=0) - v_s
+    return (eps_m1x * dvx[:, :-1] / dxm1 - eps_p1x * dvx[:, 1:] / dx) / dxbar \
+         + (eps_m1y * np.roll(dvy, 1, axis=0) / dym1 - eps_p1y * dvy / dy) / dybar
+
+
+def getF_2D(sys, v, efn, efp, veq, fields=False, workspace=None):
+    # Residual of the drift-diffusion-Poisson equations, see getF.
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    ws = Workspace() if workspace is None else workspace
+
+    f, vec = _rows(sys, fields, ws, 'getF')
+
+    # carrier densities
+    n, p = coeffs.densities(v, efn, efp, ws)
+
+    # equilibrium carrier densities
+    n_eq, p_eq = coeffs.equilibrium(veq)
+
+    # bulk charges
+    rho = np.subtract(sys.rho, n, out=ws.empty('rho', n.shape))
+    rho += p
+
+    # recombination rates
+    r = get_bulk_rr(sys, n, p)
+
+    # charge defects
+    if len(sys.defects_list) != 0:
+        defectsF(sys, sys.defects_list, n, p, rho, r)
+
+    lattice = _lattice(sys, plan, coeffs)
+    dxbar, dybar = lattice[4:6]
+    g, r = _grid(sys, sys.g), _grid(sys, r)
+
+    # currents
+    vn, vp = _shifted_potentials(v, coeffs, ws)
+    jnx, jny = _currents(_jn, sys, _grid(sys, efn), _grid(sys, vn),
+                         _grid(sys, sys.mu_e))
+    jpx, jpy = _currents(_jp, sys, _grid(sys, efp), _grid(sys, vp),
+                         _grid(sys, sys.mu_h))
+
+    ###########################################################################
+    #       inside the system: 0 < i < Nx-1 and 0 <= j <= Ny-1                #
+    ###########################################################################
+    vec[:, 1:-1, 0] = (jnx[:, 1:] - jnx[:, :-1]) / dxbar \
+                      + (jny - np.roll(jny, 1, axis=0)) / dybar \
+                      + g[_inner] - r[_inner]
+    vec[:, 1:-1, 1] = (jpx[:, 1:] - jpx[:, :-1]) / dxbar \
+                      + (jpy - np.roll(jpy, 1, axis=0)) / dybar \
+                      + r[_inner] - g[_inner]
+    vec[:, 1:-1, 2] = _poisson(sys, v, lattice) - _grid(sys, rho)[_inner]
+
+    ###########################################################################
+    #                       contacts (Dirichlet BCs for v)                    #
+    ###########################################################################
+    n, p = _grid(sys, n), _grid(sys, p)
+    n_eq, p_eq = _grid(sys, n_eq), _grid(sys, p_eq)
+
+    vec[:, 0, 0] = jnx[:, 0] - sys.Scn[0] * (n[:, 0] - n_eq[:, 0])
+    vec[:, 0, 1] = jpx[:, 0] + sys.Scp[0] * (p[:, 0] - p_eq[:, 0])
+
+    vec[:, -1, 0] = jnx[:, -1] + sys.Scn[1] * (n[:, -1] - n_eq[:, -1])
+    vec[:, -1, 1] = jpx[:, -1] - sys.Scp[1] * (p[:, -1] - p_eq[:, -1])
+
+    return f.reshape(-1)
+
+
+def _divergence_derivatives(djx, djy, dxbar, dybar):
+    # Derivatives of the divergence of the current with respect to the
+    # quasi-Fermi level (ef) and the potential (v) of the sites s-Nx, s-1, s,
+    # s+1 and s+Nx, valid for both n and p. The derivatives of the currents are
+    # given per link, with respect to (ef_i, ef_ip1, v_i, v_ip1).
+    djx_def_i, djx_def_ip1, djx_dv_i, djx_dv_ip1 = djx
+    djy_def_i, djy_def_ip1, djy_dv_i, djy_dv_ip1 = djy
+
+    def_smN = - np.roll(djy_def_i, 1, axis=0) / dybar
+    dv_smN = - np.roll(djy_dv_i, 1, axis=0) / dybar
+
+    def_sm1 = - djx_def_i[:, :-1] / dxbar
+    dv_sm1 = - djx_dv_i[:, :-1] / dxbar
+
+    def_s = (djx_def_i[:, 1:] - djx_def_ip1[:, :-1]) / dxbar + \
+            (djy_def_i - np.roll(djy_def_ip1, 1, axis=0)) / dybar
+    dv_s = (djx_dv_i[:, 1:] - djx_dv_ip1[:, :-1]) / dxbar + \
+           (djy_dv_i - np.roll(djy_dv_ip1, 1, axis=0)) / dybar
+
+    def_sp1 = djx_def_ip1[:, 1:] / dxbar
+    dv_sp1 = djx_dv_ip1[:, 1:] / dxbar
+
+    def_spN = djy_def_ip1 / dybar
+    dv_spN = djy_dv_ip1 / dybar
+
+    return def_smN, dv_smN, def_sm1, dv_sm1, def_s, dv_s, \
+           def_sp1, dv_sp1, def_spN, dv_spN
+
+
+def getFandJ_2D(sys, v, efn, efp, veq, bsr=False, fields=False, workspace=None):
+    # Residual and Jacobian of the drift-diffusion-Poisson equations, see
+    # getFandJ.
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    ws = Workspace() if workspace is None else workspace
+    pattern = plan.jacobian_fields if fields else plan.jacobian
+    # values of the sparse Jacobian, in the order of the pattern
+    J = ws.assembler(pattern)
+
+    f, vec = _rows(sys, fields, ws, 'getFandJ')
+
+    # carrier densities
+    n, p = coeffs.densities(v, efn, efp, ws)
+
+    # equilibrium carrier densities
+    n_eq, p_eq = coeffs.equilibrium(veq)
+
+    # bulk charges and their derivatives
+    rho = np.subtract(sys.rho, n, out=ws.empty('rho', n.shape))
+    rho += p
+    drho_defn_s = np.negative(n, out=ws.empty('drho_defn', n.shape))
+    drho_defp_s = np.negative(p, out=ws.empty('drho_defp', n.shape))
+    drho_dv_s = np.subtract(drho_defn_s, p, out=ws.empty('drho_dv', n.shape))
+
+    # bulk recombination rates and their derivatives
+    r = get_bulk_rr(sys, n, p)
+    dr_defn_s, dr_defp_s, dr_dv_s = get_bulk_rr_derivs(sys, n, p)
+
+    # charge defects
+    if len(sys.defects_list) != 0:
+        defectsF(sys, sys.defects_list, n, p, rho, r)
+        defectsJ(sys, sys.defects_list, n, p, drho_dv_s, drho_defn_s, drho_defp_s, dr_defn_s, dr_defp_s, dr_dv_s)
+
+    lattice = _lattice(sys, plan, coeffs)
+    dx, dxm1, dy, dym1, dxbar, dybar, eps_m1x, eps_p1x, eps_m1y, eps_p1y = lattice
+    g, r = _grid(sys, sys.g)[_inner], _grid(sys, r)[_inner]
+    dr_defn, dr_defp, dr_dv = [_grid(sys, x)[_inner] for x in (dr_defn_s, dr_defp_s, dr_dv_s)]
+
+    # currents and their derivatives
+    vn, vp = _shifted_potentials(v, coeffs, ws)
+    (jnx, djnx), (jny, djny) = _currents(_jn_and_derivs, sys, _grid(sys, efn),
+                                         _grid(sys, vn), _grid(sys, sys.mu_e))
+    (jpx, djpx), (jpy, djpy) = _currents(_jp_and_derivs, sys, _grid(sys, efp),
+                                         _grid(sys, vp), _grid(sys, sys.mu_h))
+
+    ###########################################################################
+    #       inside the system: 0 < i < Nx-1 and 0 <= j <= Ny-1                #
+    ###########################################################################
+    # ------------------------------ fn ----------------------------------------
+    vec[:, 1:-1, 0] = (jnx[:, 1:] - jnx[:, :-1]) / dxbar \
+                      + (jny - np.roll(jny, 1, axis=0)) / dybar + g - r
+
+    defn_smN, dv_smN, defn_sm1, dv_sm1, defn_s, dv_s, defn_sp1, dv_sp1, \
+    defn_spN, dv_spN = _divergence_derivatives(djnx, djny, dxbar, dybar)
+
+    J.add((defn_smN, dv_smN, defn_sm1, dv_sm1, defn_s - dr_defn, - dr_defp,
+           dv_s - dr_dv, defn_sp1, dv_sp1, defn_spN, dv_spN))
+
+    # ------------------------------ fp ----------------------------------------
+    vec[:, 1:-1, 1] = (jpx[:, 1:] - jpx[:, :-1]) / dxbar \
+                      + (jpy - np.roll(jpy, 1, axis=0)) / dybar + r - g
+
+    defp_smN, dv_smN, defp_sm1, dv_sm1, defp_s, dv_s, defp_sp1, dv_sp1, \
+    defp_spN, dv_spN = _divergence_derivatives(djpx, djpy, dxbar, dybar)
+
+    J.add((defp_smN, dv_smN, defp_sm1, dv_sm1, dr_defn, defp_s + dr_defp,
+           dv_s + dr_dv, defp_sp1, dv_sp1, defp_spN, dv_spN))
+
+    # ------------------------------ fv ----------------------------------------
+    vec[:, 1:-1, 2] = _poisson(sys, v, lattice) - _grid(sys, rho)[_inner]
+
+    dvmN = -eps_m1y * 1. / (dym1 * dybar)
+    dvm1 = -eps_m1x * 1. / (dxm1 * dxbar)
+    dv = eps_m1x / (dxm1 * dxbar) + eps_p1x / (dx * dxbar) + eps_m1y / (dym1 * dybar) + eps_p1y / (dy * dybar) - \
+         _grid(sys, drho_dv_s)[_inner]
+    dvp1 = -eps_p1x * 1. / (dx * dxbar)
+    dvpN = -eps_p1y * 1. / (dy * dybar)
+    defn = - _grid(sys, drho_defn_s)[_inner]
+    defp = - _grid(sys, drho_defp_s)[_inner]
+
+    J.add((dvmN, dvm1, defn, defp, dv, dvp1, dvpN))
+
+    ###########################################################################
+    #                 left boundary: i = 0 and 0 <= j <= Ny-1                 #
+    ###########################################################################
+    n, p = _grid(sys, n), _grid(sys, p)
+    n_eq, p_eq = _grid(sys, n_eq), _grid(sys, p_eq)
+
+    # -------------------------- an, ap, av ------------------------------------
+    defn_s, defn_sp1, dv_s, dv_sp1 = [d[:, 0] for d in djnx]
+    vec[:, 0, 0] = jnx[:, 0] - sys.Scn[0] * (n[:, 0] - n_eq[:, 0])
+    J.add((defn_s - sys.Scn[0] * n[:, 0], dv_s - sys.Scn[0] * n[:, 0],
+           defn_sp1, dv_sp1))
+
+    defp_s, defp_sp1, dv_s, dv_sp1 = [d[:, 0] for d in djpx]
+    vec[:, 0, 1] = jpx[:, 0] + sys.Scp[0] * (p[:, 0] - p_eq[:, 0])
+    J.add((defp_s - sys.Scp[0] * p[:, 0], dv_s - sys.Scp[0] * p[:, 0],
+           defp_sp1, dv_sp1))
+
+    # Dirichlet BC
+    J.add((1,))
+
+    ###########################################################################
+    #               right boundary: i = Nx-1 and 0 <= j <= Ny-1               #
+    ###########################################################################
+    # -------------------------- bn, bp, bv ------------------------------------
+    defn_sm1, defn_s, dv_sm1, dv_s = [d[:, -1] for d in djnx]
+    vec[:, -1, 0] = jnx[:, -1] + sys.Scn[1] * (n[:, -1] - n_eq[:, -1])
+    J.add((defn_sm1, dv_sm1, defn_s + sys.Scn[1] * n[:, -1],
+           dv_s + sys.Scn[1] * n[:, -1]))
+
+    defp_sm1, defp_s, dv_sm1, dv_s = [d[:, -1] for d in djpx]
+    vec[:, -1, 1] = jpx[:, -1] - sys.Scp[1] * (p[:, -1] - p_eq[:, -1])
+    J.add((defp_sm1, dv_sm1, defp_s + sys.Scp[1] * p[:, -1],
+           dv_s + sys.Scp[1] * p[:, -1]))
+
+    # Dirichlet BC
+    J.add((1,))
+
+    if bsr:
+        return f.reshape(-1), pattern.bsr(J.data)
+    return f.reshape(-1), pattern.csr(J.data)
+
+
+def getFandJ_eq_2D(sys, v, efn=0, efp=0, contacts_bcs=None):
+    # Poisson equation for the electrostatic potential v, see getFandJ_eq.
+    if contacts_bcs is None:
+        contacts_bcs = sys.contacts_bcs
+
+    plan = get_plan(sys)
+    coeffs = get_coefficients(sys)
+    pattern = plan.jacobian_eq(contacts_bcs)
+    # values of the sparse Jacobian, in the order of the pattern
+    J = pattern.assembler()
+
+    # right hand side vector on the grid
+    vec = np.zeros((sys.ny, sys.nx))
+
+    # carrier densities
+    n = np.exp(efn + v + coeffs.vn)
+    p = np.exp(-efp - v - coeffs.vp)
+
+    # bulk charges
+    rho = sys.rho - n + p
+    drho_dv = -n - p
+
+    # charge defects
+    if len(sys.defects_list) != 0:
+        defectsF(sys, sys.defects_list, n, p, rho)
+        defectsJ(sys, sys.defects_list, n, p, drho_dv)
+
+    ###########################################################################
+    #       inside the system: 0 < i < Nx-1 and 0 <= j <= Ny-1                #
+    ###########################################################################
+    lattice = _lattice(sys, plan, coeffs)
+    dx, dxm1, dy, dym1, dxbar, dybar, eps_m1x, eps_p1x, eps_m1y, eps_p1y = lattice
+
+    vec[_inner] = _poisson(sys, v, lattice) - _grid(sys, rho)[_inner]
+
+    dvmN = -eps_m1y*1./(dym1 * dybar)
+    dvm1 = -eps_m1x*1./(dxm1 * dxbar)
+    dv = eps_m1x/(dxm1*dxbar) + eps_p1x/(dx*dxbar) + eps_m1y/(dym1*dybar) + eps_p1y/(dy*dybar) \
+         - _grid(sys, drho_dv)[_inner]
+    dvp1 = -eps_p1x*1./(dx * dxbar)
+    dvpN = -eps_p1y*1./(dy * dybar)
+
+    J.add((dvmN, dvm1, dv, dvp1, dvpN))
+
+    ###########################################################################
+    #                              contacts                                   #
+    ###########################################################################
+    v = _grid(sys, v)
+
+    if contacts_bcs[0] == "Neutral":
+        # no surface charges
+        vec[:, 0] = v[:, 1] - v[:, 0]
+        J.add((-1, 1))
+    else:
+        vec[:, 0] = 0
+        J.add((1,))
+
+    if contacts_bcs[1] == "Neutral":
+        # no surface charges
+        vec[:, -1] = v[:, -2] - v[:, -3]
+        J.add((-1, 1))
+    else:
+        vec[:, -1] = 0
+        J.add((1,))
+
+    return vec.reshape(-1), pattern.csr(J.data)
@@ -59,7 +59,8 @@ class SimulationWorker(QObject):
         system.contact_S(*Sc)
 
         # Create a Solver instance, I don't use the one already present
-        solver = Solver(use_mumps=useMumps)
+        solver = Solver(use_mumps=useMumps, iterative=iterative,
+                        iterative_tol=iterPrec)
 
         #===========================================================
         # Equilibrium potential
@@ -113,26 +114,22 @@ class SimulationWorker(QObject):
             else:
                 has_generation = False
 
-            if has_generation is True:
-                # Loop at zero bias with increasing defect density of states
-                if ramp >  0:
-                    self.logger.info("A generation rate is used with a non-zero ramp.")
-                system.g /= 10**ramp
-                for a in range(ramp):
-                    self.logger.info("Amplitude divided by {0}"\
-                                                .format(10**(ramp-a)))
-                    solution = solver.solve(system, 'all', solution,\
-                            tol, BCs, maxiter, True, htpy)
-                    system.g *= 10 # the last one will be computed as part of
-                                   # the voltage loop
-                    if solution is None:
-                        msg = "**  The calculations failed  **"
-                        self.logger.error(msg)
-                        self.simuDone.emit()
-                        return
-                    if self.abort:
-                        self.simuDone.emit()
-                        return
+            if has_generation is True and ramp > 0:
+                # Continuation at zero bias with increasing generation rate,
+                # starting from the amplitude divided by 10**ramp
+                self.logger.info("A generation rate is used with a non-zero ramp.")
+                solution = solver.generation_ramp(system, guess=solution,
+                                                  start=10.**-ramp, tol=tol,
+                                                  periodic_bcs=BCs, maxiter=maxiter,
+                                                  htp=htpy)[0]
+                if solution is None:
+                    msg = "**  The calculations failed  **"
+                    self.logger.error(msg)
+                    self.simuDone.emit()
+                    return
+                if self.abort:
+                    self.simuDone.emit()
+                    return
             
             # Loop over voltages
             # sites of the right contact
@@ -204,21 +201,19 @@ class SimulationWorker(QObject):
                     self.simuDone.emit()
                     return
 
-                system.g /= 10**ramp
-                for a in range(ramp+1):
-                    self.logger.info("Amplitude divided by {0}"\
-                                                .format(10**(ramp-a)))
-                    solution = solver.solve(system, 'all', solution, tol, BCs,
-                                            maxiter, True, htpy)
-                    system.g *= 10
-                    if solution is None:
-                        msg = "**  The calculations failed  **"
-                        self.logger.error(msg)
-                        self.simuDone.emit()
-                        return
-                    if self.abort:
-                        self.simuDone.emit()
-                        return
+                # continuation from the amplitude divided by 10**ramp
+                solution = solver.generation_ramp(system, guess=solution,
+                                                  start=10.**-ramp, tol=tol,
+                                                  periodic_bcs=BCs, maxiter=maxiter,
+                                                  htp=htpy)[0]
+                if solution is None:
+                    msg = "**  The calculations failed  **"
+                    self.logger.error(msg)
+                    self.simuDone.emit()
+                    return
+                if self.abort:
+                    self.simuDone.emit()
+                    return
  
                 if solution is not None:
                     name = simName + "_{0}".format(idx)
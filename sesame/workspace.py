@@ -0,0 +1,72 @@
+# Copyright 2017 University of Maryland.
+#
+# This file is part of Sesame. It is subject to the license terms in the file
+# LICENSE.rst found in the top-level directory of this distribution.
+
+import numpy as np
+
+
+class Workspace():
+    """
+    Buffers of the kernels, reused by the successive Newton-Raphson iterations
+    of a solve so that the arrays are only allocated at the first iteration.
+
+    The kernels request their buffers by name, and a buffer is allocated again
+    only when the requested shape changes. The residuals returned by a kernel
+    computed with a workspace are overwritten by the next call of that
+    kernel with the same workspace, the Jacobians are new matrices.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+        self._assemblers = {}
+
+    def empty(self, name, shape):
+        """
+        Return a buffer with uninitialized values.
+
+        Parameters
+        ----------
+        name: string
+            Name of the buffer.
+        shape: tuple of integers
+            Shape of the buffer.
+
+        Returns
+        -------
+        buffer: numpy array of floats
+        """
+        a = self._arrays.get(name)
+        if a is None or a.shape != shape:
+            a = np.empty(shape, dtype=np.float64)
+            self._arrays[name] = a
+        return a
+
+    def zeros(self, name, shape):
+        """
+        Return a buffer filled with zeros, see :meth:`empty`.
+        """
+        a = self.empty(name, shape)
+        a.fill(0)
+        return a
+
+    def assembler(self, pattern):
+        """
+        Return an empty Assembler for the values of the entries of a
+        sparsity pattern.
+
+        Parameters
+        ----------
+        pattern: Pattern
+            The sparsity pattern.
+
+        Returns
+        -------
+        J: Assembler
+        """
+        J = self._assemblers.get(id(pattern))
+        if J is None or J.data.size != pattern.size:
+            J = pattern.assembler()
+            self._assemblers[id(pattern)] = J
+        J.clear()
+        return J
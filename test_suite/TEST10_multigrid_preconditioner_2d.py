@@ -0,0 +1,46 @@
+import sesame
+import numpy as np
+import os, tempfile
+
+def system(nx=40, ny=30):
+    # homojunction with a grain boundary parallel to the junction
+    Lx = 3e-4
+    Ly = 3e-4
+    x = np.linspace(0, Lx, nx)
+    y = np.linspace(0, Ly, ny)
+
+    sys = sesame.Builder(x, y)
+
+    mat = {'Nc':8e17, 'Nv':1.8e19, 'Eg':1.5, 'epsilon':9.4, 'Et': 0,
+           'mu_e':320, 'mu_h':40, 'tau_e':1e-8, 'tau_h':1e-8}
+    sys.add_material(mat)
+
+    junction = .1e-4
+    sys.add_donor(1e17, lambda pos: pos[0] < junction)
+    sys.add_acceptor(1e15, lambda pos: pos[0] >= junction)
+
+    sys.contact_type('Ohmic', 'Ohmic')
+    sys.contact_S(1e7, 0, 0, 1e7)
+
+    p1, p2 = (.1e-4, 1.5e-4), (2.9e-4, 1.5e-4)
+    sys.add_defects([p1, p2], 1e14, 1e-14, E=0.4, transition=(1, 0))
+    sys.add_defects([p1, p2], 1e14, 1e-14, E=0.4, transition=(0, -1))
+
+    sys.generation(lambda x, y: 2.3e21*np.exp(-2.3e4*x))
+    return sys
+
+def runTest10():
+
+    # Newton steps solved by GMRES preconditioned with the multigrid V-cycle
+    voltages = [0, 0.3, 0.6]
+    # currents computed with the default (direct) solver [A/cm]
+    jref = np.array([3.906446291272e-06, 3.974075090077e-06, 3.875912915987e-06])
+
+    sys = system()
+    solver = sesame.solvers.Solver(iterative=True, preconditioner='multigrid')
+    with tempfile.TemporaryDirectory() as tmp:
+        j = solver.IVcurve(sys, voltages, os.path.join(tmp, 'TEST10'), verbose=False)
+    j = j * sys.scaling.current * sys.scaling.length
+
+    error = np.max(np.abs((jref-j)/jref))
+    print("error = {0}".format(error))
@@ -0,0 +1,27 @@
+import sesame
+import numpy as np
+import os, tempfile
+from TEST9_iterative_solver_1d import system_tutorial2
+
+def runTest11():
+
+    # Gummel iterations before the Newton-Raphson scheme on the tutorial 2
+    # device: the iterations that fail hand their input back to Newton
+    voltages = np.linspace(0, 0.8, 5)
+    # currents computed without Gummel iterations [A/cm^2]
+    jref = np.array([0.014868267333, 0.014779002904, 0.01464896418,
+                     0.01443192659, 0.012778356535])
+
+    options = [{'gummel': True},
+               {'gummel': True, 'banded': False},
+               {'gummel': True, 'anderson': 3}]
+
+    error = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for opts in options:
+            sys = system_tutorial2()
+            solver = sesame.solvers.Solver(**opts)
+            j = solver.IVcurve(sys, voltages, os.path.join(tmp, 'TEST11'), verbose=False)
+            j = j * sys.scaling.current
+            error = np.max([error, np.max(np.abs((jref-j)/jref))])
+    print("error = {0}".format(error))
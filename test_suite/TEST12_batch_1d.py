@@ -0,0 +1,56 @@
+import sesame
+import numpy as np
+
+def system(Nd):
+    # homojunction with a variable donor density
+    L = 3e-4
+    x = np.linspace(0, L, 200)
+
+    sys = sesame.Builder(x)
+
+    mat = {'Nc':8e17, 'Nv':1.8e19, 'Eg':1.5, 'epsilon':9.4, 'Et': 0,
+           'mu_e':320, 'mu_h':40, 'tau_e':1e-8, 'tau_h':1e-8}
+    sys.add_material(mat)
+
+    junction = .1e-4
+    sys.add_donor(Nd, lambda x: x < junction)
+    sys.add_acceptor(1e15, lambda x: x >= junction)
+
+    sys.contact_type('Ohmic', 'Ohmic')
+    sys.contact_S(1e7, 0, 0, 1e7)
+
+    sys.generation(lambda x: 2.3e21*np.exp(-2.3e4*x))
+    return sys
+
+def runTest12():
+
+    # batch of systems where the Jacobian of the second one is singular (no
+    # electrons in its initial guess): the other systems must converge to the
+    # solutions computed one at a time
+    Nds = [1e16, 1e17, 1e18]
+
+    single = []
+    for Nd in Nds:
+        sys = system(Nd)
+        solver = sesame.solvers.Solver()
+        eq = solver.solve(sys, compute='Poisson', verbose=False)
+        single.append(solver.solve(sys, guess=eq, verbose=False))
+
+    systems = [system(Nd) for Nd in Nds]
+    solver = sesame.solvers.Solver()
+    eq = solver.solve_batch(systems, compute='Poisson', verbose=False)
+    guess = [{'efn': np.zeros_like(s['v']), 'efp': np.zeros_like(s['v']), 'v': s['v']}
+             for s in eq]
+    guess[1]['efn'][:] = -1e4
+    solutions = solver.solve_batch(systems, guess=guess, verbose=False)
+
+    error = 0
+    if solutions[1] is not None:
+        error = np.nan
+    for b in (0, 2):
+        if solutions[b] is None:
+            error = np.nan
+            continue
+        for key in ('efn', 'efp', 'v'):
+            error = np.max([error, np.max(np.abs(solutions[b][key] - single[b][key]))])
+    print("error = {0}".format(error))
@@ -0,0 +1,26 @@
+import sesame
+import numpy as np
+import os, tempfile
+from TEST9_iterative_solver_1d import system_tutorial2
+
+def runTest13():
+
+    # IV curve of the tutorial 2 device with the series and shunt resistances
+    # of examples/tutorial2/1d_heterojunction_with_Rs_Rsh.py
+    Rs = 3      # [Ohm cm^2]
+    Rsh = 500   # [Ohm cm^2]
+    voltages = np.linspace(0, 0.8, 5)
+    # external currents j = J(V + Rs*j) - (V + Rs*j)/Rsh where J is the current
+    # of the device alone, computed with the default solver [A/cm^2]
+    jref = np.array([0.014762425915, 0.014269795801, 0.013731930816,
+                     0.013080711214, 0.009653484783])
+
+    sys = system_tutorial2()
+    solver = sesame.solvers.Solver()
+    with tempfile.TemporaryDirectory() as tmp:
+        j = solver.IVcurve(sys, voltages, os.path.join(tmp, 'TEST13'), verbose=False,
+                           Rs=Rs, Rsh=Rsh)
+    j = j * sys.scaling.current
+
+    error = np.max(np.abs((jref-j)/jref))
+    print("error = {0}".format(error))
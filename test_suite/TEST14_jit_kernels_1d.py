@@ -0,0 +1,53 @@
+import sesame
+import numpy as np
+from sesame import jit
+from sesame.observables import get_n, get_p, get_bulk_rr, get_bulk_rr_derivs,\
+                               get_jn_and_derivs, get_jp_and_derivs
+from TEST9_iterative_solver_1d import system_tutorial2
+
+def kernels(sys, efn, efp, v):
+    # currents, carrier densities and recombination with their derivatives
+    N = sys.nx
+    sites = np.arange(N)
+    sites_i, sites_ip1 = sites[:-1], sites[1:]
+    dl = sys.dx
+    n = get_n(sys, efn, v, sites)
+    p = get_p(sys, efp, v, sites)
+    jn, jn_derivs = get_jn_and_derivs(sys, efn, v, sites_i, sites_ip1, dl)
+    jp, jp_derivs = get_jp_and_derivs(sys, efp, v, sites_i, sites_ip1, dl)
+    return [n, p, get_bulk_rr(sys, n, p), *get_bulk_rr_derivs(sys, n, p),
+            jn, *jn_derivs, jp, *jp_derivs]
+
+def runTest14():
+
+    # kernels compiled with Numba against the NumPy kernels, on random
+    # quasi-Fermi levels and potentials (with equal values on some
+    # neighbouring sites, for the Taylor expansions of the currents)
+    if not jit.numba_available:
+        print("Numba is not installed, test skipped")
+        return
+
+    sys = system_tutorial2()
+    rng = np.random.RandomState(0)
+    N = sys.nx
+    efn = rng.uniform(-1, 1, N)
+    efp = rng.uniform(-1, 1, N)
+    v = rng.uniform(-40, 0, N)
+    efn[1::4] = efn[0::4][:len(efn[1::4])]
+    efp[1::4] = efp[0::4][:len(efp[1::4])]
+    v[2::4] = v[1::4][:len(v[2::4])]
+
+    enabled = jit.enabled
+    try:
+        jit.disable()
+        ref = kernels(sys, efn, efp, v)
+        jit.enable()
+        res = kernels(sys, efn, efp, v)
+    finally:
+        jit.enabled = enabled
+
+    error = 0
+    for a, b in zip(ref, res):
+        scale = np.maximum(np.abs(a), np.max(np.abs(a)) * 1e-12)
+        error = np.max([error, np.max(np.abs(a - b) / scale)])
+    print("error = {0}".format(error))
@@ -0,0 +1,32 @@
+import sesame
+import numpy as np
+import os, tempfile
+from sesame.solvers import Solver
+from TEST10_multigrid_preconditioner_2d import system
+
+def runTest15():
+
+    # options of the solver documented as supported in
+    # doc/reference/sesame.solvers.rst, against the default solver
+    voltages = [0, 0.3, 0.6]
+    options = [{'reuse_jacobian': True},
+               {'globalization': 'linesearch'},
+               {'structured': False},
+               {'bsr': True, 'iterative': True},
+               {'iterative': True, 'preconditioner': 'block_jacobi'},
+               {'layout': 'fields'},
+               {'equilibrium_solver': 'ldlt'},
+               {'equilibrium_solver': 'cg'},
+               {'equilibrium_solver': 'multigrid'},
+               {'layout': 'fields', 'iterative': True, 'preconditioner': 'multigrid'}]
+
+    error = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        sys = system(nx=30, ny=20)
+        jref = Solver().IVcurve(sys, voltages, os.path.join(tmp, 'TEST15'), verbose=False)
+        for opts in options:
+            sys = system(nx=30, ny=20)
+            solver = Solver(**opts)
+            j = solver.IVcurve(sys, voltages, os.path.join(tmp, 'TEST15'), verbose=False)
+            error = np.max([error, np.max(np.abs((jref-j)/jref))])
+    print("error = {0}".format(error))
@@ -0,0 +1,26 @@
+import sesame
+import numpy as np
+import os, tempfile
+from TEST9_iterative_solver_1d import system_tutorial2
+
+def runTest16():
+
+    # predictors of the continuation between the voltages of an IV curve, with
+    # steps of 0.2 V that the Newton-Raphson scheme alone does not take up to
+    # 0.8 V
+    voltages = np.linspace(0, 0.8, 5)
+    # currents computed with the default solver and voltage steps of 0.1 V
+    # [A/cm^2]
+    jref = np.array([0.014868267333, 0.014779002904, 0.01464896418,
+                     0.01443192659, 0.012778356535])
+
+    error = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for predictor in ('secant', 'tangent', 'none'):
+            sys = system_tutorial2()
+            solver = sesame.solvers.Solver()
+            j = solver.IVcurve(sys, voltages, os.path.join(tmp, 'TEST16'), verbose=False,
+                               predictor=predictor)
+            j = j * sys.scaling.current
+            error = np.max([error, np.max(np.abs((jref-j)/jref))])
+    print("error = {0}".format(error))
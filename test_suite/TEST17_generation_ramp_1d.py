@@ -0,0 +1,25 @@
+import sesame
+import numpy as np
+from TEST9_iterative_solver_1d import system_tutorial2
+
+def runTest17():
+
+    # continuation on the intensity of the generation rate, from 1e-6 times
+    # the generation rate of the system
+    scales = [0.01, 0.1, 1]
+    # short circuit currents of the device with its generation rate scaled,
+    # each solved directly with the default solver [A/cm^2]
+    jref = np.array([0.000148588520884, 0.00148637938965, 0.0148682673324])
+
+    sys = system_tutorial2()
+    solver = sesame.solvers.Solver()
+    solutions = solver.generation_ramp(sys, scales=scales, verbose=False)
+
+    error = 0
+    for solution, ref in zip(solutions, jref):
+        if solution is None:
+            error = np.nan
+            continue
+        j = sesame.Analyzer(sys, solution).full_current() * sys.scaling.current
+        error = np.max([error, np.abs((ref-j)/ref)])
+    print("error = {0}".format(error))
@@ -0,0 +1,49 @@
+import sesame
+import numpy as np
+from TEST9_iterative_solver_1d import system_tutorial2
+
+def system_pn():
+    # homojunction with the p region on the left, where the short circuit
+    # current is negative
+    L = 3e-4
+    x = np.linspace(0, L, 300)
+
+    sys = sesame.Builder(x)
+
+    mat = {'Nc':8e17, 'Nv':1.8e19, 'Eg':1.5, 'epsilon':9.4, 'Et': 0,
+           'mu_e':320, 'mu_h':40, 'tau_e':1e-8, 'tau_h':1e-8}
+    sys.add_material(mat)
+
+    junction = .1e-4
+    sys.add_acceptor(1e17, lambda x: x < junction)
+    sys.add_donor(1e15, lambda x: x >= junction)
+
+    sys.contact_type('Ohmic', 'Ohmic')
+    sys.contact_S(1e7, 1e7, 1e7, 1e7)
+
+    sys.generation(lambda x: 2.3e21*np.exp(-2.3e4*x))
+    return sys
+
+def runTest18():
+
+    # short circuit current, open circuit voltage and fill factor located with
+    # an accuracy of 1 mV on the voltages, for both signs of the short circuit
+    # current
+
+    # reference values interpolated from IV curves with steps of 5 mV
+    # computed with the default solver
+    refs = [(system_tutorial2, {'Jsc': 0.0148682673324,   # [A/cm^2]
+                                'Voc': 0.89031246,        # [V]
+                                'FF': 0.78645723}),
+            (system_pn, {'Jsc': -0.0141844865001,
+                         'Voc': 0.91409816,
+                         'FF': 0.7799832})]
+
+    error = 0
+    for system, ref in refs:
+        sys = system()
+        solver = sesame.solvers.Solver()
+        fom = solver.figures_of_merit(sys, vtol=1e-3, verbose=False)
+        fom['Jsc'] = fom['Jsc'] * sys.scaling.current
+        error = np.max([error] + [np.abs((ref[k] - fom[k]) / ref[k]) for k in ref])
+    print("error = {0}".format(error))
@@ -0,0 +1,66 @@
+import sesame
+import numpy as np
+import os, tempfile
+
+def system_tutorial2():
+    # CdS/CdTe heterojunction of examples/tutorial2
+    t1 = 25*1e-7    # thickness of CdS
+    t2 = 4*1e-4     # thickness of CdTe
+
+    dd = 1e-7
+    x = np.concatenate((np.linspace(0, dd, 10, endpoint=False),
+                        np.linspace(dd, t1-dd, 50, endpoint=False),
+                        np.linspace(t1 - dd, t1 + dd, 10, endpoint=False),
+                        np.linspace(t1 + dd, (t1+t2) - dd, 100, endpoint=False),
+                        np.linspace((t1+t2) - dd, (t1+t2), 10)))
+
+    sys = sesame.Builder(x)
+
+    CdS = {'Nc': 2.2e18, 'Nv':1.8e19, 'Eg':2.4, 'epsilon':10, 'Et': 0,
+            'mu_e':100, 'mu_h':25, 'tau_e':1e-8, 'tau_h':1e-13,
+            'affinity': 4.}
+    CdTe = {'Nc': 8e17, 'Nv': 1.8e19, 'Eg':1.5, 'epsilon':9.4, 'Et': 0,
+            'mu_e':320, 'mu_h':40, 'tau_e':5e-9, 'tau_h':5e-9,
+            'affinity': 3.9}
+
+    CdS_region = lambda x: x<=t1
+    CdTe_region = lambda x: x>t1
+
+    sys.add_material(CdS, CdS_region)
+    sys.add_material(CdTe, CdTe_region)
+    sys.add_donor(1e17, CdS_region)
+    sys.add_acceptor(1e15, CdTe_region)
+
+    sys.contact_type('Ohmic', 'Schottky', 0, 5.0)
+    Scontact = 1.16e7
+    sys.contact_S(Scontact, Scontact, Scontact, Scontact)
+
+    phi0 = 1e17     # incoming flux [1/(cm^2 sec)]
+    alpha = 2.3e4   # absorbtion coefficient [1/cm]
+    f = lambda x: phi0*alpha*np.exp(-x*alpha)
+    sys.generation(f)
+    return sys
+
+def runTest9():
+
+    # Krylov solvers of the Newton steps on the tutorial 2 device: with the
+    # default ILU preconditioner some steps are meaningless and must be
+    # solved again with the direct solver
+    voltages = np.linspace(0, 0.8, 5)
+    # currents computed with the default (direct) solver [A/cm^2]
+    jref = np.array([0.014868267333, 0.014779002904, 0.01464896418,
+                     0.01443192659, 0.012778356535])
+
+    options = [{'iterative': True, 'banded': False},
+               {'iterative': True, 'banded': False, 'iterative_method': 'bicgstab'},
+               {'iterative': True, 'banded': False, 'forcing': False}]
+
+    error = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for opts in options:
+            sys = system_tutorial2()
+            solver = sesame.solvers.Solver(**opts)
+            j = solver.IVcurve(sys, voltages, os.path.join(tmp, 'TEST9'), verbose=False)
+            j = j * sys.scaling.current
+            error = np.max([error, np.max(np.abs((jref-j)/jref))])
+    print("error = {0}".format(error))
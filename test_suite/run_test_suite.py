@@ -6,6 +6,16 @@ from TEST5_variable_epsilon_2d_abrupt import runTest5
 from TEST6_variable_epsilon_2d_periodic import runTest6
 from TEST7_variable_gap_2d_pillars_abrupt import runTest7
 from TEST8_variable_gap_2d_pillars_periodic import runTest8
+from TEST9_iterative_solver_1d import runTest9
+from TEST10_multigrid_preconditioner_2d import runTest10
+from TEST11_gummel_1d import runTest11
+from TEST12_batch_1d import runTest12
+from TEST13_series_shunt_resistances_1d import runTest13
+from TEST14_jit_kernels_1d import runTest14
+from TEST15_solver_options_2d import runTest15
+from TEST16_predictor_1d import runTest16
+from TEST17_generation_ramp_1d import runTest17
+from TEST18_figures_of_merit_1d import runTest18
 
 
 print("\nrunning test suite: error should be less than 0.01 for all sims")
@@ -34,3 +44,33 @@ runTest7()
 
 print("\nrunning test 8: 2d variable electronic structure periodic b.c.")
 runTest8()
+
+print("\nrunning test 9: 1d Krylov solvers of the Newton steps")
+runTest9()
+
+print("\nrunning test 10: 2d GMRES with the multigrid preconditioner")
+runTest10()
+
+print("\nrunning test 11: 1d Gummel iterations before Newton")
+runTest11()
+
+print("\nrunning test 12: 1d batch with a singular system")
+runTest12()
+
+print("\nrunning test 13: 1d series and shunt resistances")
+runTest13()
+
+print("\nrunning test 14: Numba kernels against the NumPy kernels")
+runTest14()
+
+print("\nrunning test 15: 2d options of the solver")
+runTest15()
+
+print("\nrunning test 16: 1d predictors of the IV curve continuation")
+runTest16()
+
+print("\nrunning test 17: 1d continuation on the generation rate")
+runTest17()
+
+print("\nrunning test 18: 1d figures of merit")
+runTest18()